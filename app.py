@@ -1,69 +1,192 @@
 # app.py
+import os
+import time
+from concurrent.futures import as_completed
+from datetime import timedelta
+
 import streamlit as st
-import pandas as pd
+from cohorts import COHORT_PERIODS
+from compute_cache import cached, compute_cache, file_fingerprint
+from cube import EventCube, load_event_cube
+from filters import filter_fingerprint
+from live import live_ingest
+from loader import load_events
+from partitions import DailyPartitionStore
+from profiling import RunProfile
+from render_cache import figure_cache, show_figure
+from report import Report, report_directory
+from sampling import DEFAULT_SAMPLE_RATE, sample_fingerprint, sample_users
 from services import calculate_funnel_user_counts, compute_avg_time_by_average_user, plot_avg_time_by_user, \
     plot_heatmap_avg_time_by_user, plot_time_spent_by_users, prepare_data_for_pivot, \
-    plot_average_duration_with_trendlines, plot_common_user_journeys, show_exit_rates, \
-    plot_interactions_before_exit, plot_daily_interactions, plot_interactions_heatmap, \
-    plot_exit_pages_bar_chart, plot_exit_rate_over_time, show_top_user_paths, show_average_duration_by_page, \
-    calculate_and_display_bounce_rates, plot_daily_bounce_rates, show_loyal_users
-
-# Load dataset (for illustration purposes)
-data = pd.read_csv('data/data_set_da_test.csv')
-
-# Call the function to get funnel data
-funnel_data = calculate_funnel_user_counts(data)
-
-# Compute the average duration across all users by page_type
-avg_time_by_user = compute_avg_time_by_average_user(data)
-
-st.title('User Funnel Analysis')
-st.write("Hello, this app was designed to showcase some of the visuals that have been made as part of"
-         "the data analysis part! This app is the demo version. The graphics and chars are customizable and can be "
-         "executed with rich UI components like selectors, dropdowns, etc. For demo purposes, the app is limited to "
-         "basic functionality. Existing BI platforms were skipped as there might not be an optimal solution for some "
-         "visualizations or underlining circumstances.")
-
-notebook_url = "https://colab.research.google.com/drive/1z1rNEBoSbl1Zr9nZglCUHQ8usGGSRVGB?usp=sharing"
-st.markdown(f"""
-    <div style="background-color: #f0f2f6; padding: 10px; border-radius: 5px;">
-        <p style="font-size: 16px;">This app is a demo version. For more detailed analysis, check out the 
-        <a href="{notebook_url}" target="_blank" style="color: #2585a6; font-weight: bold;">original notebook</a>.</p>
-    </div>
-    """, unsafe_allow_html=True)
-
-st.table(funnel_data)
-
-st.header('Average Time on Page', divider='rainbow')
-# st.table(avg_time_by_user.reset_index().rename(columns={0: 'Average Duration (minutes)'}))
-# Plot the avt duration per page
-plot_avg_time_by_user(avg_time_by_user)
-
-avg_time_by_user = avg_time_by_user.rename(columns={0: 'duration'})
-avg_time_by_user['event_day'] = pd.to_datetime(avg_time_by_user['event_day'])
-# Removing the remove the time part
-avg_time_by_user['event_day'] = avg_time_by_user['event_day'].dt.date
-plot_heatmap_avg_time_by_user(avg_time_by_user)
-
-# Display where users spent the most time
-plot_time_spent_by_users(avg_time_by_user)
-
-st.subheader(':blue[Trendlines]')
-avg_duration_df = prepare_data_for_pivot(avg_time_by_user)
-fig_trendlines = plot_average_duration_with_trendlines(avg_duration_df)
-st.pyplot(fig_trendlines)
-
-st.subheader(':blue[User Journeys]')
-st.write('This would require a more detailed dataset with sequence data. However, for a rudimentary view we can build \
-        some daemo viz')
-fig_user_journeys = plot_common_user_journeys(data)
-st.pyplot(fig_user_journeys)
-
-st.header('Exit Rate', divider='rainbow')
-st.write('Exit Rate metric provides insights into the percentage of users who leave the site from a specific page.')
-show_exit_rates(data)
-
-markdown_content = """
+    plot_average_duration_with_trendlines, compute_common_user_journeys, plot_common_user_journeys, \
+    build_session_summary, compute_exit_rates, show_exit_rates, compute_products_added_before_exit, \
+    plot_interactions_before_exit, plot_daily_interactions, plot_interactions_heatmap, plot_exit_pages_bar_chart, \
+    compute_exit_rate_over_time, plot_exit_rate_over_time, compute_top_user_paths, show_top_user_paths, \
+    compute_average_duration_by_page, show_average_duration_by_page, compute_bounce_rates, show_bounce_rates, \
+    compute_daily_bounce_rates, plot_daily_bounce_rates, compute_loyal_users, show_loyal_users, \
+    compute_duration_trendlines, show_run_profile, compute_cohort_retention, plot_cohort_retention, \
+    compute_ordered_funnel
+from snapshot import load_shared_dataset
+from sqlstore import SQL_METRICS, SQLiteEventStore
+from trends import TREND_METHODS
+from warmup import in_background, warm_up
+
+DATA_PATH = 'data/data_set_da_test.csv'
+
+# Optional daily partition store kept up to date by partitions.py; time-series charts read from it when set
+PARTITION_STORE = os.environ.get('AUTODOC_PARTITION_STORE')
+
+# Optional report root written by report.py; when set, metrics are read from its latest report and no events
+# are loaded at all
+REPORT_ROOT = os.environ.get('AUTODOC_REPORT')
+
+# Optional JSONL file or directory of arriving events; when set, the dashboard shows running aggregates of it,
+# refreshed every LIVE_REFRESH_SECONDS, instead of the static dataset
+LIVE_PATH = os.environ.get('AUTODOC_LIVE')
+LIVE_REFRESH_SECONDS = float(os.environ.get('AUTODOC_LIVE_REFRESH_SECONDS', 2))
+
+# Every result below is cached per dataset (or report) fingerprint, so a rerun with unchanged input only renders.
+# Sidebar filters narrow the events; fingerprint then identifies the filtered view, dataset_fingerprint the file
+if LIVE_PATH:
+    dataset_fingerprint = None
+    report = None
+elif REPORT_ROOT:
+    report_manifest = os.path.join(report_directory(REPORT_ROOT), 'manifest.json')
+    dataset_fingerprint = file_fingerprint(report_manifest)
+    report = cached(dataset_fingerprint, Report, os.path.dirname(report_manifest))
+else:
+    dataset_fingerprint = file_fingerprint(DATA_PATH)
+    report = None
+fingerprint = dataset_fingerprint
+filters = {}
+
+# Optional user sample: events() then returns the events of a deterministic share of users, and the tables that
+# support it show estimates scaled to all users with their error bounds (sample_options are passed to them)
+sample_rate = None
+sample_options = {}
+
+# Optional HyperLogLog distinct counts for the funnel and the bounce rates, with their error bounds
+# (approximate_options are passed to them). Only offered without a sample, whose results are estimates already
+approximate_options = {}
+
+# Optional SQLite database loaded by sqlstore.py; when set, the session metrics it supports are computed by the
+# database instead of from events held in memory
+SQLITE_PATH = os.environ.get('AUTODOC_SQLITE')
+sql_store = SQLiteEventStore(SQLITE_PATH) if SQLITE_PATH and report is None else None
+
+# Sample rates offered in the sidebar, by label
+SAMPLE_RATES = {f'{rate * 100:g}%': rate for rate in sorted({0.01, 0.02, 0.05, 0.1, 0.2, 0.5, DEFAULT_SAMPLE_RATE})}
+
+# Filterable columns of the event index and their sidebar labels
+FILTER_LABELS = {
+    'page_type': 'Page types',
+    'event_type': 'Event types',
+    'segment': 'User segments',
+}
+
+# Time, CPU and memory of every step of this run, shown in the sidebar on request and exported at the end
+profile = RunProfile()
+
+
+def measured(fingerprint, func, *args, **kwargs):
+    # A cached computation, recorded with whether it was served from the cache. Steps of warm-up jobs are not
+    # recorded: they run alongside any number of script runs, and each job is recorded as a whole instead
+    if in_background():
+        return cached(fingerprint, func, *args, **kwargs)
+    hits = compute_cache.hits
+    kind = 'load' if func in (load_events, load_shared_dataset) else 'compute'
+    with profile.measure(func.__qualname__, kind) as record:
+        result = cached(fingerprint, func, *args, **kwargs)
+        record['cached'] = compute_cache.hits > hits
+    return result
+
+
+def render_figure(fingerprint, draw, *args, **kwargs):
+    # A chart sent from the figure cache; a miss includes drawing it with matplotlib
+    hits = figure_cache.hits
+    with profile.measure(draw.__qualname__, 'render') as record:
+        show_figure(fingerprint, draw, *args, **kwargs)
+        record['cached'] = figure_cache.hits > hits
+
+
+def render(show, *args):
+    with profile.measure(show.__qualname__, 'render'):
+        show(*args)
+
+
+def metric(name, func, *inputs, **options):
+    # A metric from the report when one is configured, otherwise computed and cached.
+    # inputs are functions returning func's arguments, so they are only loaded or computed when needed;
+    # options are passed to func as they are
+    if report is not None:
+        with profile.measure(name, 'load'):
+            return report[name]
+    if sql_store is not None and whole_dataset() and func.__name__ in SQL_METRICS:
+        return measured(file_fingerprint(SQLITE_PATH), getattr(sql_store, func.__name__))
+    return measured(fingerprint, func, *[get() for get in inputs], **options)
+
+
+def whole_dataset():
+    # Whether events() are every event of the file, so results precomputed for the file apply
+    return not filters and sample_rate is None
+
+
+def shared_dataset():
+    # Load dataset (for illustration purposes), sorted by time, indexed once for filtering and summarised by
+    # session, from the snapshot every session and server process on this host maps
+    return measured(dataset_fingerprint, load_shared_dataset, DATA_PATH)
+
+
+def event_index():
+    return shared_dataset().index
+
+
+def events():
+    # All events, or the cached filtered view of them, or the cached sample of its users
+    index = event_index()
+    data = measured(filtered_fingerprint, index.filter, **filters) if filters else index.data
+    if sample_rate is None:
+        return data
+    return measured(fingerprint, sample_users, data, sample_rate)
+
+
+def sidebar_filters(index):
+    # Filter widgets; returns the arguments of EventIndex.filter, empty while nothing is filtered
+    st.sidebar.header('Filters')
+    first, last = (day.date() for day in index.date_range())
+    dates = st.sidebar.date_input('Event dates', value=(first, last), min_value=first, max_value=last)
+    chosen = {}
+    if len(dates) > 0 and dates[0] != first:
+        chosen['start'] = dates[0]
+    if len(dates) > 1 and dates[1] != last:
+        # The range picker is inclusive, the index range is not
+        chosen['end'] = dates[1] + timedelta(days=1)
+    for column, label in FILTER_LABELS.items():
+        values = st.sidebar.multiselect(label, index.values(column))
+        if values:
+            chosen[column] = tuple(values)
+    return chosen
+
+
+def sidebar_sampling():
+    # Sampling widgets; returns the sample rate, or None while every user is included
+    st.sidebar.header('Sampling')
+    if not st.sidebar.toggle('Estimate from a sample of users'):
+        return None
+    label = st.sidebar.select_slider('Share of users', list(SAMPLE_RATES), value=f'{DEFAULT_SAMPLE_RATE * 100:g}%')
+    return SAMPLE_RATES[label]
+
+
+def sidebar_approximation():
+    # Approximation widget; returns the options of the metrics that can count distinct users and sessions with
+    # HyperLogLog sketches, empty while they are counted exactly
+    if not st.sidebar.toggle('Approximate distinct counts'):
+        return {}
+    return {'approximate': True}
+
+
+# Interpretation of the results on the full dataset, shown under the matching tables
+EXIT_RATE_NOTES = """
     **Let's interpret the outcomes of the exit rates for each page:**
 
     1. **Listing Page (68.26%)**: - For approximately 68.26% of the visits to the listing page, users exit the 
@@ -99,48 +222,8 @@ markdown_content = """
     Exit rates are important as they provide insights into potential areas of friction or user dissatisfaction on 
     different pages. By addressing the issues on pages with high exit rates, businesses can enhance user experience 
     and potentially increase conversions."""
-st.markdown(markdown_content)
-
-st.subheader(':blue[Histogram of Products]')
-st.write('This will show the distribution of products added to the cart. The most frequently added products will '
-         'stand out, indicating their popularity.')
-plot_interactions_before_exit(data)
-
-st.subheader(':blue[Time Series Analysis]')
-st.write('We can plot the number of "add to cart" actions over time (e.g., by day or hour) to identify any patterns '
-         'or trends. This can show if there are specific times when users are more active or if there are dips that '
-         'need attention.')
-plot_daily_interactions(data)
-
-st.subheader(':blue[Heatmap of Add-to-Cart Actions by Day of Week and Hour]')
-st.write('This will help visualize if there are specific times of the day or specific days of the week when users are '
-         'more likely to add items to their cart.')
-plot_interactions_heatmap(data)
-
-st.subheader(':blue[Exit Page Distribution]')
-st.write('A bar chart to show the distribution of exit pages. This helps to identify which pages are most frequently '
-         'the last page users visit.')
-plot_exit_pages_bar_chart(data)
-
-st.subheader(':blue[Exit Rate Over Time]')
-st.write('Observe if there are specific days or time periods when the exit rate spikes. This might correlate with '
-         'website changes, marketing campaigns, or external factors.')
-plot_exit_rate_over_time(data)
-
-# Page Interactions
-st.header('Page Interactions', divider='rainbow')
-st.subheader(':blue[Count of common paths]')
-show_top_user_paths(data)
-
-# Average Session Duration
-st.header('Average Session Duration', divider='rainbow')
-st.subheader(':blue[Content Relevance]')
-st.write('To gauge content relevance, well analyze the average session duration based on the page_type. This will '
-         'give insights into which sections of the platform users spend the most time on, indicating content '
-         'relevance and engagement.')
-show_average_duration_by_page(data)
-
-markdown_content = """The table above showcases the average duration (in seconds) that users spend on different types 
+
+SESSION_DURATION_NOTES = """The table above showcases the average duration (in seconds) that users spend on different types 
 of pages on the platform. Let's break down the outcome:
 
 1. **Listing Page (`listing_page`):** - Average Duration: Approximately 312.53 seconds (or about 5.21 minutes) - 
@@ -177,13 +260,8 @@ challenges or obstacles users might be facing on pages with longer durations.
 
 In essence, these insights can guide optimizations to make the user journey smoother and potentially increase 
 conversions."""
-st.markdown(markdown_content)
 
-# Bounce Rate
-st.header('Bounce Rate', divider='rainbow')
-st.subheader(':blue[Page-Specific Bounce Rates]')
-calculate_and_display_bounce_rates(data)
-markdown_content = """
+BOUNCE_RATE_NOTES = """
 **Detailed Breakdown:**
 
 1. **Listing Page**: - Total Sessions: 180,930 - Bounced Sessions: 138,601 - Bounce Rate: 76.60% - 
@@ -215,12 +293,370 @@ users are generally finding relevant products after searching.
 
 Understanding these bounce rates can help in optimizing the user journey, enhancing content, and ensuring users find 
 what they are looking for, ultimately leading to better conversions."""
-st.markdown(markdown_content)
 
-st.subheader(':blue[bounce rate for each page type]')
-plot_daily_bounce_rates(data)
 
-# Revisit Rate
-st.header('Revisit Rate', divider='rainbow')
-st.subheader(':blue[Most loyal users based on the Revisit rate]')
-show_loyal_users(data)
+def session_summary():
+    # Summarise every session once; exit, bounce and duration metrics all read from it
+    if whole_dataset():
+        return shared_dataset().sessions
+    return measured(fingerprint, build_session_summary, events())
+
+
+def event_cube():
+    # Event counts by day, hour, page type and event type; the count-based charts are roll-ups of it.
+    # The persisted cube covers the whole file and is read without loading the events: filters on its dimensions
+    # slice it, while a user segment or a sample gets a cube of its own
+    if sample_rate is not None or filters.get('segment'):
+        return measured(fingerprint, EventCube.build, events())
+    cube = measured(dataset_fingerprint, load_event_cube, DATA_PATH)
+    if not filters:
+        return cube
+    return measured(fingerprint, cube.filter, **filters)
+
+
+def page_type_counts():
+    # Events per page type, rolled up from the cube
+    return metric('page_type_counts', EventCube.page_type_counts, event_cube)
+
+
+def daily_series(store_method, compute):
+    # A per-day series from the partition store when configured, otherwise computed from the events.
+    # Returned with the fingerprint it is cached under, which also keys its charts. The store is not filtered
+    if PARTITION_STORE and whole_dataset():
+        store = DailyPartitionStore(PARTITION_STORE)
+        store_fingerprint = file_fingerprint(os.path.join(PARTITION_STORE, 'manifest.json'))
+        return store_fingerprint, measured(store_fingerprint, getattr(store, store_method))
+    return fingerprint, compute()
+
+
+# Results shown by the sections, with the options of their widgets' defaults. Each is a function so it can be
+# started on the warm-up threads as well as called by its section
+
+def average_time_by_user():
+    return daily_series(
+        'avg_time_by_average_user', lambda: metric('avg_time_by_user', compute_avg_time_by_average_user, events))
+
+
+def common_user_journeys():
+    return metric('common_user_journeys', compute_common_user_journeys, events)
+
+
+def exit_rates():
+    return metric('exit_rates', compute_exit_rates, events, session_summary, page_type_counts, **sample_options)
+
+
+def products_added_before_exit():
+    return metric('products_added_before_exit', compute_products_added_before_exit, events)
+
+
+def daily_interaction_counts():
+    return daily_series(
+        'daily_interactions', lambda: metric('daily_interactions', EventCube.daily_interactions, event_cube))
+
+
+def interactions_heatmap():
+    return metric('interactions_heatmap', EventCube.interactions_heatmap, event_cube)
+
+
+def exit_rate_by_day():
+    return daily_series(
+        'exit_rate_over_time',
+        lambda: metric('exit_rate_over_time', compute_exit_rate_over_time, events, session_summary))
+
+
+def top_user_paths():
+    return metric('top_user_paths', compute_top_user_paths, events, **sample_options)
+
+
+def average_duration_by_page():
+    return metric('average_duration_by_page', compute_average_duration_by_page, events, **sample_options)
+
+
+def bounce_rates():
+    return metric('bounce_rates', compute_bounce_rates, events, session_summary, **sample_options,
+                  **approximate_options)
+
+
+def daily_page_bounce_rates():
+    return daily_series(
+        'daily_bounce_rates', lambda: metric('daily_bounce_rates', compute_daily_bounce_rates, events, session_summary,
+                                             **approximate_options))
+
+
+def loyal_users():
+    return metric('loyal_users', compute_loyal_users, events)
+
+
+def cohort_retention(period=next(iter(COHORT_PERIODS))):
+    return metric(f'cohort_retention_{period}', compute_cohort_retention, events, period=period)
+
+
+def average_time_section():
+    st.header('Average Time on Page', divider='rainbow')
+    avg_fingerprint, avg_time_by_user = average_time_by_user()
+
+    # st.table(avg_time_by_user.reset_index().rename(columns={0: 'Average Duration (minutes)'}))
+    # Plot the avt duration per page
+    render_figure(avg_fingerprint, plot_avg_time_by_user, avg_time_by_user)
+
+    avg_time_by_user = avg_time_by_user.rename(columns={0: 'duration'})
+    render_figure(avg_fingerprint, plot_heatmap_avg_time_by_user, avg_time_by_user)
+
+    # Display where users spent the most time
+    render_figure(avg_fingerprint, plot_time_spent_by_users, avg_time_by_user)
+
+    st.subheader(':blue[Trendlines]')
+    avg_duration_df = prepare_data_for_pivot(avg_time_by_user)
+    method = st.radio('Trend', TREND_METHODS, horizontal=True)
+    if method == 'polynomial':
+        trend_options = {'method': method, 'order': st.slider('Polynomial order', 1, 5, 3)}
+    else:
+        trend_options = {'method': method, 'window': st.slider('Window (days)', 3, 15, 7, step=2)}
+    trendlines = measured(avg_fingerprint, compute_duration_trendlines, avg_duration_df, **trend_options)
+    render_figure(avg_fingerprint, plot_average_duration_with_trendlines, avg_duration_df, trendlines,
+                  **trend_options)
+
+    st.subheader(':blue[User Journeys]')
+    st.write('This would require a more detailed dataset with sequence data. However, for a rudimentary view we can '
+             'build some daemo viz')
+    render_figure(fingerprint, plot_common_user_journeys, common_user_journeys())
+
+
+def exit_rate_section():
+    st.header('Exit Rate', divider='rainbow')
+    st.write('Exit Rate metric provides insights into the percentage of users who leave the site from a specific '
+             'page.')
+    render(show_exit_rates, exit_rates())
+
+    st.markdown(EXIT_RATE_NOTES)
+
+    st.subheader(':blue[Histogram of Products]')
+    st.write('This will show the distribution of products added to the cart. The most frequently added products '
+             'will stand out, indicating their popularity.')
+    render_figure(fingerprint, plot_interactions_before_exit, products_added_before_exit())
+
+    st.subheader(':blue[Time Series Analysis]')
+    st.write('We can plot the number of "add to cart" actions over time (e.g., by day or hour) to identify any '
+             'patterns or trends. This can show if there are specific times when users are more active or if there '
+             'are dips that need attention.')
+    daily_fingerprint, daily_interactions = daily_interaction_counts()
+    render_figure(daily_fingerprint, plot_daily_interactions, daily_interactions)
+
+    st.subheader(':blue[Heatmap of Add-to-Cart Actions by Day of Week and Hour]')
+    st.write('This will help visualize if there are specific times of the day or specific days of the week when '
+             'users are more likely to add items to their cart.')
+    render_figure(fingerprint, plot_interactions_heatmap, interactions_heatmap())
+
+    st.subheader(':blue[Exit Page Distribution]')
+    st.write('A bar chart to show the distribution of exit pages. This helps to identify which pages are most '
+             'frequently the last page users visit.')
+    render_figure(fingerprint, plot_exit_pages_bar_chart, page_type_counts())
+
+    st.subheader(':blue[Exit Rate Over Time]')
+    st.write('Observe if there are specific days or time periods when the exit rate spikes. This might correlate '
+             'with website changes, marketing campaigns, or external factors.')
+    rate_fingerprint, exit_rates_by_day = exit_rate_by_day()
+    render_figure(rate_fingerprint, plot_exit_rate_over_time, exit_rates_by_day)
+
+
+def page_interactions_section():
+    st.header('Page Interactions', divider='rainbow')
+    st.subheader(':blue[Count of common paths]')
+    render(show_top_user_paths, top_user_paths())
+
+
+def session_duration_section():
+    st.header('Average Session Duration', divider='rainbow')
+    st.subheader(':blue[Content Relevance]')
+    st.write('To gauge content relevance, well analyze the average session duration based on the page_type. This '
+             'will give insights into which sections of the platform users spend the most time on, indicating '
+             'content relevance and engagement.')
+    render(show_average_duration_by_page, average_duration_by_page())
+
+    st.markdown(SESSION_DURATION_NOTES)
+
+
+def bounce_rate_section():
+    st.header('Bounce Rate', divider='rainbow')
+    st.subheader(':blue[Page-Specific Bounce Rates]')
+    render(show_bounce_rates, bounce_rates())
+    st.markdown(BOUNCE_RATE_NOTES)
+
+    st.subheader(':blue[bounce rate for each page type]')
+    bounce_fingerprint, page_bounce_rates_by_day = daily_page_bounce_rates()
+    render_figure(bounce_fingerprint, plot_daily_bounce_rates, page_bounce_rates_by_day)
+
+
+def revisit_rate_section():
+    st.header('Revisit Rate', divider='rainbow')
+    st.subheader(':blue[Most loyal users based on the Revisit rate]')
+    render(show_loyal_users, loyal_users())
+
+    st.subheader(':blue[Retention of first-visit cohorts]')
+    st.write('Users are grouped by the day or week of their first visit; each row shows how many of them came back '
+             'in every later period.')
+    period = st.radio('Cohort period', COHORT_PERIODS, horizontal=True)
+    render_figure(fingerprint, plot_cohort_retention, cohort_retention(period))
+
+
+def live_dashboard():
+    # Running aggregates of the tailed events; a chart is only redrawn once new events changed its data
+    ingest = live_ingest(LIVE_PATH)
+    aggregates = ingest.aggregates
+    live_fingerprint = f'live:{LIVE_PATH}:{aggregates.version}'
+    checked = f', checked {time.time() - ingest.last_poll:.0f}s ago' if ingest.last_poll else ''
+    st.caption(f'Live: {aggregates.rows:,} events from {LIVE_PATH}, latest at {aggregates.last_event}{checked}')
+    if ingest.error is not None:
+        st.warning(f'Reading new events failed: {ingest.error}')
+    if not aggregates.rows:
+        st.info('Waiting for events')
+        return
+
+    render(st.table, aggregates.funnel_table())
+
+    st.header('Exit Rate', divider='rainbow')
+    render(show_exit_rates, aggregates.exit_rates())
+    render_figure(live_fingerprint, plot_daily_interactions, aggregates.daily_interactions())
+    render_figure(live_fingerprint, plot_exit_rate_over_time, aggregates.exit_rate_over_time())
+
+    st.header('Bounce Rate', divider='rainbow')
+    render(show_bounce_rates, aggregates.bounce_rates())
+    render_figure(live_fingerprint, plot_daily_bounce_rates, aggregates.daily_bounce_rates())
+
+
+# How the funnel counts: every stage on its own, or stages completed in order by each user or session
+FUNNEL_MODES = {
+    'Any order': None,
+    'Ordered by user': 'user',
+    'Ordered by session': 'session',
+}
+
+# Time limit for completing an ordered funnel, from the first event
+FUNNEL_WINDOWS = {
+    'No limit': None,
+    '1 hour': '1h',
+    '1 day': '1D',
+    '7 days': '7D',
+}
+
+# Sections are computed and drawn only once opened, so the first paint needs the funnel table alone
+SECTIONS = {
+    'Average Time on Page': average_time_section,
+    'Exit Rate': exit_rate_section,
+    'Page Interactions': page_interactions_section,
+    'Average Session Duration': session_duration_section,
+    'Bounce Rate': bounce_rate_section,
+    'Revisit Rate': revisit_rate_section,
+}
+
+# Results of every section, started on the warm-up threads once the events are loaded
+SECTION_RESULTS = {
+    'Average Time on Page': [average_time_by_user, common_user_journeys],
+    'Exit Rate': [exit_rates, products_added_before_exit, daily_interaction_counts, interactions_heatmap,
+                  page_type_counts, exit_rate_by_day],
+    'Page Interactions': [top_user_paths],
+    'Average Session Duration': [average_duration_by_page],
+    'Bounce Rate': [bounce_rates, daily_page_bounce_rates],
+    'Revisit Rate': [loyal_users, cohort_retention],
+}
+
+# Results the database answers when one is configured; the others need the events themselves
+SQL_RESULTS = [exit_rates, average_duration_by_page, bounce_rates, daily_page_bounce_rates, loyal_users]
+
+
+def background_job(section, result):
+    # A warm-up job, recorded in the profile of the run that started it. Its steps are not recorded one by one
+    with profile.measure(result.__name__, 'background', section=section):
+        result()
+
+
+def warm_up_sections():
+    # Start the results of every section for this view in the background, so they are ready by the time one is
+    # selected; jobs started by an earlier run or another session for the same view are reused. Returns the jobs
+    # by section. With a database only its results are started, as the others would load every event
+    jobs = {section: [warm_up.submit((fingerprint, bool(approximate_options), result.__name__), background_job,
+                                     section, result)
+                      for result in results if sql_store is None or result in SQL_RESULTS]
+            for section, results in SECTION_RESULTS.items()}
+    return {section: [job for job in section_jobs if job is not None] for section, section_jobs in jobs.items()}
+
+
+def wait_for_section(jobs):
+    # Show the progress of the section's running jobs until they are done, then it renders from the cache. Jobs
+    # still queued behind other sections' are cancelled and their results computed by the section itself, as is
+    # the result of a failed job, whose error the section then shows
+    running = [job for job in jobs if not job.done() and not job.cancel()]
+    if not running:
+        return
+    with profile.measure('wait_for_section', 'compute', jobs=len(running)):
+        progress = st.progress(0.0, text='Computing this section')
+        for done, _ in enumerate(as_completed(running), start=1):
+            progress.progress(done / len(running), text=f'Computing this section: {done} of {len(running)} '
+                                                        'results ready')
+        progress.empty()
+
+
+st.title('User Funnel Analysis')
+st.write("Hello, this app was designed to showcase some of the visuals that have been made as part of"
+         "the data analysis part! This app is the demo version. The graphics and chars are customizable and can be "
+         "executed with rich UI components like selectors, dropdowns, etc. For demo purposes, the app is limited to "
+         "basic functionality. Existing BI platforms were skipped as there might not be an optimal solution for some "
+         "visualizations or underlining circumstances.")
+
+notebook_url = "https://colab.research.google.com/drive/1z1rNEBoSbl1Zr9nZglCUHQ8usGGSRVGB?usp=sharing"
+st.markdown(f"""
+    <div style="background-color: #f0f2f6; padding: 10px; border-radius: 5px;">
+        <p style="font-size: 16px;">This app is a demo version. For more detailed analysis, check out the 
+        <a href="{notebook_url}" target="_blank" style="color: #2585a6; font-weight: bold;">original notebook</a>.</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+if LIVE_PATH:
+    with profile.section('Live'):
+        live_dashboard()
+    profile.export()
+    # Refresh on a timer; st.rerun ends this run, so the static dashboard below is never reached
+    time.sleep(LIVE_REFRESH_SECONDS)
+    st.rerun()
+
+# Filtering and sampling need the events themselves, so they are not offered on a precomputed report or a database
+filtered_fingerprint = fingerprint
+if report is None and sql_store is None:
+    filters = sidebar_filters(event_index())
+    filtered_fingerprint = filter_fingerprint(dataset_fingerprint, **filters)
+    sample_rate = sidebar_sampling()
+    fingerprint = sample_fingerprint(filtered_fingerprint, sample_rate)
+    if sample_rate is not None:
+        sample_options = {'sample_rate': sample_rate}
+        st.caption(f'Estimated from a {sample_rate * 100:g}% sample of users: the funnels, exit rate, session '
+                   'duration, bounce rate and path tables are scaled to all users, with ~95% error bounds (±). Other '
+                   'charts and tables show the sampled users as they are.')
+    else:
+        approximate_options = sidebar_approximation()
+        if approximate_options:
+            st.caption('The funnel and the bounce rates count distinct users and sessions with HyperLogLog sketches, '
+                       'with ~95% error bounds (±).')
+
+# Call the function to get funnel data
+funnel_mode = FUNNEL_MODES[st.radio('Funnel', FUNNEL_MODES, horizontal=True)]
+if funnel_mode is None:
+    render(st.table, metric('funnel', calculate_funnel_user_counts, events, **sample_options, **approximate_options))
+else:
+    # Reports hold the ordered funnels without a time limit only
+    window = FUNNEL_WINDOWS[st.selectbox('Completed within', FUNNEL_WINDOWS)] if report is None else None
+    render(st.table, metric(f'ordered_funnel_{funnel_mode}', compute_ordered_funnel, events, level=funnel_mode,
+                            window=window, **sample_options))
+
+# Once the funnel is shown, compute the sections in the background while the page is looked at
+section_jobs = warm_up_sections() if report is None else {}
+
+# Acts as a row of tabs; unlike st.tabs, only the selected one runs
+section = st.radio('Section', list(SECTIONS), index=None, horizontal=True, label_visibility='collapsed')
+if section is not None:
+    with profile.section(section):
+        wait_for_section(section_jobs.get(section, []))
+        SECTIONS[section]()
+
+if st.sidebar.toggle('Show profiling'):
+    show_run_profile(profile.frame(), profile.totals())
+profile.export()
@@ -0,0 +1,236 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import partial
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import services
+from loader import load_events
+from parallel import compute_session_metrics
+from sampling import DEFAULT_SAMPLE_RATE, sample_users
+from snapshot import load_shared_dataset
+from streaming import stream_funnel_user_counts
+from synthetic import ensure_synthetic
+
+# Dataset sizes run by default; 10M and 100M need a large machine and are opt-in
+DEFAULT_SIZES = ['1M']
+SIZE_SUFFIXES = {'K': 10 ** 3, 'M': 10 ** 6, 'B': 10 ** 9}
+
+# A function is reported as a regression when it is this much slower than in the baseline results,
+# and by at least MIN_REGRESSION_SECONDS so timer noise on millisecond functions is ignored
+REGRESSION_RATIO = 1.2
+MIN_REGRESSION_SECONDS = 0.01
+
+# Seconds between samples of the bytes held by Arrow's memory pool while a call runs
+ARROW_SAMPLE_SECONDS = 0.001
+
+# Benchmarked calls in run order: (name, function, argument names, result name for later calls or None).
+# Argument names refer to 'data' or to results of earlier calls
+BENCHMARKS = [
+    ('load_events', load_events, ['path'], 'data'),
+    ('load_shared_dataset', load_shared_dataset, ['path'], None),
+    ('build_session_summary', services.build_session_summary, ['data'], 'sessions'),
+    ('calculate_funnel_user_counts', services.calculate_funnel_user_counts, ['data'], None),
+    ('stream_funnel_user_counts', stream_funnel_user_counts, ['path'], None),
+    ('compute_ordered_funnel', services.compute_ordered_funnel, ['data'], None),
+    ('compute_avg_time_by_average_user', services.compute_avg_time_by_average_user, ['data'], 'avg_time_by_user'),
+    ('compute_duration_trendlines', services.compute_duration_trendlines, ['avg_time_by_user'], None),
+    ('compute_common_user_journeys', services.compute_common_user_journeys, ['data'], 'common_journeys'),
+    ('compute_exit_rates', services.compute_exit_rates, ['data', 'sessions'], None),
+    ('compute_products_added_before_exit', services.compute_products_added_before_exit, ['data'],
+     'product_counts'),
+    ('compute_daily_interactions', services.compute_daily_interactions, ['data'], 'daily_counts'),
+    ('compute_interactions_heatmap', services.compute_interactions_heatmap, ['data'], 'heatmap_data'),
+    ('compute_page_type_counts', services.compute_page_type_counts, ['data'], 'page_type_counts'),
+    ('compute_exit_rate_over_time', services.compute_exit_rate_over_time, ['data', 'sessions'],
+     'exit_rate_by_day'),
+    ('compute_top_user_paths', services.compute_top_user_paths, ['data'], 'top_paths'),
+    ('compute_average_duration_by_page', services.compute_average_duration_by_page, ['data'], None),
+    ('compute_bounce_rates', services.compute_bounce_rates, ['data', 'sessions'], None),
+    ('compute_daily_bounce_rates', services.compute_daily_bounce_rates, ['data', 'sessions'],
+     'daily_page_bounce_rates'),
+    ('compute_loyal_users', services.compute_loyal_users, ['data'], None),
+    ('compute_cohort_retention', services.compute_cohort_retention, ['data'], 'cohort_retention'),
+    # From the file, on AUTODOC_WORKERS processes (every core by default)
+    ('compute_session_metrics', compute_session_metrics, ['path'], None),
+    ('sample_users', partial(sample_users, rate=DEFAULT_SAMPLE_RATE), ['data'], 'sample'),
+    ('build_session_summary_sampled', services.build_session_summary, ['sample'], 'sample_sessions'),
+    ('calculate_funnel_user_counts_sampled',
+     partial(services.calculate_funnel_user_counts, sample_rate=DEFAULT_SAMPLE_RATE), ['sample'], None),
+    ('compute_exit_rates_sampled', partial(services.compute_exit_rates, sample_rate=DEFAULT_SAMPLE_RATE),
+     ['sample', 'sample_sessions'], None),
+    ('compute_top_user_paths_sampled', partial(services.compute_top_user_paths, sample_rate=DEFAULT_SAMPLE_RATE),
+     ['sample'], None),
+    ('compute_average_duration_by_page_sampled',
+     partial(services.compute_average_duration_by_page, sample_rate=DEFAULT_SAMPLE_RATE), ['sample'], None),
+    ('compute_bounce_rates_sampled', partial(services.compute_bounce_rates, sample_rate=DEFAULT_SAMPLE_RATE),
+     ['sample', 'sample_sessions'], None),
+    ('show_top_user_paths', services.show_top_user_paths, ['top_paths'], None),
+    ('plot_avg_time_by_user', services.plot_avg_time_by_user, ['avg_time_by_user'], None),
+    ('plot_heatmap_avg_time_by_user', services.plot_heatmap_avg_time_by_user, ['avg_time_by_user'], None),
+    ('plot_average_duration_with_trendlines', services.plot_average_duration_with_trendlines,
+     ['avg_time_by_user'], None),
+    ('plot_common_user_journeys', services.plot_common_user_journeys, ['common_journeys'], None),
+    ('plot_interactions_before_exit', services.plot_interactions_before_exit, ['product_counts'], None),
+    ('plot_daily_interactions', services.plot_daily_interactions, ['daily_counts'], None),
+    ('plot_interactions_heatmap', services.plot_interactions_heatmap, ['heatmap_data'], None),
+    ('plot_exit_pages_bar_chart', services.plot_exit_pages_bar_chart, ['page_type_counts'], None),
+    ('plot_exit_rate_over_time', services.plot_exit_rate_over_time, ['exit_rate_by_day'], None),
+    ('plot_daily_bounce_rates', services.plot_daily_bounce_rates, ['daily_page_bounce_rates'], None),
+    ('plot_cohort_retention', services.plot_cohort_retention, ['cohort_retention'], None),
+]
+
+
+def parse_size(size):
+    # '1M' -> 1000000; plain integers are accepted as well
+    size = size.strip().upper()
+    if size[-1] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+@contextmanager
+def arrow_peak():
+    # Most bytes Arrow's memory pool held above its level at entry while the block ran, sampled on a thread (Arrow
+    # releases the GIL while it works). tracemalloc only sees Python's and NumPy's allocations, not the buffers of
+    # Arrow tables and Arrow-backed columns
+    start = pa.total_allocated_bytes()
+    peak = {'bytes': 0}
+    done = threading.Event()
+
+    def sample():
+        while True:
+            peak['bytes'] = max(peak['bytes'], pa.total_allocated_bytes() - start)
+            if done.wait(ARROW_SAMPLE_SECONDS):
+                return
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield peak
+    finally:
+        done.set()
+        sampler.join()
+        peak['bytes'] = max(peak['bytes'], pa.total_allocated_bytes() - start)
+
+
+def measure(func, args, repeat):
+    # Best and mean wall time over repeat calls, then the peak memory of one more call: traced Python and NumPy
+    # allocations plus Arrow's. Memory is measured separately because tracemalloc slows allocation-heavy code down
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+        plt.close('all')
+
+    gc.collect()
+    with arrow_peak() as arrow:
+        tracemalloc.start()
+        # Kept until Arrow's pool is sampled a last time, so Arrow memory held by the result counts too
+        traced_result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    del traced_result
+    plt.close('all')
+    return result, {'best_s': min(timings), 'mean_s': float(np.mean(timings)),
+                    'peak_mb': (peak + arrow['bytes']) / 1024 ** 2, 'arrow_peak_mb': arrow['bytes'] / 1024 ** 2}
+
+
+def run_benchmarks(path, rows, repeat=3, only=None):
+    results = {'path': path}
+    records = []
+    for name, func, arg_names, result_name in BENCHMARKS:
+        if only and name not in only and result_name is None:
+            continue
+        result, stats = measure(func, [results[arg] for arg in arg_names], repeat)
+        if result_name:
+            results[result_name] = result
+        records.append({'function': name, 'rows': rows, **stats})
+        print(f'{rows:>12,} {name:<40} {stats["best_s"]:9.3f}s {stats["peak_mb"]:10.1f} MB', file=sys.stderr)
+    return records
+
+
+def environment():
+    # Enough context to tell apart runs of different code versions and machines
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(records, baseline_records, ratio=REGRESSION_RATIO):
+    # Functions whose best time grew by more than ratio against the baseline run at the same size
+    baseline = {(record['function'], record['rows']): record for record in baseline_records}
+    regressions = []
+    for record in records:
+        previous = baseline.get((record['function'], record['rows']))
+        if previous and record['best_s'] > max(previous['best_s'] * ratio,
+                                               previous['best_s'] + MIN_REGRESSION_SECONDS):
+            regressions.append({'function': record['function'], 'rows': record['rows'],
+                                'baseline_s': previous['best_s'], 'best_s': record['best_s'],
+                                'ratio': record['best_s'] / previous['best_s']})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time and measure the peak memory of the services functions '
+                                                 'on synthetic event logs')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='event counts, e.g. 1M 10M 100M')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls per function')
+    parser.add_argument('--data-dir', default='data/benchmark', help='where synthetic datasets are kept')
+    parser.add_argument('--only', nargs='+', help='benchmark only these functions (and their inputs)')
+    parser.add_argument('--output', help='write the results as JSON to this file (default: stdout)')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    # Draw off screen; the show_* functions write to Streamlit, which outside `streamlit run` only warns
+    plt.switch_backend('Agg')
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    records = []
+    for size in args.sizes:
+        rows = parse_size(size)
+        records += run_benchmarks(ensure_synthetic(args.data_dir, rows, args.seed), rows, args.repeat, args.only)
+
+    report = {'environment': environment(), 'seed': args.seed, 'repeat': args.repeat, 'results': records}
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            report['regressions'] = compare(records, json.load(baseline)['results'])
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if report.get('regressions'):
+        for regression in report['regressions']:
+            print(f'REGRESSION {regression["function"]} at {regression["rows"]:,} rows: '
+                  f'{regression["baseline_s"]:.3f}s -> {regression["best_s"]:.3f}s', file=sys.stderr)
+        sys.exit(1)
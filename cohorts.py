@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from loader import value_codes
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+# Cohort periods: length in days, and the weekday the first period starts on (day 0 of the epoch is a Thursday,
+# so weeks start 4 days later, on Monday 1970-01-05)
+COHORT_PERIODS = {
+    'day': (1, 0),
+    'week': (7, 4),
+}
+
+
+def user_codes(users):
+    # Integer code per event and number of distinct codes; dictionary-encoded users are used as they are
+    codes, uniques = value_codes(users)
+    return codes.astype(np.int64), len(uniques)
+
+
+def period_numbers(timestamps, period='day'):
+    # Number of the period each datetime64[ns] timestamp falls in, counted from the epoch
+    days, first_weekday = COHORT_PERIODS[period]
+    return (timestamps.view(np.int64) // NS_PER_DAY - first_weekday) // days
+
+
+def retention_counts(codes, n_users, periods):
+    # Distinct users active per (cohort, periods since cohort), where a user's cohort is the period of their first
+    # event. Returns the count matrix, the first cohort's period number and the last observed period number
+    known = codes >= 0
+    codes, periods = codes[known], periods[known]
+    if not len(codes):
+        return np.zeros((0, 0), dtype=np.int64), 0, -1
+
+    # First period of every user, then the offset of every event from its user's cohort
+    first = np.full(n_users, periods.max(), dtype=np.int64)
+    np.minimum.at(first, codes, periods)
+    offsets = periods - first[codes]
+
+    # Each user counts once per offset however many events they had in that period
+    n_offsets = int(offsets.max()) + 1
+    active = np.unique(codes * n_offsets + offsets)
+    active_users, active_offsets = np.divmod(active, n_offsets)
+
+    first_period, last_period = int(periods.min()), int(periods.max())
+    n_cohorts = last_period - first_period + 1
+    cells = (first[active_users] - first_period) * n_offsets + active_offsets
+    counts = np.bincount(cells, minlength=n_cohorts * n_offsets).reshape(n_cohorts, n_offsets)
+    return counts, first_period, last_period
+
+
+def cohort_retention(users, timestamps, period='day'):
+    # Retention matrix: one row per first-visit cohort, one column per periods since the first visit, holding the
+    # number of the cohort's users active in that period. Periods after the end of the data are NaN
+    codes, n_users = user_codes(users)
+    timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+    # Events without a user or a time belong to no cohort; NaT would otherwise become a period before the epoch
+    known = (codes >= 0) & ~np.isnat(timestamps)
+    periods = period_numbers(timestamps[known], period)
+    counts, first_period, last_period = retention_counts(codes[known], n_users, periods)
+
+    n_cohorts, n_offsets = counts.shape
+    observed = np.arange(n_cohorts)[:, None] + np.arange(n_offsets)[None, :] <= last_period - first_period
+    days, first_weekday = COHORT_PERIODS[period]
+    starts = ((first_period + np.arange(n_cohorts)) * days + first_weekday) * NS_PER_DAY
+    retention = pd.DataFrame(np.where(observed, counts, np.nan),
+                             index=pd.DatetimeIndex(starts.view('M8[ns]'), name='cohort'),
+                             columns=pd.RangeIndex(n_offsets, name=f'{period}s_since_first_visit'))
+    # Periods in which nobody visited for the first time have no cohort
+    return retention[retention[0] > 0]
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import pandas as pd
+
+# Bounds for the shared compute cache; override with environment variables on the dyno
+DEFAULT_MAX_MB = int(os.environ.get('AUTODOC_CACHE_MAX_MB', 1024))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('AUTODOC_CACHE_MAX_ENTRIES', 128))
+
+
+def file_fingerprint(path):
+    # Identify a dataset by its location, size and modification time, so a changed file gets fresh entries
+    stat = os.stat(path)
+    raw = f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def result_nbytes(value):
+    # Approximate the resident size of a cached result
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, (tuple, list)):
+        return sum(result_nbytes(item) for item in value)
+    if hasattr(value, 'nbytes'):
+        # Arrays, and objects holding frames or arrays that report their own size
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+def _key_part(value):
+    # Frames are identified by the dataset fingerprint, everything else must be hashable
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return '<frame>'
+    if isinstance(value, (list, tuple)):
+        return tuple(_key_part(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((name, _key_part(item)) for name, item in value.items()))
+    return value
+
+
+def make_key(fingerprint, func, args, kwargs):
+    name = f'{func.__module__}.{func.__qualname__}'
+    return fingerprint, name, _key_part(args), _key_part(kwargs)
+
+
+class ComputeCache:
+    # LRU cache of computed results, bounded by total size and number of entries.
+    # Frame arguments are not hashed: they must be the dataset identified by the fingerprint, or derived from it.
+    # Cached results are shared between reruns and sessions, so callers must not modify them.
+    # A result being computed by one thread is waited for by the others that ask for it, not computed again.
+
+    def __init__(self, max_bytes=DEFAULT_MAX_MB * 1024 ** 2, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Futures of the results being computed, by key
+        self._pending = {}
+        self._lock = threading.RLock()
+
+    def get_or_compute(self, fingerprint, func, *args, **kwargs):
+        key = make_key(fingerprint, func, args, kwargs)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            if key in self._pending:
+                self.hits += 1
+                pending = self._pending[key]
+            else:
+                self.misses += 1
+                pending = None
+                future = self._pending[key] = Future()
+        if pending is not None:
+            # Raises the computing thread's exception if it failed
+            return pending.result()
+
+        try:
+            value = func(*args, **kwargs)
+        except BaseException as error:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(error)
+            raise
+        self._store(key, value)
+        with self._lock:
+            del self._pending[key]
+        future.set_result(value)
+        return value
+
+    def _store(self, key, value):
+        nbytes = result_nbytes(value)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            # Larger than the whole budget: hand it back without caching
+            return
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self.total_bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until both bounds hold
+        while self._entries and (
+                (self.max_bytes is not None and self.total_bytes > self.max_bytes) or
+                (self.max_entries is not None and len(self._entries) > self.max_entries)):
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.total_bytes -= nbytes
+
+    def invalidate(self, fingerprint=None):
+        # Remove all entries, or only those computed for one dataset
+        with self._lock:
+            for key in [key for key in self._entries if fingerprint is None or key[0] == fingerprint]:
+                self.total_bytes -= self._entries.pop(key)[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Process-wide cache; imported modules survive Streamlit reruns, so entries are shared by every session
+compute_cache = ComputeCache()
+
+
+def cached(fingerprint, func, *args, **kwargs):
+    return compute_cache.get_or_compute(fingerprint, func, *args, **kwargs)
@@ -0,0 +1,84 @@
+import os
+
+import pandas as pd
+
+from dwell import event_days, event_hours
+from loader import load_events
+
+# Dimensions of the cube; every count-based chart is a roll-up over some of them
+CUBE_DIMENSIONS = ['event_day', 'hour', 'page_type', 'event_type']
+
+
+class EventCube:
+    # Event counts per (event_day, hour, page_type, event_type): a few thousand rows instead of the raw events.
+    # Filters and roll-ups work on this small frame only
+
+    def __init__(self, counts):
+        self.counts = counts
+
+    @classmethod
+    def build(cls, data):
+        # One grouped pass over the raw events
+        keys = [event_days(data), event_hours(data), data['page_type'], data['event_type']]
+        counts = data.groupby(keys, observed=True).size().reset_index(name='count')
+        return cls(counts)
+
+    @classmethod
+    def load(cls, path):
+        return cls(pd.read_parquet(path))
+
+    def save(self, path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        self.counts.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def filter(self, start=None, end=None, page_type=None, event_type=None):
+        # Slice the cube by days start <= event_day < end (as EventIndex.filter) and/or one or more page and event
+        # types. The cube is per day, so only whole-day bounds give the counts of the filtered events
+        mask = pd.Series(True, index=self.counts.index)
+        if start is not None:
+            mask &= self.counts['event_day'] >= pd.Timestamp(start)
+        if end is not None:
+            mask &= self.counts['event_day'] < pd.Timestamp(end)
+        if page_type is not None:
+            mask &= self.counts['page_type'].isin([page_type] if isinstance(page_type, str) else page_type)
+        if event_type is not None:
+            mask &= self.counts['event_type'].isin([event_type] if isinstance(event_type, str) else event_type)
+        return EventCube(self.counts[mask])
+
+    def daily_interactions(self):
+        # Same as compute_daily_interactions: events per calendar day, including days without events
+        daily_counts = self.counts.groupby('event_day')['count'].sum().rename(None)
+        if len(daily_counts):
+            daily_counts = daily_counts.reindex(pd.date_range(daily_counts.index.min(), daily_counts.index.max(),
+                                                              freq='D'), fill_value=0)
+        daily_counts.index.name = 'event_date'
+        return daily_counts
+
+    def interactions_heatmap(self):
+        # Same as compute_interactions_heatmap: events per day of week and hour
+        dayofweek = self.counts['event_day'].dt.dayofweek.rename('dayofweek')
+        return self.counts.groupby([dayofweek, self.counts['hour']])['count'].sum().unstack(fill_value=0)
+
+    def page_type_counts(self):
+        # Same as compute_page_type_counts: events per page type, most frequent first
+        return self.counts.groupby('page_type', observed=True)['count'].sum().sort_values(ascending=False)
+
+
+def cube_path_for(source_path):
+    return os.path.splitext(source_path)[0] + '.cube.parquet'
+
+
+def load_event_cube(source_path, load=load_events):
+    # Reuse the persisted cube while it is newer than the source file, otherwise rebuild and persist it.
+    # load(source_path) returns the events of the file; it is only called for a rebuild
+    path = cube_path_for(source_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path):
+        return EventCube.load(path)
+    cube = EventCube.build(load(source_path))
+    try:
+        cube.save(path)
+    except OSError:
+        # Read-only filesystem: keep the cube in memory only
+        pass
+    return cube
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from loader import value_codes
+
+# 'span': time between a user's first and last event on a page type in a day.
+# 'next_event': every page view lasts until the next event of its session (the last view of a session lasts 0)
+DWELL_METHODS = ('span', 'next_event')
+
+NS_PER_HOUR = 3_600 * 10 ** 9
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+# Day 0 of the epoch is a Thursday
+EPOCH_WEEKDAY = 3
+
+
+def event_timestamps(data):
+    # Event times as int64 nanoseconds since the epoch: a view of event_date, not a copy
+    return np.asarray(data['event_date'], dtype='datetime64[ns]').view(np.int64)
+
+
+def _time_field(data, values, name):
+    # Keep the NaT of missing event dates as NaN, like the .dt accessors do
+    missing = np.isnat(np.asarray(data['event_date'], dtype='datetime64[ns]'))
+    if missing.any():
+        values = np.where(missing, np.nan, values)
+    return pd.Series(values, index=data.index, name=name)
+
+
+def event_days(data):
+    # Calendar day of each event, floored from the int64 timestamps without adding a column to data
+    if 'event_day' in data:
+        return data['event_day']
+    timestamps = event_timestamps(data)
+    days = np.where(timestamps == np.iinfo(np.int64).min, timestamps, timestamps - timestamps % NS_PER_DAY)
+    return pd.Series(days.view('M8[ns]'), index=data.index, name='event_day')
+
+
+def event_hours(data):
+    # Hour of the day of each event (0-23)
+    return _time_field(data, (event_timestamps(data) // NS_PER_HOUR % 24).astype(np.int32), 'hour')
+
+
+def event_weekdays(data):
+    # Day of the week of each event, Monday = 0 as in pandas
+    return _time_field(data, ((event_timestamps(data) // NS_PER_DAY + EPOCH_WEEKDAY) % 7).astype(np.int32),
+                       'dayofweek')
+
+
+def page_span_durations(data):
+    # Native min/max aggregations per (user, page_type, event_day) instead of a Python call per group
+    keys = [data['user'], data['page_type'], event_days(data)]
+    bounds = data['event_date'].groupby(keys, observed=True).agg(['min', 'max'])
+    return (bounds['max'] - bounds['min']).rename('duration')
+
+
+def page_view_dwell(data):
+    # Order events by time within each session. Events without a session or a time have no dwell (NaT) and are left
+    # out, so a missing time (int64 min) is not taken for the first event of its session
+    session_codes = value_codes(data['session'])[0]
+    timestamps = event_timestamps(data)
+    known = np.flatnonzero((session_codes >= 0) & (timestamps != np.iinfo(np.int64).min))
+    order = known[np.lexsort((timestamps[known], session_codes[known]))]
+    sorted_codes = session_codes[order]
+
+    # Gap to the following event, zero where the next event belongs to another session
+    gaps = np.zeros(len(order), dtype=np.int64)
+    gaps[:-1] = np.where(sorted_codes[1:] == sorted_codes[:-1], np.diff(timestamps[order]), 0)
+
+    # Scatter back to the original row order
+    dwell = np.full(len(timestamps), np.iinfo(np.int64).min, dtype=np.int64)
+    dwell[order] = gaps
+    return pd.Series(dwell.view('m8[ns]'), index=data.index, name='dwell')
+
+
+def page_view_durations(data):
+    # Total per-page-view dwell per (user, page_type, event_day)
+    keys = [data['user'], data['page_type'], event_days(data)]
+    return page_view_dwell(data).groupby(keys, observed=True).sum().rename('duration')
+
+
+def page_durations(data, method='span'):
+    if method == 'span':
+        return page_span_durations(data)
+    if method == 'next_event':
+        return page_view_durations(data)
+    raise ValueError(f'Unknown dwell method {method!r}, expected one of {DWELL_METHODS}')
@@ -0,0 +1,137 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from loader import load_events, value_codes
+
+# User segments by number of sessions in the whole dataset: (lowest, highest) session count, inclusive
+USER_SEGMENTS = {
+    'one-time': (1, 1),
+    'returning': (2, 4),
+    'loyal': (5, np.inf),
+}
+
+# Columns with a row-position list per value; 'segment' is derived from the user
+FILTER_COLUMNS = ('page_type', 'event_type', 'segment')
+
+
+def user_segments(data):
+    # Segment of every event's user, from the user's session count
+    user_codes, users = value_codes(data['user'])
+    session_codes = value_codes(data['session'])[0]
+    # Distinct (user, session) pairs, counted per user
+    pairs = np.unique(np.stack([user_codes, session_codes]), axis=1)
+    sessions_per_user = np.bincount(pairs[0][pairs[0] >= 0], minlength=len(users))
+    bounds = np.array([low for low, _ in USER_SEGMENTS.values()])
+    segment_of_user = np.searchsorted(bounds, sessions_per_user, side='right') - 1
+    codes = np.where(user_codes >= 0, segment_of_user[user_codes], -1)
+    return pd.Categorical.from_codes(codes, categories=list(USER_SEGMENTS))
+
+
+class PositionIndex:
+    # Row positions of every value of a column, grouped by value and ascending within each value (CSR layout)
+
+    def __init__(self, values, codes):
+        self.values = list(values)
+        order = np.argsort(codes, kind='stable')
+        # Missing values (code -1) sort first and are dropped
+        missing = np.searchsorted(codes[order], 0)
+        self.positions = order[missing:]
+        self.offsets = np.searchsorted(codes[order][missing:], np.arange(len(self.values) + 1))
+
+    @classmethod
+    def from_arrays(cls, values, positions, offsets):
+        # An index built earlier, e.g. mapped from a snapshot
+        index = cls.__new__(cls)
+        index.values, index.positions, index.offsets = list(values), positions, offsets
+        return index
+
+    def positions_of(self, value, lo, hi):
+        # Ascending positions of rows with this value, restricted to [lo, hi)
+        if value not in self.values:
+            return np.array([], dtype=np.intp)
+        code = self.values.index(value)
+        rows = self.positions[self.offsets[code]:self.offsets[code + 1]]
+        return rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)]
+
+
+class EventIndex:
+    # The event frame sorted by event_date, plus a position index per filter column, built once per dataset.
+    # A date range is a binary search and a zero-copy slice of the sorted frame; category filters intersect
+    # position lists within that slice, so the rows taken are the only per-filter cost
+
+    def __init__(self, data, indexes):
+        self.data = data
+        self.timestamps = data['event_date'].to_numpy().view(np.int64)
+        self.indexes = indexes
+
+    @classmethod
+    def build(cls, data):
+        if not data['event_date'].is_monotonic_increasing:
+            data = data.take(np.argsort(data['event_date'].to_numpy(), kind='stable')).reset_index(drop=True)
+        indexes = {column: PositionIndex(data[column].cat.categories, data[column].cat.codes.to_numpy())
+                   for column in FILTER_COLUMNS if column in data and isinstance(data[column].dtype,
+                                                                                 pd.CategoricalDtype)}
+        segments = user_segments(data)
+        indexes['segment'] = PositionIndex(segments.categories, segments.codes)
+        return cls(data, indexes)
+
+    def row_range(self, start=None, end=None):
+        # Positions [lo, hi) of the events with start <= event_date < end
+        lo = 0 if start is None else np.searchsorted(self.timestamps, pd.Timestamp(start).as_unit('ns').value)
+        hi = len(self.timestamps) if end is None else np.searchsorted(self.timestamps,
+                                                                      pd.Timestamp(end).as_unit('ns').value)
+        return int(lo), int(hi)
+
+    def select(self, start=None, end=None, **values):
+        # Sorted row positions (or a (lo, hi) range when only dates are given) matching every filter.
+        # values maps filter columns to the accepted values; empty or None means no filter on that column
+        lo, hi = self.row_range(start, end)
+        active = {column: accepted for column, accepted in values.items() if accepted}
+        if not active:
+            return lo, hi
+        # Values of one column select disjoint rows, so a row matches when every active column counted it
+        matches = np.zeros(hi - lo, dtype=np.int8)
+        for column, accepted in active.items():
+            if column not in self.indexes:
+                raise ValueError(f'Cannot filter on {column!r}, expected one of {sorted(self.indexes)}')
+            for value in set(accepted):
+                matches[self.indexes[column].positions_of(value, lo, hi) - lo] += 1
+        return np.flatnonzero(matches == len(active)) + lo
+
+    def filter(self, start=None, end=None, **values):
+        # The matching events, in time order; a date-only filter returns a slice without copying the columns
+        selected = self.select(start, end, **values)
+        if isinstance(selected, tuple):
+            lo, hi = selected
+            return self.data if (lo, hi) == (0, len(self.data)) else self.data.iloc[lo:hi]
+        return self.data.take(selected)
+
+    @property
+    def nbytes(self):
+        # Resident size for the compute cache: the sorted frame and the position lists
+        return int(self.data.memory_usage(index=True, deep=True).sum()) + sum(
+            index.positions.nbytes + index.offsets.nbytes for index in self.indexes.values())
+
+    def values(self, column):
+        return self.indexes[column].values
+
+    def date_range(self):
+        if not len(self.timestamps):
+            return None, None
+        return pd.Timestamp(self.timestamps[0]), pd.Timestamp(self.timestamps[-1])
+
+
+def load_event_index(path):
+    # Load the events and index them; only the sorted frame is kept
+    return EventIndex.build(load_events(path))
+
+
+def filter_fingerprint(fingerprint, start=None, end=None, **values):
+    # Fingerprint of a filtered view, so results computed on it are cached per dataset and filter
+    active = {column: sorted(map(str, accepted)) for column, accepted in values.items() if accepted}
+    if start is None and end is None and not active:
+        return fingerprint
+    raw = repr((fingerprint, str(start), str(end), sorted(active.items())))
+    return hashlib.sha1(raw.encode()).hexdigest()
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+from loader import value_codes
+from sampling import scaled_count_error, set_ratio_error
+from sketches import DEFAULT_PRECISION, HyperLogLog, hash_values
+
+# Funnel stages in order
+FUNNEL_STAGES = ['Visit', 'Browse Products', 'View Product Details', 'Add to Cart', 'Purchase']
+
+# Pages that count as browsing products
+BROWSE_PAGE_TYPES = ['search_listing_page', 'listing_page']
+
+
+def funnel_stage_masks(data):
+    # One boolean mask per stage, selecting the events that put a user in that stage
+    return [
+        # Every event is a visit
+        np.ones(len(data), dtype=bool),
+        # Browsed products (either via Search Listing Page or Listing Page)
+        data['page_type'].isin(BROWSE_PAGE_TYPES).to_numpy(),
+        # Viewed product details
+        (data['page_type'] == 'product_page').to_numpy(),
+        # Added products to cart
+        (data['event_type'] == 'add_to_cart').to_numpy(),
+        # Made a purchase
+        (data['event_type'] == 'order').to_numpy(),
+    ]
+
+
+def build_funnel_table(user_counts, with_conversion_rates=True, unit='Users'):
+    funnel_df = pd.DataFrame({
+        'Stage': FUNNEL_STAGES,
+        f'Number of {unit}': user_counts
+    })
+    if not with_conversion_rates:
+        return funnel_df
+
+    # Calculate conversion rates
+    conversion_rates = [(funnel_df[f'Number of {unit}'][i] / funnel_df[f'Number of {unit}'][i - 1]) * 100
+                        if i != 0 else 100 for i in range(len(funnel_df))]
+
+    funnel_df['Conversion Rate (%)'] = conversion_rates
+    funnel_df['Conversion Rate (%)'] = funnel_df['Conversion Rate (%)'].apply(lambda x: round(x, 2))
+
+    return funnel_df
+
+
+def build_sampled_funnel_table(stage_users, rate, unit='Users'):
+    # Funnel table from a user sample: counts scaled by 1 / rate and conversion rates as in the sample, each with its
+    # ~95% error bound. stage_users holds the user code of every unit counted in each stage: the distinct users, or
+    # the user of every session
+    counts = [len(users) for users in stage_users]
+    funnel_df = build_funnel_table(counts, unit=unit)
+    funnel_df[f'Number of {unit}'] = [round(count / rate) for count in counts]
+    funnel_df['Error Bound (±)'] = [round(scaled_count_error(users, rate)) for users in stage_users]
+    funnel_df['Conversion Rate Error (±)'] = [
+        round(set_ratio_error(users, stage_users[max(stage - 1, 0)], rate) * 100, 2)
+        for stage, users in enumerate(stage_users)]
+    return funnel_df
+
+
+def ordered_stage_levels(group_codes, timestamps, stage_masks, window=None):
+    # Number of stages every group (user or session) completes in order: stage k counts only through an event at or
+    # after the event completing stage k - 1, so one event can complete consecutive stages. With a window (ns),
+    # every stage must be completed within it from the group's first event of the first stage.
+    # One vectorized pass per stage over the events sorted by group and time; ties keep the row order
+    n_groups = int(group_codes.max()) + 1 if len(group_codes) else 0
+    order = np.lexsort((timestamps, group_codes))
+    order = order[group_codes[order] >= 0]
+    groups = group_codes[order]
+    times = timestamps[order]
+    positions = np.arange(len(order))
+
+    levels = np.zeros(n_groups, dtype=np.int64)
+    # Sorted position of the event completing the last stage reached, per group (-1: not reached)
+    reached = np.full(n_groups, -1, dtype=np.int64)
+    entry_times = np.zeros(n_groups, dtype=np.int64)
+    for stage, mask in enumerate(stage_masks):
+        candidates = mask[order]
+        if stage > 0:
+            candidates &= (reached[groups] >= 0) & (positions >= reached[groups])
+            if window is not None:
+                candidates &= times <= entry_times[groups] + window
+        rows = np.flatnonzero(candidates)
+        # Groups are contiguous and time-ordered, so the first candidate of each group is the earliest one
+        first = rows[np.r_[True, groups[rows[1:]] != groups[rows[:-1]]]] if len(rows) else rows
+        reached = np.full(n_groups, -1, dtype=np.int64)
+        reached[groups[first]] = first
+        levels[groups[first]] = stage + 1
+        if stage == 0:
+            entry_times[groups[first]] = times[first]
+    return levels
+
+
+def _ordered_levels(data, level, window):
+    # Stages completed in order by every user (or session), with the group code of every event
+    if level not in ('user', 'session'):
+        raise ValueError(f'Unknown funnel level {level!r}, expected "user" or "session"')
+    group_codes = value_codes(data[level])[0]
+    timestamps = data['event_date'].to_numpy().view(np.int64)
+    window = None if window is None else pd.Timedelta(window).value
+    return ordered_stage_levels(group_codes, timestamps, funnel_stage_masks(data), window), group_codes
+
+
+def ordered_funnel_counts(data, level='user', window=None):
+    # Users (or sessions) completing each stage in order, optionally within a window from their funnel entry
+    levels = _ordered_levels(data, level, window)[0]
+    reached_at_least = np.bincount(levels, minlength=len(FUNNEL_STAGES) + 1)[::-1].cumsum()[::-1]
+    return [int(count) for count in reached_at_least[1:]]
+
+
+def ordered_stage_users(data, level='user', window=None):
+    # User code of every user (or session) completing each stage in order, for build_sampled_funnel_table
+    levels, group_codes = _ordered_levels(data, level, window)
+    if level == 'user':
+        owners = np.arange(len(levels))
+    else:
+        user_codes = value_codes(data['user'])[0]
+        owners = np.full(len(levels), -1, dtype=np.int64)
+        known = group_codes >= 0
+        owners[group_codes[known]] = user_codes[known]
+    return [owners[(levels > stage) & (owners >= 0)] for stage in range(len(FUNNEL_STAGES))]
+
+
+def funnel_user_sketches(data, precision=DEFAULT_PRECISION):
+    # One HyperLogLog sketch of users per stage; sketches of different partitions merge with |
+    known_user = data['user'].notna().to_numpy()
+    user_hashes = hash_values(data['user'])
+    return [HyperLogLog(precision).add_hashes(user_hashes[mask & known_user]) for mask in funnel_stage_masks(data)]
+
+
+def build_approx_funnel_table(sketches):
+    # Funnel table from per-stage sketches, with the ~95% error bound of every user count
+    funnel_df = build_funnel_table([round(sketch.estimate()) for sketch in sketches])
+    funnel_df['Error Bound (±)'] = [round(sketch.error_bound()) for sketch in sketches]
+    return funnel_df
@@ -0,0 +1,417 @@
+import argparse
+import glob
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.json as pj
+
+from loader import EVENT_SCHEMA, iter_event_batches
+from sessions import build_session_summary
+from streaming import StreamingFunnel, UserDictionary
+
+# Seconds between reads of the tailed files, and the most bytes parsed per read
+LIVE_POLL_SECONDS = float(os.environ.get('AUTODOC_LIVE_POLL_SECONDS', 1))
+MAX_READ_BYTES = 64 * 1024 ** 2
+
+# JSON events carry plain strings; page and event types are dictionary encoded after parsing
+JSON_SCHEMA = pa.schema([(field.name, pa.string() if pa.types.is_dictionary(field.type) else field.type)
+                         for field in EVENT_SCHEMA])
+
+# Page types are coded into fixed-width columns of the running counts
+MAX_PAGE_TYPES = 64
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+
+class JsonlTail:
+    # New complete lines of a JSONL file, or of every *.jsonl file in a directory, since the previous read.
+    # A partial last line is left for the next read; a file that shrank was rotated and is read from the start
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = {}
+
+    def files(self):
+        if os.path.isdir(self.path):
+            return sorted(glob.glob(os.path.join(self.path, '*.jsonl')))
+        return [self.path] if os.path.exists(self.path) else []
+
+    def read(self, max_bytes=MAX_READ_BYTES):
+        chunks = []
+        for path in self.files():
+            offset = self.offsets.get(path, 0)
+            if os.path.getsize(path) < offset:
+                offset = 0
+            with open(path, 'rb') as source:
+                source.seek(offset)
+                chunk = source.read(max_bytes)
+            complete = chunk[:chunk.rfind(b'\n') + 1]
+            self.offsets[path] = offset + len(complete)
+            if complete:
+                chunks.append(complete)
+        return b''.join(chunks)
+
+
+def _read_json(lines):
+    return pj.read_json(io.BytesIO(lines), parse_options=pj.ParseOptions(
+        explicit_schema=JSON_SCHEMA, unexpected_field_behavior='ignore'))
+
+
+def _event_frame(table):
+    data = table.to_pandas()
+    data['page_type'] = data['page_type'].astype('category')
+    data['event_type'] = data['event_type'].astype('category')
+    return data
+
+
+def parse_events(lines):
+    # JSON lines to the event frame load_events returns; fields outside the schema are ignored
+    return _event_frame(_read_json(lines))
+
+
+def parse_valid_events(lines):
+    # Like parse_events, but lines that do not parse are left out rather than failing the others.
+    # Returns the events, the number of lines left out and the error of the first one
+    try:
+        return parse_events(lines), 0, None
+    except pa.ArrowInvalid:
+        pass
+    # Only a read with a bad line pays for checking each line on its own
+    valid, rejected, first_error = [], 0, None
+    for line in lines.splitlines(keepends=True):
+        if not line.strip():
+            continue
+        try:
+            _read_json(line)
+        except pa.ArrowInvalid as error:
+            rejected += 1
+            first_error = first_error or error
+        else:
+            valid.append(line if line.endswith(b'\n') else line + b'\n')
+    table = _read_json(b''.join(valid)) if valid else JSON_SCHEMA.empty_table()
+    return _event_frame(table), rejected, first_error
+
+
+class KeySet:
+    # Set of int64 keys, inserting a batch in time proportional to the batch, however many keys the set holds
+
+    def __init__(self):
+        self.keys = set()
+
+    def add(self, keys):
+        # Returns the position in keys of the first occurrence of every key that was not in the set yet
+        keys, first = np.unique(keys, return_index=True)
+        known = self.keys
+        new = np.fromiter((key not in known for key in keys.tolist()), dtype=bool, count=len(keys))
+        known.update(keys[new].tolist())
+        return first[new]
+
+
+class DayCounts:
+    # Counts per (day, column) in a dense array, growing to cover every day seen
+
+    def __init__(self, width=MAX_PAGE_TYPES):
+        self.first_day = None
+        self.counts = np.zeros((0, width), dtype=np.int64)
+
+    def add(self, days, columns, weights=1):
+        if not len(days):
+            return
+        low, high = int(days.min()), int(days.max())
+        if self.first_day is None:
+            self.first_day = low
+        if low < self.first_day or high >= self.first_day + len(self.counts):
+            first_day = min(low, self.first_day)
+            counts = np.zeros((max(high, self.first_day + len(self.counts) - 1) - first_day + 1,
+                               self.counts.shape[1]), dtype=np.int64)
+            counts[self.first_day - first_day:self.first_day - first_day + len(self.counts)] = self.counts
+            self.first_day, self.counts = first_day, counts
+        np.add.at(self.counts, (days - self.first_day, columns), weights)
+
+    def days(self):
+        first_day = self.first_day or 0
+        return pd.DatetimeIndex(((first_day + np.arange(len(self.counts))) * NS_PER_DAY).view('M8[ns]'),
+                                name='event_day')
+
+
+class LiveAggregates:
+    # Running session metrics updated in place from batches of events, which may arrive out of time order; events
+    # with equal timestamps are ordered by arrival, so a different arrival order can change first and last pages.
+    # Events without a date count towards the funnel and rows only, and are counted in undated_rows
+    # Each batch costs time proportional to its own size: sessions are summarised within the batch, merged into
+    # per-session arrays, and the counts derived from the sessions they touch are taken out and put back
+
+    def __init__(self):
+        self.funnel = StreamingFunnel()
+        self.session_ids = UserDictionary()
+        self.page_types = UserDictionary()
+        self.rows = 0
+        self.undated_rows = 0
+        self.version = 0
+        self.last_event = None
+        self._lock = threading.RLock()
+
+        # Per-session state, indexed by dense session id
+        self.first_ts = np.zeros(0, dtype=np.int64)
+        self.last_ts = np.zeros(0, dtype=np.int64)
+        self.first_page = np.zeros(0, dtype=np.int64)
+        self.last_page = np.zeros(0, dtype=np.int64)
+        self.event_count = np.zeros(0, dtype=np.int64)
+        self.user = np.zeros(0, dtype=object)
+
+        # Counts per page type, and per day and page type
+        self.views = np.zeros(MAX_PAGE_TYPES, dtype=np.int64)
+        self.exits = np.zeros(MAX_PAGE_TYPES, dtype=np.int64)
+        self.bounces = np.zeros(MAX_PAGE_TYPES, dtype=np.int64)
+        self.page_sessions = np.zeros(MAX_PAGE_TYPES, dtype=np.int64)
+        self.views_by_day = DayCounts()
+        self.exits_by_day = DayCounts()
+        self.bounces_by_day = DayCounts()
+        self.sessions_by_day = DayCounts()
+        self.events_by_day = DayCounts(width=1)
+        self._page_session_keys = KeySet()
+        self._day_page_session_keys = KeySet()
+
+    def _grow(self, size):
+        if size <= len(self.first_ts):
+            return
+        capacity = max(size, 2 * len(self.first_ts), 1024)
+        for name in ('first_ts', 'last_ts', 'first_page', 'last_page', 'event_count', 'user'):
+            current = getattr(self, name)
+            grown = np.zeros(capacity, dtype=current.dtype)
+            grown[:len(current)] = current
+            setattr(self, name, grown)
+
+    def _count_sessions(self, ids, sign):
+        # Add (sign 1) or take out (sign -1) the exit and bounce counts of these sessions
+        np.add.at(self.exits, self.last_page[ids], sign)
+        self.exits_by_day.add(self.last_ts[ids] // NS_PER_DAY, self.last_page[ids], sign)
+        bounced = ids[self.event_count[ids] == 1]
+        np.add.at(self.bounces, self.first_page[bounced], sign)
+        self.bounces_by_day.add(self.first_ts[bounced] // NS_PER_DAY, self.first_page[bounced], sign)
+
+    def update(self, batch):
+        # batch is an event frame as parse_events or load_events return it
+        with self._lock:
+            # Checked before anything changes, so a rejected batch leaves the aggregates as they were
+            new_page_types = [page_type for page_type in batch['page_type'].dropna().unique()
+                              if page_type not in self.page_types]
+            if len(self.page_types) + len(new_page_types) > MAX_PAGE_TYPES:
+                raise ValueError(f'More than {MAX_PAGE_TYPES} page types')
+
+            self.funnel.update(batch)
+            self.rows += len(batch)
+            self.version += 1
+            # A missing date would land on the day of int64-min
+            dated = batch['event_date'].notna()
+            self.undated_rows += int((~dated).sum())
+            batch = batch[dated]
+            self.events_by_day.add(batch['event_date'].to_numpy().view(np.int64) // NS_PER_DAY,
+                                   np.zeros(len(batch), dtype=np.int64))
+            if len(batch):
+                last_event = batch['event_date'].max()
+                self.last_event = last_event if self.last_event is None else max(self.last_event, last_event)
+
+            # Page and session metrics leave out events without either
+            batch = batch[batch['session'].notna() & batch['page_type'].notna()]
+            if not len(batch):
+                return
+            pages = self.page_types.encode(batch['page_type'].astype(object))
+            days = batch['event_date'].to_numpy().view(np.int64) // NS_PER_DAY
+            sessions = self.session_ids.encode(batch['session'])
+
+            # Page views, and sessions seeing each page type (per day) for the first time
+            np.add.at(self.views, pages, 1)
+            self.views_by_day.add(days, pages)
+            new = self._page_session_keys.add(sessions * MAX_PAGE_TYPES + pages)
+            np.add.at(self.page_sessions, pages[new], 1)
+            new = self._day_page_session_keys.add((sessions * 2 ** 16 + (days & 0xFFFF)) * MAX_PAGE_TYPES + pages)
+            self.sessions_by_day.add(days[new], pages[new])
+
+            # Session state: summarise the batch, take the sessions it continues out of the counts, merge, put back
+            summary = build_session_summary(batch)
+            ids = self.session_ids.encode(pd.Series(summary.index))
+            self._grow(len(self.session_ids))
+            seen = self.event_count[ids] > 0
+            self._count_sessions(ids[seen], -1)
+
+            start = summary['start'].to_numpy().view(np.int64)
+            end = summary['end'].to_numpy().view(np.int64)
+            first_page = self.page_types.encode(summary['first_page'].astype(object))
+            last_page = self.page_types.encode(summary['last_page'].astype(object))
+            # Earlier starts replace the entry page; later or equal ends replace the exit page, as a stable sort
+            # of the events in arrival order would
+            earlier = ~seen | (start < self.first_ts[ids])
+            later = ~seen | (end >= self.last_ts[ids])
+            self.first_ts[ids[earlier]] = start[earlier]
+            self.first_page[ids[earlier]] = first_page[earlier]
+            self.last_ts[ids[later]] = end[later]
+            self.last_page[ids[later]] = last_page[later]
+            self.user[ids[~seen]] = summary['user'].to_numpy()[~seen]
+            self.event_count[ids] += summary['event_count'].to_numpy()
+            self._count_sessions(ids, 1)
+
+    def _pages(self, codes):
+        # Page type codes to a categorical with sorted categories, as loaded events have
+        names = np.array(self.page_types.values(), dtype=object)
+        return pd.Categorical(names[codes], categories=sorted(names))
+
+    def funnel_table(self):
+        with self._lock:
+            return self.funnel.funnel_table()
+
+    def session_summary(self):
+        # Same frame as build_session_summary over every event received so far
+        with self._lock:
+            n = len(self.session_ids)
+            sessions = pd.DataFrame({
+                'user': self.user[:n],
+                'first_page': self._pages(self.first_page[:n]),
+                'last_page': self._pages(self.last_page[:n]),
+                'event_count': self.event_count[:n],
+                'start': self.first_ts[:n].view('M8[ns]'),
+                'end': self.last_ts[:n].view('M8[ns]'),
+            }, index=pd.Index(self.session_ids.values(), name='session'))
+        sessions['day'] = sessions['start'].dt.normalize()
+        return sessions.sort_index()
+
+    def exit_rates(self):
+        with self._lock:
+            pages = np.flatnonzero(self.views)
+            rates = np.where(self.exits[pages] > 0, self.exits[pages] / self.views[pages] * 100, np.nan)
+            return pd.DataFrame({'Page Type': self._pages(pages), 'Exit Rate (%)': rates})
+
+    def page_type_counts(self):
+        with self._lock:
+            pages = np.flatnonzero(self.views)
+            counts = pd.Series(self.views[pages], index=pd.CategoricalIndex(self._pages(pages), name='page_type'),
+                               name='count')
+        return counts.sort_values(ascending=False)
+
+    def bounce_rates(self):
+        with self._lock:
+            pages = np.flatnonzero(self.page_sessions)
+            rates = pd.DataFrame({'page_type': self._pages(pages), 'total_sessions': self.page_sessions[pages],
+                                  'bounced_sessions': self.bounces[pages]})
+        rates['bounce_rate'] = rates['bounced_sessions'] / rates['total_sessions'] * 100
+        return rates
+
+    def daily_bounce_rates(self):
+        with self._lock:
+            days, pages = np.nonzero(self.sessions_by_day.counts)
+            rates = pd.DataFrame({
+                'event_day': self.sessions_by_day.days()[days],
+                'page_type': self._pages(pages),
+                'total_sessions': self.sessions_by_day.counts[days, pages],
+                'bounced_sessions': self._at(self.bounces_by_day, self.sessions_by_day.days()[days], pages),
+            })
+        rates['bounce_rate'] = rates['bounced_sessions'] / rates['total_sessions'] * 100
+        return rates
+
+    @staticmethod
+    def _at(counts, days, columns):
+        # Counts of (day, column) cells, zero outside the days seen
+        rows = (days.to_numpy().view(np.int64) // NS_PER_DAY) - (counts.first_day or 0)
+        inside = (rows >= 0) & (rows < len(counts.counts))
+        values = np.zeros(len(rows), dtype=np.int64)
+        values[inside] = counts.counts[rows[inside], columns[inside]]
+        return values
+
+    def daily_interactions(self):
+        with self._lock:
+            counts = pd.Series(self.events_by_day.counts[:, 0], index=self.events_by_day.days())
+        counts.index = pd.DatetimeIndex(counts.index, freq='D', name='event_date')
+        return counts
+
+    def exit_rate_over_time(self):
+        with self._lock:
+            days, pages = np.nonzero(self.views_by_day.counts)
+            day_index = self.views_by_day.days()[days]
+            exits = self._at(self.exits_by_day, day_index, pages)
+            views = self.views_by_day.counts[days, pages]
+            rates = pd.Series(np.where(exits > 0, exits / views * 100, np.nan),
+                              index=pd.MultiIndex.from_arrays([day_index, self._pages(pages)],
+                                                              names=['event_day', 'page_type']))
+        return rates.unstack(level=1)
+
+
+class LiveIngest:
+    # Tails a JSONL path on a background thread and feeds the new events into LiveAggregates
+
+    def __init__(self, path, poll_seconds=LIVE_POLL_SECONDS):
+        self.tail = JsonlTail(path)
+        self.aggregates = LiveAggregates()
+        self.poll_seconds = poll_seconds
+        self.last_poll = None
+        self.error = None
+        self.rejected_lines = 0
+        self._thread = None
+
+    def poll(self):
+        # Ingest what was appended since the last poll; returns the number of new events
+        lines = self.tail.read()
+        self.last_poll = time.time()
+        if not lines:
+            return 0
+        batch, rejected, error = parse_valid_events(lines)
+        if rejected:
+            # Malformed lines are dropped and reported; the valid events read with them are kept
+            self.rejected_lines += rejected
+            self.error = ValueError(f'Skipped {rejected} malformed lines ({self.rejected_lines} in all): {error}')
+        if not len(batch):
+            return 0
+        self.aggregates.update(batch)
+        return len(batch)
+
+    def _run(self):
+        while True:
+            try:
+                # Keep reading without pausing while a backlog is being caught up
+                if not self.poll():
+                    time.sleep(self.poll_seconds)
+            except Exception as error:
+                # Keep tailing: the failed read's events are lost, the error is reported and later appends go on
+                self.error = error
+                time.sleep(self.poll_seconds)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='autodoc-live-ingest', daemon=True)
+            self._thread.start()
+        return self
+
+
+# One ingest per tailed path in the process, shared by every dashboard session
+_ingests = {}
+_ingests_lock = threading.Lock()
+
+
+def live_ingest(path):
+    with _ingests_lock:
+        if path not in _ingests:
+            _ingests[path] = LiveIngest(path).start()
+        return _ingests[path]
+
+
+def replay(source_path, target_path, rate, batch_rows=1_000):
+    # Append the events of a file to a JSONL file at about rate events per second, to try the live mode
+    for batch in iter_event_batches(source_path, batch_rows=batch_rows):
+        frame = batch.to_pandas()
+        frame['event_date'] = frame['event_date'].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+        with open(target_path, 'a') as target:
+            target.write(frame.to_json(orient='records', lines=True))
+        time.sleep(len(frame) / rate)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay an event file as JSON lines, for the live dashboard mode')
+    parser.add_argument('source', help='event file (CSV or Parquet)')
+    parser.add_argument('target', help='JSONL file to append to')
+    parser.add_argument('--rate', type=float, default=1000, help='events per second')
+    args = parser.parse_args()
+    replay(args.source, args.target, args.rate)
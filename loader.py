@@ -0,0 +1,170 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+# Declared schema of the event log: low-cardinality columns are dictionary encoded (categoricals in pandas)
+# and event_date is kept as int64 nanoseconds (datetime64[ns])
+EVENT_SCHEMA = pa.schema([
+    ('user', pa.string()),
+    ('session', pa.string()),
+    ('page_type', pa.dictionary(pa.int32(), pa.string())),
+    ('event_type', pa.dictionary(pa.int32(), pa.string())),
+    ('product', pa.string()),
+    ('event_date', pa.timestamp('ns')),
+])
+
+
+# High-cardinality string columns held as int32 codes into one sorted dictionary per column once loaded,
+# instead of one Python string object per event
+ENCODED_COLUMNS = ('user', 'session', 'product')
+
+# Bytes of CSV parsed per streamed batch
+CSV_BLOCK_SIZE = 64 * 1024 ** 2
+
+# Rows per batch when streaming Parquet
+DEFAULT_BATCH_ROWS = 1_000_000
+
+
+def _csv_convert_options(columns=None):
+    # Parse straight into the declared types, so nothing is inferred and timestamps are parsed once
+    return pv.ConvertOptions(
+        column_types={field.name: field.type for field in EVENT_SCHEMA},
+        include_columns=columns or EVENT_SCHEMA.names,
+        strings_can_be_null=True,
+    )
+
+
+def read_csv_table(csv_path):
+    table = pv.read_csv(csv_path, convert_options=_csv_convert_options())
+    return table.cast(EVENT_SCHEMA)
+
+
+def open_csv_batches(csv_path, columns=None):
+    # Incremental CSV reader: only one block of the file is held in memory at a time
+    return pv.open_csv(csv_path, read_options=pv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+                       convert_options=_csv_convert_options(columns))
+
+
+def parquet_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+
+def convert_csv_to_parquet(csv_path, parquet_path=None):
+    # Convert once: an existing Parquet file at least as new as the CSV is reused as is
+    parquet_path = parquet_path or parquet_path_for(csv_path)
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        return parquet_path
+
+    # Stream the CSV into the Parquet file block by block, so files larger than memory convert too.
+    # Write to a temporary name first so a concurrent reader never sees a partial file
+    tmp_path = f'{parquet_path}.{os.getpid()}.tmp'
+    try:
+        with pq.ParquetWriter(tmp_path, EVENT_SCHEMA) as writer:
+            for batch in open_csv_batches(csv_path):
+                writer.write_table(pa.Table.from_batches([batch]).cast(EVENT_SCHEMA))
+    except BaseException:
+        # A block that fails to parse leaves a partial file behind
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, parquet_path)
+    return parquet_path
+
+
+def parquet_is_fresh(csv_path):
+    parquet_path = parquet_path_for(csv_path)
+    return os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)
+
+
+def read_events_table(path, columns=None):
+    # Accept either the source CSV (converted on first use) or the Parquet file itself
+    if path.endswith('.csv'):
+        try:
+            path = convert_csv_to_parquet(path)
+        except OSError:
+            # Read-only filesystem: fall back to the typed CSV reader
+            table = read_csv_table(path)
+            return table.select(columns) if columns else table
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+
+def iter_event_batches(path, columns=None, batch_rows=DEFAULT_BATCH_ROWS):
+    # Yield the event log as Arrow record batches without ever holding all of it in memory
+    if path.endswith('.csv'):
+        if not parquet_is_fresh(path):
+            yield from open_csv_batches(path, columns)
+            return
+        path = parquet_path_for(path)
+    yield from pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_rows, columns=columns)
+
+
+def encode_column(column):
+    # Arrow string column -> pandas categorical with int32 codes (-1 for missing) and sorted categories that stay
+    # Arrow-backed strings, so every distinct value is stored once and no Python string is created per event
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(pa.string())
+    encoded = column.combine_chunks().dictionary_encode()
+    order = pc.sort_indices(encoded.dictionary).to_numpy()
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+    indices = encoded.indices
+    codes = rank[pc.fill_null(indices, 0).to_numpy(zero_copy_only=False)] if len(rank) \
+        else np.zeros(len(indices), dtype=np.int32)
+    if indices.null_count:
+        codes[pc.is_null(indices).to_numpy(zero_copy_only=False)] = -1
+    return categorical_from_codes(codes, category_dtype(encoded.dictionary.take(pa.array(order))))
+
+
+def category_dtype(categories):
+    # Categorical dtype over an Arrow string array of distinct categories, without copying the strings
+    # (memory-mapped ones included)
+    dtype = pd.CategoricalDtype(pd.Index(pd.arrays.ArrowStringArray(pa.chunked_array([categories]))))
+    # Checking the categories are unique leaves a hash table of every category as a Python string cached on them,
+    # which would live as long as the frame: drop it, lookups by value are rare and rebuild it when needed
+    dtype.categories._cache.pop('_engine', None)
+    return dtype
+
+
+def categorical_from_codes(codes, dtype):
+    # Categorical on the codes as they are, which must be valid for the dtype
+    values = pd.Categorical.from_codes(codes, dtype=dtype, validate=False)
+    values.categories._cache.pop('_engine', None)
+    return values
+
+
+def value_codes(values, sort=False):
+    # Integer code per value (-1 for missing) and the distinct values the codes stand for. Categoricals hand out
+    # their own codes without hashing anything; they follow the category order, which is sorted for every
+    # categorical loaded here or made with astype('category')
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values, sort=sort)
+
+
+def table_to_events(table):
+    # Convert an Arrow table of events to the pandas frame the compute functions expect.
+    # Encoded columns bypass to_pandas so their strings are never materialized as Python objects
+    encoded = {name: encode_column(table.column(name)) for name in ENCODED_COLUMNS if name in table.column_names}
+    names = table.column_names
+    data = table.drop(list(encoded)).to_pandas(split_blocks=True, self_destruct=True)
+    for name, values in encoded.items():
+        data.insert(names.index(name), name, values)
+
+    # Keep categories in a stable, sorted order regardless of which value the file happened to start with
+    for column in data.select_dtypes('category'):
+        if column not in encoded:
+            data[column] = data[column].cat.reorder_categories(sorted(data[column].cat.categories))
+
+    # Calendar days, hours and weekdays are derived from the int64 timestamps when needed (see dwell.py)
+    # rather than stored as extra columns
+    return data
+
+
+def load_events(path, columns=None):
+    # Load the event log with its declared dtypes; every string column arrives as a categorical
+    return table_to_events(read_events_table(path, columns=columns))
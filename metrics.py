@@ -0,0 +1,350 @@
+import numpy as np
+import pandas as pd
+
+from cohorts import cohort_retention
+from dwell import event_days, event_hours, event_weekdays, page_durations
+from funnel import build_approx_funnel_table, build_funnel_table, build_sampled_funnel_table, funnel_stage_masks, \
+    funnel_user_sketches, ordered_funnel_counts, ordered_stage_users
+from loader import value_codes
+from paths import encode_session_paths
+from sampling import event_users, ratio_estimates, total_estimates
+from sessions import build_session_summary, session_event_durations
+from sketches import DEFAULT_PRECISION, approx_nunique_by
+from trends import fit_trends
+
+# Every metric the dashboard shows, as pure functions of the event frame: no Streamlit or plotting imports here,
+# so they also run headless (see report.py)
+
+def display_visits(data):
+    # Number of distinct users reaching each funnel stage
+    user_counts = [data.loc[mask, 'user'].nunique() for mask in funnel_stage_masks(data)]
+
+    funnel_df = build_funnel_table(user_counts, with_conversion_rates=False)
+    return funnel_df
+
+
+def calculate_funnel_user_counts(data, approximate=False, precision=DEFAULT_PRECISION, sample_rate=None):
+    # With sample_rate, data is a user sample (see sampling.py) and the counts are scaled estimates
+    if approximate:
+        # HyperLogLog estimates of the users in each stage, with their error bounds
+        return build_approx_funnel_table(funnel_user_sketches(data, precision))
+
+    if sample_rate is not None:
+        # Distinct sampled users of every stage, so the overlap of consecutive stages enters the rate errors
+        users = event_users(data)
+        return build_sampled_funnel_table([np.unique(users[mask & (users >= 0)]) for mask in funnel_stage_masks(data)],
+                                          sample_rate)
+
+    # Number of distinct users reaching each funnel stage
+    user_counts = [data.loc[mask, 'user'].nunique() for mask in funnel_stage_masks(data)]
+
+    # Calculate the conversion rates between each stage of the funnel
+    funnel_df = build_funnel_table(user_counts)
+
+    return funnel_df
+
+
+def compute_ordered_funnel(data, level='user', window=None, sample_rate=None):
+    # Users (or sessions) reaching each stage only after the earlier ones, in time order; window (e.g. '1D')
+    # limits the time from their first event to each stage. With sample_rate the counts are scaled estimates
+    unit = 'Users' if level == 'user' else 'Sessions'
+    if sample_rate is not None:
+        return build_sampled_funnel_table(ordered_stage_users(data, level, window), sample_rate, unit=unit)
+    counts = ordered_funnel_counts(data, level, window)
+    return build_funnel_table(counts, unit=unit)
+
+
+def compute_avg_time_by_average_user(data, method='span'):
+    # Ensure event_date is a datetime object, without modifying the caller's frame
+    if not pd.api.types.is_datetime64_any_dtype(data['event_date']):
+        data = data.assign(event_date=pd.to_datetime(data['event_date']))
+
+    # Calculate total duration spent on each page type for each user per day
+    total_duration_per_user_day = page_durations(data, method)
+
+    # Sum durations across all users for each page type per day
+    total_duration_per_page_day = total_duration_per_user_day.groupby(level=['page_type', 'event_day'],
+                                                                      observed=True).sum()
+    # Count unique users per page type per day
+    user_counts_per_page_day = data['user'].groupby([data['page_type'], event_days(data)], observed=True).nunique()
+    # Calculate the average duration by dividing total duration by user count
+    avg_duration_per_average_user = total_duration_per_page_day / user_counts_per_page_day
+    # Convert Timedelta to total seconds and then to minutes
+    avg_duration_in_minutes = avg_duration_per_average_user.dt.total_seconds() / 60
+    # Create a new DataFrame with the correct column name
+    avg_duration_df = avg_duration_in_minutes.reset_index(name='duration')
+
+    return avg_duration_df
+
+
+def prepare_data_for_pivot(df):
+    # Check if there are any duplicates
+    if df.duplicated(subset=['event_day', 'page_type']).any():
+        # Resolve duplicates by taking the mean
+        df = df.groupby(['event_day', 'page_type'], observed=True).mean().reset_index()
+    return df
+
+
+def compute_duration_trendlines(avg_duration_df, method='polynomial', order=3, window=7):
+    # Ensure 'event_day' is a datetime type for fitting
+    if not pd.api.types.is_datetime64_any_dtype(avg_duration_df['event_day']):
+        avg_duration_df = avg_duration_df.assign(event_day=pd.to_datetime(avg_duration_df['event_day']))
+
+    # One column per page type; days missing for a page type stay NaN and are left out of its fit
+    pivot_df = avg_duration_df.pivot(index="event_day", columns="page_type", values="duration")
+
+    # Fitted values with their 95% confidence band, for all page types at once
+    trendlines = fit_trends(pivot_df, method=method, order=order, window=window)
+
+    return trendlines
+
+
+def compute_common_user_journeys(data, top_n=10):
+    # Most common page sequences of sessions, counted over integer-encoded paths
+    common_journeys = encode_session_paths(data).top_paths(top_n).set_index('page_sequence')['count']
+
+    return common_journeys
+
+
+def compute_exit_rates(data, sessions=None, page_views=None, sample_rate=None):
+    if sessions is None:
+        sessions = build_session_summary(data)
+
+    if sample_rate is not None:
+        # Exits over views per page from a user sample, with the error bound of every rate
+        rates = ratio_estimates((sessions['last_page'], value_codes(sessions['user'])[0], 1),
+                                (data['page_type'], event_users(data), 1), sample_rate) * 100
+        return pd.DataFrame({'Page Type': rates.index, 'Exit Rate (%)': rates['estimate'].to_numpy(),
+                             'Exit Rate Error (±)': rates['error'].to_numpy()})
+
+    # Count the number of exits for each page (the last page viewed in each session)
+    exit_counts = sessions['last_page'].value_counts()
+
+    # Count the total views for each page, unless they come pre-aggregated (e.g. from the event cube)
+    if page_views is None:
+        page_views = data['page_type'].value_counts()
+
+    # Calculate the exit rate for each page; page types without views (e.g. filtered out) have none
+    exit_rates = (exit_counts / page_views) * 100
+    exit_rates = exit_rates[exit_rates.index.isin(page_views.index[page_views > 0])]
+
+    # Convert the series to a DataFrame for table view
+    exit_rate_df = exit_rates.reset_index()
+    exit_rate_df.columns = ['Page Type', 'Exit Rate (%)']
+
+    return exit_rate_df
+
+
+def compute_products_added_before_exit(data, top_n=10):
+    # Rows of 'add_to_cart' events with a product, then the last of them per session (by session code, so no
+    # filtered copy of the frame is made)
+    session_codes = value_codes(data['session'])[0]
+    rows = np.flatnonzero((data['event_type'] == 'add_to_cart').to_numpy() & data['product'].notna().to_numpy() &
+                          (session_codes >= 0))[::-1]
+    last_rows = rows[np.unique(session_codes[rows], return_index=True)[1]]
+
+    # Count the occurrences of each product in these interactions
+    product_counts = data['product'].iloc[last_rows].value_counts().head(top_n)
+
+    # Plain product ids: a categorical index would carry every product of the dataset along
+    product_counts.index = product_counts.index.astype(object)
+
+    return product_counts
+
+
+def compute_daily_interactions(data):
+    # Resample the data by day and count the interactions
+    daily_counts = data.resample('D', on='event_date').size()
+
+    return daily_counts
+
+
+def compute_interactions_heatmap(data):
+    # Hour and day of week of every event, used as group keys without adding columns to data
+    hour = event_hours(data)
+    dayofweek = event_weekdays(data)
+
+    # Group by day of week and hour to get counts
+    heatmap_data = data.groupby([dayofweek, hour]).size().unstack(fill_value=0)
+
+    return heatmap_data
+
+
+def compute_page_type_counts(data):
+    # Calculate the value counts for the 'page_type' column
+    page_type_counts = data['page_type'].value_counts()
+
+    return page_type_counts
+
+
+def compute_exit_rate_over_time(data, sessions=None):
+    if sessions is None:
+        sessions = build_session_summary(data)
+
+    # 1. The exit page of each session is its last page, on the day of its last event
+    exit_days = sessions['end'].dt.normalize().rename('event_day')
+
+    # 2. Count exits by day for each page type
+    exits_by_day = sessions.groupby([exit_days, sessions['last_page'].rename('page_type')], observed=True).size()
+
+    # 3. Count page views by day for each page type
+    views_by_day = data.groupby([event_days(data), data['page_type']], observed=True).size()
+
+    # 4. Calculate exit rate by day for each page type
+    exit_rate_by_day = (exits_by_day / views_by_day).unstack(level=1) * 100
+
+    return exit_rate_by_day
+
+
+def compute_top_user_paths(data, top_n=20, sample_rate=None):
+    # Encode the page sequences of purchase sessions (sessions with an order event)
+    purchase_paths = encode_session_paths(data, session_filter=(data['event_type'] == 'order').to_numpy())
+
+    # Select the top N paths and their counts
+    top_paths = purchase_paths.top_paths(top_n)[['page_sequence', 'count']]
+
+    if sample_rate is not None:
+        # Sessions per path scaled from a user sample, with their error bounds; every session counts for its user
+        path_codes, top = purchase_paths.top_path_codes(top_n)
+        session_users = event_users(data)[purchase_paths.rows[purchase_paths.starts]]
+        counts = total_estimates(path_codes, session_users, 1, sample_rate).reindex(top)
+        top_paths['count'] = counts['estimate'].round().astype(int).to_numpy()
+        top_paths['count_error'] = counts['error'].round().to_numpy()
+
+    return top_paths
+
+
+def compute_average_duration_by_page(data, sample_rate=None):
+    # Duration of each event's session, to weight page types by their events
+    event_duration = pd.Series(session_event_durations(data), index=data.index)
+
+    if sample_rate is not None:
+        # Event-weighted mean per page from a user sample, with the error bound of every mean
+        known = event_duration.notna().to_numpy()
+        users = event_users(data)
+        durations = ratio_estimates((data['page_type'], users, event_duration.fillna(0).to_numpy()),
+                                    (data['page_type'], users, known), sample_rate)
+        return pd.DataFrame({'Page Type': durations.index,
+                             'Average Duration (seconds)': durations['estimate'].to_numpy(),
+                             'Average Duration Error (±)': durations['error'].to_numpy()})
+
+    # Calculate average duration by page type
+    average_duration_by_page = event_duration.groupby(data['page_type'], observed=True).mean()
+
+    # Convert the Series to a DataFrame
+    average_duration_by_page_df = average_duration_by_page.reset_index()
+
+    # Rename columns for better clarity
+    average_duration_by_page_df.columns = ['Page Type', 'Average Duration (seconds)']
+
+    return average_duration_by_page_df
+
+
+def compute_bounce_rates(data, sessions=None, approximate=False, precision=DEFAULT_PRECISION, sample_rate=None):
+    if sessions is None:
+        sessions = build_session_summary(data)
+
+    # Identify sessions with only one event
+    single_event_sessions = sessions[sessions['event_count'] == 1]
+
+    if sample_rate is not None:
+        return sampled_bounce_rates(data, single_event_sessions, sample_rate)
+
+    # Count the bounced sessions per page type
+    bounce_sessions_per_page = single_event_sessions.groupby('first_page', observed=True).size().rename_axis(
+        'page_type').reset_index(name='bounced_sessions')
+
+    # Merge with total sessions per page type to calculate bounce rate
+    if approximate:
+        total_sessions_per_page = approx_nunique_by(data['page_type'], data['session'], precision,
+                                                    name='total_sessions').reset_index()
+    else:
+        total_sessions_per_page = data.groupby('page_type', observed=True).session.nunique().reset_index(
+            name='total_sessions')
+    page_bounce_rates = pd.merge(total_sessions_per_page, bounce_sessions_per_page,
+                                 on='page_type', how='left').fillna({'bounced_sessions': 0})
+    page_bounce_rates['bounce_rate'] = (page_bounce_rates['bounced_sessions'] /
+                                        page_bounce_rates['total_sessions']) * 100
+    if approximate:
+        page_bounce_rates['bounce_rate_error'] = (page_bounce_rates['bounce_rate'] *
+                                                  page_bounce_rates['total_sessions_error'] /
+                                                  page_bounce_rates['total_sessions'])
+
+    return page_bounce_rates
+
+
+def sampled_bounce_rates(data, single_event_sessions, rate):
+    # Bounce rates from a user sample: sessions per page (each session once per page type it shows) and bounced
+    # sessions scaled by 1 / rate, and their ratio, each with its error bound
+    session_codes = value_codes(data['session'])[0]
+    page_codes = value_codes(data['page_type'])[0].astype(np.int64)
+    known = (session_codes >= 0) & (page_codes >= 0)
+    pair_rows = np.flatnonzero(known)[np.unique(session_codes[known] * (page_codes.max(initial=0) + 1) +
+                                                page_codes[known], return_index=True)[1]]
+    page_sessions = (data['page_type'].to_numpy()[pair_rows], event_users(data)[pair_rows], 1)
+    bounced = (single_event_sessions['first_page'], value_codes(single_event_sessions['user'])[0], 1)
+
+    totals = total_estimates(*page_sessions, rate)
+    bounced_totals = total_estimates(*bounced, rate).reindex(totals.index, fill_value=0)
+    rates = ratio_estimates(bounced, page_sessions, rate) * 100
+    return pd.DataFrame({
+        'page_type': totals.index,
+        'total_sessions': totals['estimate'].round().to_numpy(),
+        'bounced_sessions': bounced_totals['estimate'].round().to_numpy(),
+        'bounce_rate': rates['estimate'].reindex(totals.index).to_numpy(),
+        'total_sessions_error': totals['error'].to_numpy(),
+        'bounced_sessions_error': bounced_totals['error'].to_numpy(),
+        'bounce_rate_error': rates['error'].reindex(totals.index).to_numpy(),
+    })
+
+
+def compute_daily_bounce_rates(data, sessions=None, approximate=False, precision=DEFAULT_PRECISION):
+    if sessions is None:
+        sessions = build_session_summary(data)
+
+    # Identify sessions with only one event
+    single_event_sessions = sessions[sessions['event_count'] == 1]
+
+    # Group by event_day and page_type to count sessions
+    if approximate:
+        daily_page_sessions = approx_nunique_by([event_days(data), data['page_type']], data['session'], precision,
+                                                name='total_sessions').reset_index()
+    else:
+        daily_page_sessions = data['session'].groupby([event_days(data), data['page_type']],
+                                                      observed=True).nunique().reset_index(name='total_sessions')
+
+    # Count single-event sessions by event_day and page_type
+    daily_single_event_page_sessions = single_event_sessions.groupby(['day', 'first_page'], observed=True).size().rename_axis(
+        ['event_day', 'page_type']).reset_index(name='bounced_sessions')
+
+    # Merge based on event_day and page_type, then calculate bounce rate
+    daily_page_bounce_rates = pd.merge(daily_page_sessions, daily_single_event_page_sessions,
+                                       on=['event_day', 'page_type'], how='left').fillna({'bounced_sessions': 0})
+    daily_page_bounce_rates['bounce_rate'] = (daily_page_bounce_rates['bounced_sessions'] /
+                                              daily_page_bounce_rates['total_sessions']) * 100
+    if approximate:
+        daily_page_bounce_rates['bounce_rate_error'] = (daily_page_bounce_rates['bounce_rate'] *
+                                                        daily_page_bounce_rates['total_sessions_error'] /
+                                                        daily_page_bounce_rates['total_sessions'])
+
+    return daily_page_bounce_rates
+
+
+def compute_loyal_users(data, top_n=20):
+    # Exact only: a sketch per user would take more memory than the counts it estimates
+
+    # Calculate the number of sessions per user
+    user_visits = data.groupby('user', observed=True).session.nunique().sort_values(ascending=False)
+
+    # Top N users with the most visits
+    loyal_users_ranked = user_visits.head(top_n)
+
+    # Plain user ids: a categorical index would carry every user of the dataset along
+    loyal_users_ranked.index = loyal_users_ranked.index.astype(object)
+
+    return loyal_users_ranked
+
+
+def compute_cohort_retention(data, period='day'):
+    # Users of each first-visit cohort (day or week) still visiting in every later period
+    return cohort_retention(data['user'], data['event_date'], period)
@@ -0,0 +1,189 @@
+import argparse
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from dwell import event_days
+from funnel import build_funnel_table, funnel_stage_masks
+from loader import load_events, read_events_table, table_to_events
+from paths import encode_session_paths
+from sessions import build_session_summary, session_event_durations
+from sketches import hash_values
+
+# Number of worker processes; defaults to every available core
+DEFAULT_WORKERS = int(os.environ.get('AUTODOC_WORKERS', 0)) or os.cpu_count() or 1
+
+# Every user's events land in exactly one partition, and so do all of their sessions. Each partition therefore
+# computes complete session summaries, and its per-page counts, distinct session/user counts and per-user counts
+# are disjoint from the other partitions': merging is an exact sum, with min/max for the event date range
+
+
+def user_partitions(users, n_partitions):
+    # Partition number of every event, from a hash of its user that is stable across processes
+    return (hash_values(users) % np.uint64(n_partitions)).astype(np.intp)
+
+
+def write_partitions(path, n_partitions, directory):
+    # Split the event table by user once, into an uncompressed Arrow file per partition that its worker
+    # memory-maps: the source is read (and a CSV converted) and its users hashed in this process only
+    table = read_events_table(path)
+    # Hash every distinct user once; events without a user all go to the first partition
+    users = table.column('user').combine_chunks().dictionary_encode()
+    codes = users.indices.fill_null(len(users.dictionary)).to_numpy()
+    partition = np.append(user_partitions(users.dictionary.to_pandas(), n_partitions), 0)[codes]
+
+    # Rows of each partition in their original order
+    order = np.argsort(partition, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(partition, minlength=n_partitions))])
+    paths = []
+    for number in range(n_partitions):
+        partition_path = os.path.join(directory, f'partition.{number}.arrow')
+        with pa.OSFile(partition_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table.take(pa.array(order[bounds[number]:bounds[number + 1]])))
+        paths.append(partition_path)
+    return paths
+
+
+def load_partition(partition_path):
+    return table_to_events(pa.ipc.open_file(pa.memory_map(partition_path)).read_all())
+
+
+def top_counts(counts, top_n):
+    # The top_n largest of value_counts, plus every value tied with the last one, so the merged top users do not
+    # depend on how each partition broke its ties
+    if len(counts) <= top_n:
+        return counts
+    return counts[counts >= counts.iloc[top_n - 1]]
+
+
+def partition_aggregates(data, top_n=20):
+    # Mergeable partial results of the session-level metrics over one partition
+    sessions = build_session_summary(data)
+    day = event_days(data)
+    page = data['page_type']
+    single_event_sessions = sessions[sessions['event_count'] == 1]
+    event_duration = pd.Series(session_event_durations(data), index=data.index)
+    purchase_paths = encode_session_paths(data, session_filter=(data['event_type'] == 'order').to_numpy())
+    return {
+        'funnel_users': np.array([data.loc[mask, 'user'].nunique() for mask in funnel_stage_masks(data)]),
+        'page_views': page.value_counts(),
+        'exits': sessions['last_page'].value_counts(),
+        'page_sessions': data['session'].groupby(page, observed=True).nunique(),
+        'bounced_sessions': single_event_sessions.groupby('first_page', observed=True).size().rename_axis(
+            'page_type'),
+        'views_by_day': data.groupby([day, page], observed=True).size(),
+        'exits_by_day': sessions.groupby([sessions['end'].dt.normalize().rename('event_day'),
+                                          sessions['last_page'].rename('page_type')], observed=True).size(),
+        'sessions_by_day': data['session'].groupby([day, page], observed=True).nunique(),
+        'bounced_by_day': single_event_sessions.groupby(['day', 'first_page'], observed=True).size().rename_axis(
+            ['event_day', 'page_type']),
+        'duration_sum': event_duration.groupby(page, observed=True).sum(),
+        'duration_count': event_duration.groupby(page, observed=True).count(),
+        'journey_counts': encode_session_paths(data).path_counts(),
+        'purchase_path_counts': purchase_paths.path_counts(),
+        # Users never span partitions, so the overall top users are among the partitions' top users
+        'user_sessions': top_counts(sessions['user'].value_counts(), top_n),
+        'first_event': data['event_date'].min(),
+        'last_event': data['event_date'].max(),
+    }
+
+
+def _partition_worker(source, top_n):
+    # source is either the path of the partition's file or its events themselves
+    data = load_partition(source) if isinstance(source, str) else source
+    return partition_aggregates(data, top_n)
+
+
+def merge_partials(partials):
+    # Combine the partial results of all partitions: counts add, the event date range takes min and max
+    merged = {}
+    for name, first in partials[0].items():
+        values = [partial[name] for partial in partials]
+        if name == 'first_event':
+            merged[name] = min(values)
+        elif name == 'last_event':
+            merged[name] = max(values)
+        elif isinstance(first, pd.Series):
+            merged[name] = pd.concat(values).groupby(level=list(range(first.index.nlevels)), observed=True).sum()
+        else:
+            merged[name] = sum(values)
+    return merged
+
+
+def finalize_metrics(merged, top_n=20, top_journeys=10):
+    # Turn merged counts into the same frames the compute functions in services return
+    # Both counts in the order value_counts gives them in compute_exit_rates, most first with ties in category order,
+    # so the rates come out in the same row order
+    exits = merged['exits'].sort_values(ascending=False, kind='stable')
+    page_views = merged['page_views'].sort_values(ascending=False, kind='stable')
+    exit_rate_df = ((exits / page_views) * 100).reset_index()
+    exit_rate_df.columns = ['Page Type', 'Exit Rate (%)']
+
+    page_bounce_rates = pd.merge(merged['page_sessions'].reset_index(name='total_sessions'),
+                                 merged['bounced_sessions'].reset_index(name='bounced_sessions'),
+                                 on='page_type', how='left').fillna({'bounced_sessions': 0})
+    page_bounce_rates['bounce_rate'] = (page_bounce_rates['bounced_sessions'] /
+                                        page_bounce_rates['total_sessions']) * 100
+
+    daily_page_bounce_rates = pd.merge(merged['sessions_by_day'].reset_index(name='total_sessions'),
+                                       merged['bounced_by_day'].reset_index(name='bounced_sessions'),
+                                       on=['event_day', 'page_type'], how='left').fillna({'bounced_sessions': 0})
+    daily_page_bounce_rates['bounce_rate'] = (daily_page_bounce_rates['bounced_sessions'] /
+                                              daily_page_bounce_rates['total_sessions']) * 100
+
+    average_duration_by_page_df = (merged['duration_sum'] / merged['duration_count']).reset_index()
+    average_duration_by_page_df.columns = ['Page Type', 'Average Duration (seconds)']
+
+    # Ties among paths (and users) are broken by the path itself, so the result doesn't depend on the partitioning
+    journeys = merged['journey_counts'].sort_values(ascending=False, kind='stable')
+    purchase_paths = merged['purchase_path_counts'].sort_values(ascending=False, kind='stable')
+    user_sessions = merged['user_sessions'].sort_values(ascending=False, kind='stable')
+    # A single partition keeps the categorical index of value_counts, merged ones an object index: use the latter
+    user_sessions.index = user_sessions.index.astype(object)
+
+    return {
+        'funnel': build_funnel_table(merged['funnel_users'].tolist()),
+        'exit_rates': exit_rate_df,
+        'exit_rate_over_time': (merged['exits_by_day'] / merged['views_by_day']).unstack(level=1) * 100,
+        'bounce_rates': page_bounce_rates,
+        'daily_bounce_rates': daily_page_bounce_rates,
+        'average_duration_by_page': average_duration_by_page_df,
+        'common_user_journeys': journeys.head(top_journeys).rename(None),
+        'top_user_paths': purchase_paths.head(top_n).reset_index(),
+        'loyal_users': user_sessions.head(top_n).rename_axis('user').rename('session'),
+        'event_range': (merged['first_event'], merged['last_event']),
+    }
+
+
+def compute_session_metrics(source, workers=None, top_n=20):
+    # Session-level metrics computed on a process pool, one user-hash partition per worker.
+    # source is the path of the event file (split here into a file per partition that each worker maps) or an
+    # event frame (split here and sent to the workers)
+    workers = workers or DEFAULT_WORKERS
+    if workers == 1:
+        data = load_events(source) if isinstance(source, str) else source
+        return finalize_metrics(merge_partials([partition_aggregates(data, top_n)]), top_n=top_n)
+
+    with tempfile.TemporaryDirectory(prefix='autodoc-partitions-') as directory:
+        if isinstance(source, str):
+            sources = write_partitions(source, workers, directory)
+        else:
+            partition = user_partitions(source['user'], workers)
+            sources = [source[partition == i] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(_partition_worker, sources, [top_n] * workers))
+    return finalize_metrics(merge_partials(partials), top_n=top_n)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute the session-level metrics on several cores')
+    parser.add_argument('source', help='event file (CSV or Parquet)')
+    parser.add_argument('--workers', type=int, default=None, help=f'worker processes (default {DEFAULT_WORKERS})')
+    args = parser.parse_args()
+
+    for name, result in compute_session_metrics(args.source, workers=args.workers).items():
+        print(f'== {name}\n{result}\n')
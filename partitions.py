@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+
+import pandas as pd
+
+from dwell import page_span_durations
+from loader import load_events
+from sessions import build_session_summary, merge_session_summaries
+
+# A session with no events on the latest loaded day is treated as finished: it cannot continue into the next day.
+# Sessions with events on the latest day stay "open" until the next day is appended, because an event after
+# midnight moves their exit page and can turn a one-event bounce into a longer visit
+
+
+class DailyPartitionStore:
+    # Per-day aggregates behind the time-series charts, stored one directory per day:
+    #   day=YYYY-MM-DD/events.parquet    day-local counts per page_type (views, distinct sessions/users, span)
+    #   day=YYYY-MM-DD/sessions.parquet  exits and bounces of sessions that ended that day, written once closed
+    #   open_sessions=YYYY-MM-DD.parquet session summaries still open after that day
+    #   manifest.json                    loaded days, written last so a failed append can simply be retried
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.days = self._read_manifest()
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _day_dir(self, day):
+        return self._path(f'day={day:%Y-%m-%d}')
+
+    def _read_manifest(self):
+        try:
+            with open(self._path('manifest.json')) as manifest:
+                return [pd.Timestamp(day).as_unit('ns') for day in json.load(manifest)['days']]
+        except FileNotFoundError:
+            return []
+
+    def _write_manifest(self, days):
+        tmp_path = self._path('manifest.json.tmp')
+        with open(tmp_path, 'w') as manifest:
+            json.dump({'days': [f'{day:%Y-%m-%d}' for day in days]}, manifest)
+        os.replace(tmp_path, self._path('manifest.json'))
+
+    @staticmethod
+    def _write_parquet(frame, path):
+        tmp_path = f'{path}.tmp'
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _open_sessions(self):
+        if not self.days:
+            return None
+        return pd.read_parquet(self._path(f'open_sessions={self.days[-1]:%Y-%m-%d}.parquet')).set_index('session')
+
+    def append_day(self, day_events):
+        # Compute and store the partition of one new day; cost depends on that day's events only
+        days = day_events['event_date'].dt.normalize().unique()
+        if len(days) != 1:
+            raise ValueError(f'Expected the events of exactly one day, got {len(days)} days')
+        day = pd.Timestamp(days[0]).as_unit('ns')
+        if self.days and day <= self.days[-1]:
+            raise ValueError(f'{day:%Y-%m-%d} is not after the last loaded day {self.days[-1]:%Y-%m-%d}')
+
+        os.makedirs(self._day_dir(day), exist_ok=True)
+        self._write_parquet(day_event_aggregates(day_events, day),
+                            os.path.join(self._day_dir(day), 'events.parquet'))
+
+        # Join the day's sessions with the ones still open from the previous day
+        day_sessions = build_session_summary(day_events).astype({'user': object, 'first_page': str,
+                                                                    'last_page': str})
+        open_sessions = self._open_sessions()
+        if open_sessions is not None:
+            all_sessions = merge_session_summaries(open_sessions, day_sessions)
+            finished = all_sessions['end'] < day
+
+            # Sessions that did not continue today are final: store their exits and bounces on their last day
+            previous_day = self.days[-1]
+            self._write_parquet(session_aggregates(all_sessions[finished], previous_day),
+                                os.path.join(self._day_dir(previous_day), 'sessions.parquet'))
+            day_sessions = all_sessions[~finished]
+
+        self._write_parquet(day_sessions.reset_index(), self._path(f'open_sessions={day:%Y-%m-%d}.parquet'))
+        self._write_manifest(self.days + [day])
+        self.days.append(day)
+
+    def append_events(self, data):
+        # Append every day in data that is newer than the store, oldest first
+        event_day = data['event_date'].dt.normalize()
+        for day in sorted(event_day.unique()):
+            if not self.days or day > self.days[-1]:
+                self.append_day(data[event_day == day])
+
+    def _read_days(self, name):
+        frames = []
+        for day in self.days:
+            path = os.path.join(self._day_dir(day), name)
+            if os.path.exists(path):
+                frames.append(pd.read_parquet(path))
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def event_aggregates(self):
+        return self._read_days('events.parquet')
+
+    def session_aggregates(self):
+        # Closed sessions from the partitions plus the contribution of sessions that are still open
+        closed = self._read_days('sessions.parquet')
+        open_sessions = self._open_sessions()
+        current = session_aggregates(open_sessions, self.days[-1]) if open_sessions is not None else None
+        frames = [frame for frame in (closed, current) if frame is not None]
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def daily_interactions(self):
+        # Same as compute_daily_interactions: events per calendar day, including days without events
+        daily_counts = self.event_aggregates().groupby('event_day')['views'].sum()
+        daily_counts = daily_counts.reindex(pd.date_range(daily_counts.index.min(), daily_counts.index.max(),
+                                                          freq='D'), fill_value=0)
+        daily_counts.index.name = 'event_date'
+        return daily_counts
+
+    def exit_rate_over_time(self):
+        # Same as compute_exit_rate_over_time
+        exits = self.session_aggregates()
+        exits_by_day = exits[exits['exits'] > 0].groupby(['event_day', 'page_type'])['exits'].sum()
+        views_by_day = self.event_aggregates().groupby(['event_day', 'page_type'])['views'].sum()
+        return (exits_by_day / views_by_day).unstack(level=1) * 100
+
+    def daily_bounce_rates(self):
+        # Same as compute_daily_bounce_rates
+        daily_page_sessions = self.event_aggregates()[['event_day', 'page_type', 'sessions']].rename(
+            columns={'sessions': 'total_sessions'})
+        bounces = self.session_aggregates()
+        daily_single_event_page_sessions = bounces[bounces['bounces'] > 0].groupby(
+            ['event_day', 'page_type'])['bounces'].sum().reset_index(name='bounced_sessions')
+        daily_page_bounce_rates = pd.merge(daily_page_sessions, daily_single_event_page_sessions,
+                                           on=['event_day', 'page_type'], how='left').fillna({'bounced_sessions': 0})
+        daily_page_bounce_rates['bounce_rate'] = (daily_page_bounce_rates['bounced_sessions'] /
+                                                  daily_page_bounce_rates['total_sessions']) * 100
+        return daily_page_bounce_rates
+
+    def avg_time_by_average_user(self):
+        # Same as compute_avg_time_by_average_user with the default 'span' dwell
+        aggregates = self.event_aggregates().sort_values(['page_type', 'event_day'])
+        return pd.DataFrame({
+            'page_type': aggregates['page_type'].to_numpy(),
+            'event_day': aggregates['event_day'].to_numpy(),
+            'duration': (aggregates['span_ns'] / aggregates['users'] / 60e9).to_numpy(),
+        })
+
+
+def day_event_aggregates(day_events, day):
+    # Aggregates whose groups never cross midnight, per page_type for one day
+    by_page = day_events.groupby('page_type', observed=True)
+    aggregates = pd.DataFrame({
+        'views': by_page.size(),
+        'sessions': by_page['session'].nunique(),
+        'users': by_page['user'].nunique(),
+        'span_ns': page_span_durations(day_events).groupby(level='page_type', observed=True).sum().astype('int64'),
+    })
+    aggregates.index = aggregates.index.astype(str)
+    aggregates = aggregates.rename_axis('page_type').reset_index()
+    aggregates.insert(0, 'event_day', day)
+    return aggregates
+
+
+def session_aggregates(sessions, day):
+    # Exits on the last page and one-event bounces on the first page, per page_type, for sessions ending on day
+    exits = sessions['last_page'].astype(str).value_counts()
+    bounces = sessions.loc[sessions['event_count'] == 1, 'first_page'].astype(str).value_counts()
+    aggregates = pd.DataFrame({'exits': exits, 'bounces': bounces}).fillna(0).astype('int64')
+    aggregates = aggregates.rename_axis('page_type').reset_index()
+    aggregates.insert(0, 'event_day', day)
+    return aggregates
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append new days of events to a daily partition store')
+    parser.add_argument('store', help='directory of the partition store')
+    parser.add_argument('sources', nargs='+', help='event files (CSV or Parquet), oldest first')
+    args = parser.parse_args()
+
+    store = DailyPartitionStore(args.store)
+    for source in args.sources:
+        store.append_events(load_events(source))
+    print(f'{len(store.days)} days loaded, last day {store.days[-1]:%Y-%m-%d}')
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+from loader import value_codes
+
+PATH_SEPARATOR = ' -> '
+
+# Label of the pseudo-step after the last page of a session in the transition table
+EXIT_STEP = 'exit'
+
+# Odd multipliers for the polynomial path hash; arithmetic wraps modulo 2**64
+_HASH_BASE = np.uint64(0x100000001B3)
+_LENGTH_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class SessionPaths:
+    # Page sequences of every session as one flat array of small integer page codes, ordered by session and time.
+    # A path (or path prefix) is identified by a polynomial hash of its codes mixed with its length,
+    # so counting paths is a hash count over integers instead of building strings or lists per session
+
+    def __init__(self, pages, codes, starts, prefix_keys, rows=None):
+        self.pages = pages
+        self.codes = codes
+        self.starts = starts
+        self.lengths = np.diff(np.r_[starts, len(codes)])
+        self.prefix_keys = prefix_keys
+        # Row of every event in the source frame, in path order
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.starts)
+
+    def decode(self, start, length):
+        return PATH_SEPARATOR.join(self.pages[self.codes[start:start + length]])
+
+    def path_keys(self):
+        # The key of a full path is the key of its longest prefix
+        return self.prefix_keys[self.starts + self.lengths - 1]
+
+    def _top(self, keys, positions, lengths, k):
+        # Count keys by hashing, keep the k most frequent (ties in order of first appearance) and decode them
+        key_codes, uniques = pd.factorize(keys)
+        counts = np.bincount(key_codes, minlength=len(uniques))
+        first = np.empty(len(uniques), dtype=np.intp)
+        first[key_codes[::-1]] = np.arange(len(key_codes))[::-1]
+        top = np.argsort(-counts, kind='stable')[:k]
+        return pd.DataFrame({
+            'page_sequence': [self.decode(positions[first[i]], lengths[first[i]]) for i in top],
+            'length': lengths[first[top]],
+            'count': counts[top],
+        })
+
+    def path_counts(self):
+        # Number of sessions per distinct full path, keyed by the decoded path, most common first
+        key_codes, uniques = pd.factorize(self.path_keys())
+        counts = np.bincount(key_codes, minlength=len(uniques))
+        first = np.empty(len(uniques), dtype=np.intp)
+        first[key_codes[::-1]] = np.arange(len(key_codes))[::-1]
+        sequences = [self.decode(self.starts[i], self.lengths[i]) for i in first]
+        return pd.Series(counts, index=pd.Index(sequences, name='page_sequence'), name='count').sort_values(
+            ascending=False, kind='stable')
+
+    def top_path_codes(self, k=20):
+        # Code of every session's full path and the codes of the k most common paths, in the order of top_paths(k)
+        key_codes, uniques = pd.factorize(self.path_keys())
+        counts = np.bincount(key_codes, minlength=len(uniques))
+        return key_codes, np.argsort(-counts, kind='stable')[:k]
+
+    def top_paths(self, k=20):
+        # Most common complete session paths
+        return self._top(self.path_keys(), self.starts, self.lengths, k)
+
+    def top_prefixes(self, k=20, length=None, min_length=1):
+        # Most common path prefixes, optionally of one exact length; each session counts once per prefix length
+        positions = np.arange(len(self.codes)) - np.repeat(self.starts, self.lengths)
+        prefix_lengths = positions + 1
+        selected = prefix_lengths >= min_length if length is None else prefix_lengths == length
+        session_starts = np.repeat(self.starts, self.lengths)
+        return self._top(self.prefix_keys[selected], session_starts[selected], prefix_lengths[selected], k)
+
+    def transition_probabilities(self):
+        # Probability of each next page (or of leaving) given the current page, from consecutive events
+        n_pages = len(self.pages)
+        is_last = np.zeros(len(self.codes), dtype=bool)
+        is_last[self.starts + self.lengths - 1] = True
+        following = np.r_[self.codes[1:], 0].astype(np.int64)
+        following[is_last] = n_pages
+        counts = np.bincount(self.codes.astype(np.int64) * (n_pages + 1) + following,
+                             minlength=n_pages * (n_pages + 1)).reshape(n_pages, n_pages + 1)
+        transitions = pd.DataFrame(counts, index=pd.Index(self.pages, name='page_type'),
+                                   columns=list(self.pages) + [EXIT_STEP])
+        return transitions.div(transitions.sum(axis=1), axis=0)
+
+
+def _session_starts(sorted_sessions):
+    # Positions where a new session begins in session-ordered codes
+    return np.flatnonzero(np.r_[True, sorted_sessions[1:] != sorted_sessions[:-1]]) if len(sorted_sessions) \
+        else np.array([], dtype=np.intp)
+
+
+def encode_session_paths(data, session_filter=None):
+    # Build SessionPaths from the event frame without copying it.
+    # session_filter is an optional boolean mask over events: only sessions with at least one such event are kept
+    if isinstance(data['page_type'].dtype, pd.CategoricalDtype):
+        page_codes = data['page_type'].cat.codes.to_numpy()
+        pages = np.asarray(data['page_type'].cat.categories, dtype=object)
+    else:
+        page_codes, pages = pd.factorize(data['page_type'])
+        pages = np.asarray(pages, dtype=object)
+
+    # Order events by time within each session
+    session_codes = value_codes(data['session'])[0]
+    order = np.lexsort((data['event_date'].to_numpy(), session_codes))
+
+    if session_filter is not None and len(order):
+        # Keep the events of sessions that contain at least one matching event
+        starts = _session_starts(session_codes[order])
+        keep_session = np.logical_or.reduceat(np.asarray(session_filter)[order], starts)
+        order = order[np.repeat(keep_session, np.diff(np.r_[starts, len(order)]))]
+
+    codes = page_codes[order]
+    starts = _session_starts(session_codes[order])
+    lengths = np.diff(np.r_[starts, len(codes)])
+    positions = np.arange(len(codes)) - np.repeat(starts, lengths)
+
+    # Prefix hash of every event: sum of (code + 1) * base**position over the session so far, mixed with its length
+    with np.errstate(over='ignore'):
+        powers = np.cumprod(np.r_[np.uint64(1), np.full(max(lengths.max(initial=1) - 1, 0), _HASH_BASE)])
+        terms = (codes.astype(np.uint64) + np.uint64(1)) * powers[positions]
+        running = np.cumsum(terms, dtype=np.uint64)
+        before_session = np.repeat(np.r_[np.uint64(0), running][starts], lengths)
+        prefix_keys = (running - before_session) ^ ((positions.astype(np.uint64) + np.uint64(1)) * _LENGTH_MIX)
+
+    return SessionPaths(pages, codes, starts, prefix_keys, rows=order)
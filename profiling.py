@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger('autodoc.profile')
+
+# Directory receiving one JSON file per dashboard run; unset writes no files
+PROFILE_DIR = os.environ.get('AUTODOC_PROFILE_DIR')
+
+# 1 logs every run's profile as one JSON line on stderr, e.g. for a log collector; 0 leaves the logger as the
+# hosting application configured it
+PROFILE_LOG = int(os.environ.get('AUTODOC_PROFILE_LOG', 0))
+
+if PROFILE_LOG and not logger.handlers:
+    # Streamlit configures its own loggers only, so the root logger would drop INFO records
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def rss_bytes():
+    # Current resident set size, from /proc on Linux; None where it is not available
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RunProfile:
+    # Wall time, CPU time and resident memory change of every measured step of one script run.
+    # CPU time is process-wide, so it includes Arrow's worker threads but also any session running concurrently
+
+    def __init__(self):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.records = []
+        self._sections = []
+        self._exported = False
+
+    @contextmanager
+    def measure(self, name, kind, **details):
+        # kind is 'load', 'compute', 'render', 'section' or 'background' (a warm-up job, measured on its own thread
+        # and possibly after the run ended); the yielded record can take extra details, including its section
+        record = {'section': self._sections[-1] if self._sections else None, 'name': name, 'kind': kind, **details}
+        rss_before = rss_bytes()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall_start
+            record['cpu_s'] = time.process_time() - cpu_start
+            rss_after = rss_bytes()
+            record['mem_delta_mb'] = (rss_after - rss_before) / 1024 ** 2 if rss_before is not None else None
+            self.records.append(record)
+            if self._exported:
+                # A background job that finished after the run was exported: log it on its own, tagged with the run
+                logger.info(json.dumps({'run_id': self.run_id, 'started': self.started, 'records': [record]}))
+
+    @contextmanager
+    def section(self, name):
+        # Steps measured inside are attributed to this section, which is also measured as a whole
+        with self.measure(name, 'section') as record:
+            self._sections.append(name)
+            try:
+                yield record
+            finally:
+                self._sections.pop()
+
+    def frame(self):
+        return pd.DataFrame(self.records, columns=['section', 'name', 'kind', 'cached', 'wall_s', 'cpu_s',
+                                                   'mem_delta_mb'])
+
+    def totals(self):
+        # Time per kind of step; sections are left out as they contain the other steps
+        steps = self.frame()
+        steps = steps[steps['kind'] != 'section']
+        return steps.groupby('kind')[['wall_s', 'cpu_s', 'mem_delta_mb']].sum()
+
+    def to_dict(self):
+        return {'run_id': self.run_id, 'started': self.started, 'records': self.records}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def export(self, directory=PROFILE_DIR):
+        # One structured log line per run (shown with AUTODOC_PROFILE_LOG=1), plus a JSON file per run when a
+        # directory is configured
+        payload = self.to_json()
+        self._exported = True
+        logger.info(payload)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{time.strftime("%Y%m%dT%H%M%S", time.localtime(self.started))}-'
+                                           f'{self.run_id}.json')
+            with open(path, 'w') as output:
+                output.write(payload)
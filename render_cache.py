@@ -0,0 +1,43 @@
+import io
+import os
+
+import streamlit as st
+
+from compute_cache import ComputeCache
+
+# Bounds for the rendered figure cache; PNGs are small, so entries rather than bytes usually bind
+FIGURE_CACHE_MAX_MB = int(os.environ.get('AUTODOC_FIGURE_CACHE_MAX_MB', 128))
+FIGURE_CACHE_MAX_ENTRIES = int(os.environ.get('AUTODOC_FIGURE_CACHE_MAX_ENTRIES', 64))
+
+# Same output st.pyplot produces for a figure, but never wider than Streamlit's largest image width
+# (2 x 730 px): wider images are resized and re-encoded by st.image on every call, even from the cache
+FIGURE_DPI = 200
+MAX_FIGURE_WIDTH_PX = 1460
+
+
+def render_png(draw, *args, **kwargs):
+    # Draw a figure with one of the plot functions, encode it as PNG and release it
+    import matplotlib.pyplot as plt
+
+    fig = draw(*args, **kwargs)
+    try:
+        buffer = io.BytesIO()
+        dpi = min(FIGURE_DPI, MAX_FIGURE_WIDTH_PX / fig.get_figwidth())
+        fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
+
+
+# Process-wide cache of rendered figures, keyed like the compute cache: dataset fingerprint, plot function and
+# chart parameters. Frame arguments must be derived from the dataset the fingerprint identifies
+figure_cache = ComputeCache(max_bytes=FIGURE_CACHE_MAX_MB * 1024 ** 2, max_entries=FIGURE_CACHE_MAX_ENTRIES)
+
+
+def cached_figure(fingerprint, draw, *args, **kwargs):
+    return figure_cache.get_or_compute(fingerprint, render_png, draw, *args, **kwargs)
+
+
+def show_figure(fingerprint, draw, *args, **kwargs):
+    # Send the cached PNG of a chart; matplotlib only runs the first time a chart is shown for a dataset
+    st.image(cached_figure(fingerprint, draw, *args, **kwargs), use_column_width=True)
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import metrics
+from compute_cache import file_fingerprint
+from cube import EventCube
+from loader import load_events
+
+# Bumped whenever the layout of the artifact or the meaning of a metric changes
+REPORT_FORMAT_VERSION = 1
+
+# File in the report root naming the most recent complete report
+LATEST_POINTER = 'LATEST'
+
+# Separator of flattened multi-level column labels in the Parquet files
+COLUMN_SEPARATOR = '|'
+
+# Every metric the dashboard shows, computed from the events, the session summary and the event cube.
+# The trendlines are left out: they are fitted on request from avg_time_by_user, which is tiny
+REPORT_METRICS = {
+    'funnel': lambda data, sessions, cube: metrics.calculate_funnel_user_counts(data),
+    'ordered_funnel_user': lambda data, sessions, cube: metrics.compute_ordered_funnel(data, 'user'),
+    'ordered_funnel_session': lambda data, sessions, cube: metrics.compute_ordered_funnel(data, 'session'),
+    'avg_time_by_user': lambda data, sessions, cube: metrics.compute_avg_time_by_average_user(data),
+    'common_user_journeys': lambda data, sessions, cube: metrics.compute_common_user_journeys(data),
+    'exit_rates': lambda data, sessions, cube: metrics.compute_exit_rates(data, sessions, cube.page_type_counts()),
+    'products_added_before_exit': lambda data, sessions, cube: metrics.compute_products_added_before_exit(data),
+    'daily_interactions': lambda data, sessions, cube: cube.daily_interactions(),
+    'interactions_heatmap': lambda data, sessions, cube: cube.interactions_heatmap(),
+    'page_type_counts': lambda data, sessions, cube: cube.page_type_counts(),
+    'exit_rate_over_time': lambda data, sessions, cube: metrics.compute_exit_rate_over_time(data, sessions),
+    'top_user_paths': lambda data, sessions, cube: metrics.compute_top_user_paths(data),
+    'average_duration_by_page': lambda data, sessions, cube: metrics.compute_average_duration_by_page(data),
+    'bounce_rates': lambda data, sessions, cube: metrics.compute_bounce_rates(data, sessions),
+    'daily_bounce_rates': lambda data, sessions, cube: metrics.compute_daily_bounce_rates(data, sessions),
+    'loyal_users': lambda data, sessions, cube: metrics.compute_loyal_users(data),
+    'cohort_retention_day': lambda data, sessions, cube: metrics.compute_cohort_retention(data, 'day'),
+    'cohort_retention_week': lambda data, sessions, cube: metrics.compute_cohort_retention(data, 'week'),
+}
+
+
+def build_report(source_path, names=None):
+    # Compute the metrics (all of them by default) from one event file; returns {name: frame or series}
+    data = load_events(source_path)
+    sessions = metrics.build_session_summary(data)
+    cube = EventCube.build(data)
+    return {name: REPORT_METRICS[name](data, sessions, cube) for name in names or REPORT_METRICS}
+
+
+def _write_metric(value, path):
+    # Parquet keeps dtypes and the (multi-)index; column labels must be strings, so flatten them and note how
+    frame = value.to_frame(name='value' if value.name is None else str(value.name)) \
+        if isinstance(value, pd.Series) else value
+    meta = {
+        'kind': 'series' if isinstance(value, pd.Series) else 'frame',
+        'series_name': value.name if isinstance(value, pd.Series) else None,
+        'column_levels': frame.columns.nlevels,
+        'column_names': [None if name is None else str(name) for name in frame.columns.names],
+        'column_dtype': str(frame.columns.dtype) if frame.columns.nlevels == 1 else None,
+        'index_freq': getattr(frame.index, 'freqstr', None),
+    }
+    frame = frame.set_axis([COLUMN_SEPARATOR.join(map(str, label)) if isinstance(label, tuple) else str(label)
+                            for label in frame.columns], axis=1)
+    frame.to_parquet(path)
+    return meta
+
+
+def _read_metric(path, meta):
+    frame = pd.read_parquet(path)
+    if meta['column_levels'] > 1:
+        frame.columns = pd.MultiIndex.from_tuples([tuple(label.split(COLUMN_SEPARATOR)) for label in frame.columns])
+    elif meta['column_dtype'] == 'category':
+        frame.columns = pd.CategoricalIndex(frame.columns)
+    else:
+        frame.columns = frame.columns.astype(meta['column_dtype'])
+    if meta['index_freq']:
+        frame.index.freq = meta['index_freq']
+    frame.columns.names = meta['column_names']
+    if meta['kind'] == 'series':
+        return frame.iloc[:, 0].rename(meta['series_name'])
+    return frame
+
+
+def write_report(report, root, source_path=None):
+    # Write the report into a new timestamped directory under root, then point LATEST at it.
+    # Readers follow LATEST, so they never see a half-written report
+    name = f'report-{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}'
+    directory = os.path.join(root, name)
+    tmp_directory = f'{directory}.tmp'
+    os.makedirs(tmp_directory)
+
+    manifest = {
+        'format_version': REPORT_FORMAT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'source': source_path,
+        'source_fingerprint': file_fingerprint(source_path) if source_path else None,
+        'metrics': {},
+    }
+    for metric, value in report.items():
+        manifest['metrics'][metric] = {'file': f'{metric}.parquet',
+                                       **_write_metric(value, os.path.join(tmp_directory, f'{metric}.parquet'))}
+    with open(os.path.join(tmp_directory, 'manifest.json'), 'w') as output:
+        json.dump(manifest, output, indent=2)
+    os.replace(tmp_directory, directory)
+
+    pointer = os.path.join(root, LATEST_POINTER)
+    with open(f'{pointer}.tmp', 'w') as output:
+        output.write(name)
+    os.replace(f'{pointer}.tmp', pointer)
+    return directory
+
+
+def report_directory(path):
+    # A report directory itself, or a root whose LATEST names one
+    if os.path.exists(os.path.join(path, 'manifest.json')):
+        return path
+    with open(os.path.join(path, LATEST_POINTER)) as pointer:
+        return os.path.join(path, pointer.read().strip())
+
+
+class Report:
+    # A written report; metrics are read from Parquet on first access only
+
+    def __init__(self, path):
+        self.directory = report_directory(path)
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        with open(self.manifest_path) as manifest:
+            self.manifest = json.load(manifest)
+        if self.manifest['format_version'] != REPORT_FORMAT_VERSION:
+            raise ValueError(f'Report format {self.manifest["format_version"]} in {self.directory} is not supported, '
+                             f'expected {REPORT_FORMAT_VERSION}')
+        self._metrics = {}
+
+    def __contains__(self, name):
+        return name in self.manifest['metrics']
+
+    def __getitem__(self, name):
+        if name not in self._metrics:
+            meta = self.manifest['metrics'][name]
+            self._metrics[name] = _read_metric(os.path.join(self.directory, meta['file']), meta)
+        return self._metrics[name]
+
+
+def prune_reports(root, keep=7):
+    # Remove all but the keep most recent reports
+    reports = sorted(name for name in os.listdir(root) if name.startswith('report-') and not name.endswith('.tmp'))
+    for name in reports[:max(len(reports) - keep, 0)]:
+        shutil.rmtree(os.path.join(root, name))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute every dashboard metric into a versioned report, '
+                                                 'without Streamlit or matplotlib')
+    parser.add_argument('source', help='event file (CSV or Parquet)')
+    parser.add_argument('root', help='directory holding the reports')
+    parser.add_argument('--keep', type=int, default=7, help='number of reports to keep')
+    args = parser.parse_args()
+
+    directory = write_report(build_report(args.source), args.root, source_path=args.source)
+    prune_reports(args.root, args.keep)
+    print(f'Report written to {directory}')
@@ -0,0 +1,98 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from loader import value_codes
+from sketches import ERROR_BOUND_Z, hash_values
+
+# Share of users kept by the sampling mode unless another rate is chosen
+DEFAULT_SAMPLE_RATE = float(os.environ.get('AUTODOC_SAMPLE_RATE', 0.1))
+
+# Users are the sampled units: every user is kept with probability rate, independently, by a hash of the user id.
+# All events of a kept user are kept, so their sessions and funnels stay intact. Estimates scale the sample's
+# totals by 1 / rate; error bounds are ~95% half-widths (ERROR_BOUND_Z standard errors) under that design, with
+# the variance of ratios from their per-user linearization
+
+
+def sample_threshold(rate):
+    # Users whose hash is below the threshold are sampled
+    if not 0 < rate <= 1:
+        raise ValueError(f'Sample rate must be in (0, 1], got {rate}')
+    return np.uint64(min(int(rate * 2 ** 64), 2 ** 64 - 1))
+
+
+def user_sample_mask(users, rate):
+    # Events of the sampled users. The hash is stable across runs and processes, so the same users come back every
+    # time, and the users of a lower rate are a subset of those of a higher one. Events without a user are left out
+    if rate >= 1:
+        return users.notna().to_numpy()
+    return (hash_values(users) < sample_threshold(rate)) & users.notna().to_numpy()
+
+
+def sample_users(data, rate):
+    # The events of a deterministic sample of users, in their original order
+    return data.take(np.flatnonzero(user_sample_mask(data['user'], rate)))
+
+
+def sample_fingerprint(fingerprint, rate):
+    # Fingerprint of a sample, so results computed on it are cached per view and rate
+    if rate is None:
+        return fingerprint
+    return hashlib.sha1(repr((fingerprint, 'sample', rate)).encode()).hexdigest()
+
+
+def scaled_count_error(unit_users, rate):
+    # Error bound of len(unit_users) / rate, for counted units given by the user code of each: one code per user when
+    # users are counted, or the user of every session when sessions are. A user's units are kept or left out together,
+    # so every user adds its number of units squared to the variance
+    per_user = np.bincount(unit_users).astype(float)
+    return ERROR_BOUND_Z * np.sqrt((1 - rate) * (per_user ** 2).sum()) / rate
+
+
+def set_ratio_error(numerator_users, denominator_users, rate):
+    # Error bound of len(numerator_users) / len(denominator_users) for the user codes of two sets of counted units,
+    # which may overlap partly: every user adds (y - ratio * x)**2 to the linearized variance, for its units y in
+    # the numerator and x in the denominator
+    numerator, denominator = len(numerator_users), len(denominator_users)
+    if not denominator:
+        return np.nan
+    size = max(np.max(numerator_users, initial=-1), np.max(denominator_users, initial=-1)) + 1
+    y = np.bincount(numerator_users, minlength=size)
+    x = np.bincount(denominator_users, minlength=size)
+    squares = ((y - numerator / denominator * x) ** 2).sum()
+    return ERROR_BOUND_Z * np.sqrt((1 - rate) * squares) / denominator
+
+
+def _user_totals(keys, users, values):
+    # Sum of values per (key, user); users are integer codes, -1 (no user) is left out
+    frame = pd.DataFrame({'key': np.asarray(keys), 'user': users, 'value': values})
+    return frame[frame['user'] >= 0].groupby(['key', 'user'])['value'].sum().astype(float)
+
+
+def total_estimates(keys, users, values, rate):
+    # Estimated total of values per key, with its error bound: sum / rate, with a variance of
+    # (1 - rate) / rate**2 * sum over sampled users of their squared per-user totals
+    per_user = _user_totals(keys, users, values)
+    return pd.DataFrame({
+        'estimate': per_user.groupby(level='key').sum() / rate,
+        'error': ERROR_BOUND_Z * np.sqrt((1 - rate) * (per_user ** 2).groupby(level='key').sum()) / rate,
+    })
+
+
+def ratio_estimates(numerator, denominator, rate):
+    # Ratio of two totals per key, each given as the (keys, users, values) of the rows summed into it. The scaling
+    # cancels out; the variance is (1 - rate) * sum over users of (y - ratio * x)**2 / (sum of x)**2, for the
+    # per-user totals y of the numerator and x of the denominator
+    per_user = pd.concat({'y': _user_totals(*numerator), 'x': _user_totals(*denominator)}, axis=1).fillna(0)
+    sums = per_user.groupby(level='key').sum()
+    ratio = sums['y'] / sums['x']
+    residuals = per_user['y'] - ratio.reindex(per_user.index, level='key') * per_user['x']
+    variance = (1 - rate) * (residuals ** 2).groupby(level='key').sum() / sums['x'] ** 2
+    return pd.DataFrame({'estimate': ratio, 'error': ERROR_BOUND_Z * np.sqrt(variance)})
+
+
+def event_users(data):
+    # Integer user code of every event, the sampling unit the estimates group by
+    return value_codes(data['user'])[0]
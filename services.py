@@ -1,170 +1,108 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import streamlit as st
-import matplotlib.dates as mdates
 
+# matplotlib and seaborn are imported by the plot functions that use them: they take most of the app's import time,
+# and the first screen has no chart
 
-def display_visits(data):
-    # Total number of users who visited the website
-    total_visitors = data['user'].nunique()
-
-    # Users who browsed products (either via Search Listing Page or Listing Page)
-    browse_users = data[data['page_type'].isin(['search_listing_page', 'listing_page'])]['user'].nunique()
-
-    # Users who viewed product details
-    product_view_users = data[data['page_type'] == 'product_page']['user'].nunique()
-
-    # Users who added products to cart
-    add_to_cart_users = data[data['event_type'] == 'add_to_cart']['user'].nunique()
-
-    # Users who made a purchase
-    purchased_users = data[data['event_type'] == 'order']['user'].nunique()
-
-    funnel_metrics = {
-        'Stage': ['Visit', 'Browse Products', 'View Product Details', 'Add to Cart', 'Purchase'],
-        'Number of Users': [total_visitors, browse_users, product_view_users, add_to_cart_users, purchased_users]
-    }
-
-    funnel_df = pd.DataFrame(funnel_metrics)
-    return funnel_df
-
-
-def calculate_funnel_user_counts(data):
-    # Total number of users who visited the website
-    total_visitors = data['user'].nunique()
-
-    # Users who browsed products (either via Search Listing Page or Listing Page)
-    browse_users = data[data['page_type'].isin(['search_listing_page', 'listing_page'])]['user'].nunique()
-
-    # Users who viewed product details
-    product_view_users = data[data['page_type'] == 'product_page']['user'].nunique()
-
-    # Users who added products to cart
-    add_to_cart_users = data[data['event_type'] == 'add_to_cart']['user'].nunique()
-
-    # Users who made a purchase
-    purchased_users = data[data['event_type'] == 'order']['user'].nunique()
-
-    # Calculate the conversion rates between each stage of the funnel
-    funnel_df = pd.DataFrame({
-        'Stage': ['Visit', 'Browse Products', 'View Product Details', 'Add to Cart', 'Purchase'],
-        'Number of Users': [total_visitors, browse_users, product_view_users, add_to_cart_users, purchased_users]
-    })
-
-    # Calculate conversion rates
-    conversion_rates = [(funnel_df['Number of Users'][i] / funnel_df['Number of Users'][i - 1]) * 100
-                        if i != 0 else 100 for i in range(len(funnel_df))]
-
-    funnel_df['Conversion Rate (%)'] = conversion_rates
-    funnel_df['Conversion Rate (%)'] = funnel_df['Conversion Rate (%)'].apply(lambda x: round(x, 2))
-
-    return funnel_df
-
-
-def compute_avg_time_by_average_user(data):
-    # Ensure event_date is a datetime object
-    data['event_date'] = pd.to_datetime(data['event_date'])
-
-    # Extract date from event_date
-    data['event_day'] = data['event_date'].dt.date
-
-    # Calculate total duration spent on each page type for each user per day
-    total_duration_per_user_day = data.groupby(['user', 'page_type', 'event_day'])['event_date'].apply(
-        lambda x: x.max() - x.min()).reset_index(name='duration')
-
-    # Sum durations across all users for each page type per day
-    total_duration_per_page_day = total_duration_per_user_day.groupby(['page_type', 'event_day'])['duration'].sum()
-    # Count unique users per page type per day
-    user_counts_per_page_day = data.groupby(['page_type', 'event_day'])['user'].nunique()
-    # Calculate the average duration by dividing total duration by user count
-    avg_duration_per_average_user = total_duration_per_page_day / user_counts_per_page_day
-    # Convert Timedelta to total seconds and then to minutes
-    avg_duration_in_minutes = avg_duration_per_average_user.dt.total_seconds() / 60
-    # Create a new DataFrame with the correct column name
-    avg_duration_df = avg_duration_in_minutes.reset_index(name='duration')
-
-    return avg_duration_df
+# The compute functions live in metrics and are re-exported here for existing callers
+from metrics import build_session_summary, display_visits, calculate_funnel_user_counts, \
+    compute_avg_time_by_average_user, prepare_data_for_pivot, compute_duration_trendlines, \
+    compute_common_user_journeys, compute_exit_rates, compute_products_added_before_exit, \
+    compute_daily_interactions, compute_interactions_heatmap, compute_page_type_counts, \
+    compute_exit_rate_over_time, compute_top_user_paths, compute_average_duration_by_page, compute_bounce_rates, \
+    compute_daily_bounce_rates, compute_loyal_users, compute_cohort_retention, compute_ordered_funnel
 
 
 def plot_avg_time_by_user(avg_time_by_user):
-    # Ensure event_day is a datetime object for plotting
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Ensure event_day is a datetime object for plotting, without modifying the caller's frame
     if not pd.api.types.is_datetime64_any_dtype(avg_time_by_user['event_day']):
-        avg_time_by_user['event_day'] = pd.to_datetime(avg_time_by_user['event_day'])
+        avg_time_by_user = avg_time_by_user.assign(event_day=pd.to_datetime(avg_time_by_user['event_day']))
 
     # Plot
-    plt.figure(figsize=(12, 6))
-    ax = sns.lineplot(data=avg_time_by_user, x='event_day', y='duration', hue='page_type')
+    fig, ax = plt.subplots(figsize=(12, 6))
+    sns.lineplot(data=avg_time_by_user, x='event_day', y='duration', hue='page_type', ax=ax)
     ax.set_title('Average Time Spent per Page Type by Average User')
     ax.set_ylabel('Average Time (minutes)')
     ax.set_xlabel('Date')
     ax.legend(title='Page Type')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    ax.tick_params(axis='x', rotation=45)
+    fig.tight_layout()
 
-    # Show plot in Streamlit
-    st.pyplot(plt)
+    return fig
 
 
 def plot_heatmap_avg_time_by_user(avg_duration_df):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     # Pivot the data for the heatmap
     heatmap_data = avg_duration_df.pivot(index='event_day', columns='page_type', values='duration')
 
-    plt.figure(figsize=(12, 8))
-    sns.heatmap(heatmap_data, cmap="YlGnBu", annot=True, fmt=".2f")
-    plt.title('Average Time Spent on Each Page Type per Day')
-    plt.xticks(rotation=45)  # Rotate x-axis labels for better readability
-    plt.tight_layout()  # Adjust the plot to ensure everything fits without overlapping
-    st.pyplot(plt)
+    # Label rows by calendar date rather than full timestamps
+    if isinstance(heatmap_data.index, pd.DatetimeIndex):
+        heatmap_data.index = heatmap_data.index.date
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+    sns.heatmap(heatmap_data, cmap="YlGnBu", annot=True, fmt=".2f", ax=ax)
+    ax.set_title('Average Time Spent on Each Page Type per Day')
+    ax.tick_params(axis='x', rotation=45)  # Rotate x-axis labels for better readability
+    fig.tight_layout()  # Adjust the plot to ensure everything fits without overlapping
+
+    return fig
 
 
 def plot_time_spent_by_users(avg_duration_df):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     # Group the data by 'page_type' and calculate the mean duration for each page
-    avg_duration_per_page = avg_duration_df.groupby('page_type')['duration'].mean().sort_values(ascending=False)
+    avg_duration_per_page = avg_duration_df.groupby('page_type', observed=True)['duration'].mean().sort_values(
+        ascending=False)
 
     # Reset index to convert the Series to a DataFrame for Seaborn
     avg_duration_per_page = avg_duration_per_page.reset_index()
 
     # Create the bar plot
-    plt.figure(figsize=(10, 6))
+    fig, ax = plt.subplots(figsize=(10, 6))
     bar = sns.barplot(
         x='duration',
         y='page_type',
         data=avg_duration_per_page,
         palette='viridis',
-        orient='h'
+        orient='h',
+        ax=ax
     )
-    plt.xlabel('Average Duration (minutes)')
-    plt.ylabel('Page Type')
-    plt.title('Average Time Spent by Users on Each Page Type')
-    plt.tight_layout()
+    ax.set_xlabel('Average Duration (minutes)')
+    ax.set_ylabel('Page Type')
+    ax.set_title('Average Time Spent by Users on Each Page Type')
+    fig.tight_layout()
 
     # Show values on bars
     for p in bar.patches:
         width = p.get_width()
-        plt.text(5+p.get_width(), p.get_y()+0.55*p.get_height(),
-                 '{:1.2f}'.format(width),
-                 ha='center', va='center')
+        ax.text(5+p.get_width(), p.get_y()+0.55*p.get_height(),
+                '{:1.2f}'.format(width),
+                ha='center', va='center')
 
-    # Display the plot in Streamlit
-    st.pyplot(plt)
-
-
-def prepare_data_for_pivot(df):
-    # Check if there are any duplicates
-    if df.duplicated(subset=['event_day', 'page_type']).any():
-        # Resolve duplicates by taking the mean
-        df = df.groupby(['event_day', 'page_type']).mean().reset_index()
-    return df
+    return fig
 
 
-def plot_average_duration_with_trendlines(avg_duration_df):
-    print(avg_duration_df.head())  # Debug: inspect the DataFrame structure
-    print(avg_duration_df.dtypes)  # Debug: check the data types of the columns
+def plot_average_duration_with_trendlines(avg_duration_df, trendlines=None, method='polynomial', order=3, window=7):
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     # Ensure 'event_day' is a datetime type for plotting
-    avg_duration_df['event_day'] = pd.to_datetime(avg_duration_df['event_day'])
+    if not pd.api.types.is_datetime64_any_dtype(avg_duration_df['event_day']):
+        avg_duration_df = avg_duration_df.assign(event_day=pd.to_datetime(avg_duration_df['event_day']))
+
+    # Trendlines may come precomputed (and cached) for the same method, order and window
+    if trendlines is None:
+        trendlines = compute_duration_trendlines(avg_duration_df, method=method, order=order, window=window)
 
     # Pivot the data to get the correct format for Seaborn
     pivot_df = avg_duration_df.pivot(index="event_day", columns="page_type", values="duration")
@@ -173,16 +111,12 @@ def plot_average_duration_with_trendlines(avg_duration_df):
     fig, ax = plt.subplots(figsize=(12, 6))
     sns.lineplot(data=pivot_df, ax=ax)
 
-    # Add trendlines
-    for page_type in pivot_df.columns:
-        sns.regplot(
-            x=mdates.date2num(pivot_df.index),
-            y=pivot_df[page_type],
-            scatter=False,
-            order=3,
-            label=f"{page_type} Trend",
-            ax=ax
-        )
+    # Add trendlines in the colour of their series, with the confidence band around them
+    for line, page_type in zip(ax.get_lines(), pivot_df.columns):
+        color = line.get_color()
+        ax.plot(trendlines.index, trendlines['fitted'][page_type], color=color, label=f"{page_type} Trend")
+        ax.fill_between(trendlines.index, trendlines['lower'][page_type], trendlines['upper'][page_type],
+                        color=color, alpha=0.15, linewidth=0)
 
     # Set the title and labels
     ax.set_title('Average Duration per Page Type by Date with Trendlines')
@@ -199,12 +133,8 @@ def plot_average_duration_with_trendlines(avg_duration_df):
     return fig
 
 
-def plot_common_user_journeys(data):
-    # Filter to get sequences of page visits for each session
-    user_journey = data.groupby(['user', 'session'])['page_type'].apply(list)
-
-    # Most common journeys
-    common_journeys = user_journey.value_counts().head(10)
+def plot_common_user_journeys(common_journeys):
+    import matplotlib.pyplot as plt
 
     # Plotting the most common user journeys
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -212,149 +142,110 @@ def plot_common_user_journeys(data):
     ax.set_title('Most Common User Journeys')
     ax.set_xlabel('Number of Occurrences')
     ax.invert_yaxis()  # To display the highest count at the top
-    plt.tight_layout()  # Adjust the layout so everything fits without overlapping
+    fig.tight_layout()  # Adjust the layout so everything fits without overlapping
 
     return fig
 
 
-def show_exit_rates(data):
-    # Identify the last page viewed in each session
-    last_page_per_session = data.groupby('session')['page_type'].last()
-
-    # Count the number of exits for each page
-    exit_counts = last_page_per_session.value_counts()
-
-    # Count the total views for each page
-    page_views = data['page_type'].value_counts()
-
-    # Calculate the exit rate for each page
-    exit_rates = (exit_counts / page_views) * 100
-
-    # Convert the series to a DataFrame for table view
-    exit_rate_df = exit_rates.reset_index()
-    exit_rate_df.columns = ['Page Type', 'Exit Rate (%)']
-
+def show_exit_rates(exit_rate_df):
     # Display the DataFrame as a table in Streamlit
     st.table(exit_rate_df)
 
 
-def plot_interactions_before_exit(data):
-    # Filter the data for 'add_to_cart' events and get the last interaction before exit per session
-    interactions_before_exit = data[data['event_type'] == 'add_to_cart'].groupby('session').last()
-
-    # Count the occurrences of each product in these interactions
-    product_counts = interactions_before_exit['product'].value_counts().head(10)
+def plot_interactions_before_exit(product_counts):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     # Start a figure
-    plt.figure(figsize=(10, 6))
+    fig, ax = plt.subplots(figsize=(10, 6))
 
     # Use Seaborn to create the bar plot
-    sns.barplot(x=product_counts.index, y=product_counts.values)
+    sns.barplot(x=product_counts.index, y=product_counts.values, ax=ax)
 
     # Set the title and labels of the plot
-    plt.title('Top 10 Products Added to Cart Before Exiting')
-    plt.xlabel('Product')
-    plt.ylabel('Count')
+    ax.set_title('Top 10 Products Added to Cart Before Exiting')
+    ax.set_xlabel('Product')
+    ax.set_ylabel('Count')
 
     # Rotate the x-axis labels for better readability
-    plt.xticks(rotation=45)
+    ax.tick_params(axis='x', rotation=45)
 
-    # Show the plot
-    st.pyplot(plt.gcf())
+    return fig
 
 
-def plot_daily_interactions(data):
-    # Resample the data by day and count the interactions
-    daily_counts = data.resample('D', on='event_date').size()
+def plot_daily_interactions(daily_counts):
+    import matplotlib.pyplot as plt
 
     # Start a figure
-    plt.figure(figsize=(10, 6))
+    fig, ax = plt.subplots(figsize=(10, 6))
 
     # Plot the data
-    daily_counts.plot()
+    daily_counts.plot(ax=ax)
 
     # Set the title and labels of the plot
-    plt.title('Daily Interactions Before Exit')
-    plt.xlabel('Date')
-    plt.ylabel('Number of Interactions')
+    ax.set_title('Daily Interactions Before Exit')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Number of Interactions')
 
     # Rotate the x-axis labels for better readability
-    plt.xticks(rotation=45)
+    ax.tick_params(axis='x', rotation=45)
 
     # Ensure everything fits without overlapping
-    plt.tight_layout()
-
-    # Show the plot in Streamlit
-    st.pyplot(plt.gcf())  # plt.gcf() gets the current figure
+    fig.tight_layout()
 
+    return fig
 
-def plot_interactions_heatmap(data):
-    # Add hour and day of week columns
-    data['hour'] = data['event_date'].dt.hour
-    data['dayofweek'] = data['event_date'].dt.dayofweek
 
-    # Group by day of week and hour to get counts
-    heatmap_data = data.groupby(['dayofweek', 'hour']).size().unstack()
+def plot_interactions_heatmap(heatmap_data):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     # Start a figure
-    plt.figure(figsize=(12, 8))
+    fig, ax = plt.subplots(figsize=(12, 8))
 
     # Create the heatmap
-    sns.heatmap(heatmap_data, cmap="YlGnBu", annot=True, fmt="d")
+    sns.heatmap(heatmap_data, cmap="YlGnBu", annot=True, fmt="d", ax=ax)
 
     # Set the title and labels
-    plt.title('Interactions Before Exit Heatmap')
-    plt.xlabel('Hour of Day')
-    plt.ylabel('Day of Week')
+    ax.set_title('Interactions Before Exit Heatmap')
+    ax.set_xlabel('Hour of Day')
+    ax.set_ylabel('Day of Week')
 
     # Optionally, change the labels for days of the week
     day_labels = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    plt.yticks(ticks=np.arange(7), labels=day_labels, rotation=0)  # Set custom labels for the y-axis
+    ax.set_yticks(np.arange(7), labels=day_labels, rotation=0)  # Set custom labels for the y-axis
 
     # Ensure everything fits without overlapping
-    plt.tight_layout()
+    fig.tight_layout()
 
-    # Show the plot in Streamlit
-    st.pyplot(plt.gcf())
+    return fig
 
 
-def plot_exit_pages_bar_chart(data):
-    # Calculate the value counts for the 'page_type' column
-    page_type_counts = data['page_type'].value_counts()
+def plot_exit_pages_bar_chart(page_type_counts):
+    import matplotlib.pyplot as plt
 
     # Start a figure
-    plt.figure(figsize=(10, 6))
+    fig, ax = plt.subplots(figsize=(10, 6))
 
     # Plot the bar chart
-    page_type_counts.plot(kind='bar', color='skyblue')
+    page_type_counts.plot(kind='bar', color='skyblue', ax=ax)
 
     # Set the title and labels
-    plt.title('Exit Pages Frequency')
-    plt.xlabel('Page Type')
-    plt.ylabel('Frequency')
+    ax.set_title('Exit Pages Frequency')
+    ax.set_xlabel('Page Type')
+    ax.set_ylabel('Frequency')
 
     # Rotate the x-axis labels for better readability
-    plt.xticks(rotation=45)
+    ax.tick_params(axis='x', rotation=45)
 
     # Ensure everything fits without overlapping
-    plt.tight_layout()
-
-    # Show the plot in Streamlit
-    st.pyplot(plt.gcf())
-
-
-def plot_exit_rate_over_time(data):
-    # 1. Identify the exit pages for each session
-    exit_pages = data.loc[data.groupby('session')['event_date'].idxmax()]
+    fig.tight_layout()
 
-    # 2. Count exits by day for each page type
-    exits_by_day = exit_pages.groupby(['event_day', 'page_type']).size()
+    return fig
 
-    # 3. Count page views by day for each page type
-    views_by_day = data.groupby(['event_day', 'page_type']).size()
 
-    # 4. Calculate exit rate by day for each page type
-    exit_rate_by_day = (exits_by_day / views_by_day).unstack(level=1) * 100
+def plot_exit_rate_over_time(exit_rate_by_day):
+    import matplotlib.pyplot as plt
 
     # Plotting
     fig, ax = plt.subplots(figsize=(14, 7))
@@ -362,106 +253,29 @@ def plot_exit_rate_over_time(data):
     ax.set_ylabel("Exit Rate (%)")
     ax.set_xlabel("Date")
     ax.legend(title="Page Type")
-    plt.tight_layout()
-
-    # Display the plot in Streamlit
-    st.pyplot(fig)
-
-
-def show_top_user_paths(data):
-    # Extract purchase sessions
-    purchase_sessions = data.loc[data['event_type'] == 'order', 'session'].unique()
-
-    # Filter data to only include purchase sessions
-    paths_data = data[data['session'].isin(purchase_sessions)]
-
-    # Create the sequence of pages visited in each session
-    paths_data['page_sequence'] = paths_data.groupby('session')['page_type'].transform(lambda x: ' -> '.join(x))
-
-    # Get unique paths and their counts
-    unique_paths = paths_data[['session', 'page_sequence']].drop_duplicates()
-    common_paths = unique_paths.groupby('page_sequence').size().reset_index(name='count').sort_values(by='count',
-                                                                                                      ascending=False)
-
-    # Select top 20 paths
-    top_20_paths = common_paths.head(20)
-
-    # Display the top 20 paths in Streamlit
-    st.write("Top 20 User Paths to Purchase:")
-    st.dataframe(top_20_paths)
-
-
-def show_average_duration_by_page(data):
-    # Calculate the start and end time for each session
-    session_times = data.groupby('session')['event_date'].agg(['min', 'max'])
-
-    # Calculate the session duration
-    session_times['duration'] = ((pd.to_datetime(session_times['max']) - pd.to_datetime(session_times['min'])).
-                                 dt.total_seconds())
+    fig.tight_layout()
 
-    # Merge session duration back to the main data to get page_type
-    data_with_duration = data.merge(session_times['duration'], left_on='session', right_index=True)
+    return fig
 
-    # Calculate average duration by page type
-    average_duration_by_page = data_with_duration.groupby('page_type')['duration'].mean()
 
-    # Convert the Series to a DataFrame
-    average_duration_by_page_df = average_duration_by_page.reset_index()
+def show_top_user_paths(top_paths):
+    # Display the top paths in Streamlit
+    st.write(f"Top {len(top_paths)} User Paths to Purchase:")
+    st.dataframe(top_paths)
 
-    # Rename columns for better clarity
-    average_duration_by_page_df.columns = ['Page Type', 'Average Duration (seconds)']
 
+def show_average_duration_by_page(average_duration_by_page_df):
     # Display the table in Streamlit
     st.table(average_duration_by_page_df)
 
 
-def calculate_and_display_bounce_rates(data):
-    # Calculate the number of events per session
-    session_event_counts = data.groupby('session').size()
-
-    # Identify sessions with only one event
-    single_event_session_ids = session_event_counts[session_event_counts == 1].index
-
-    # Filter the main data for these sessions
-    single_event_sessions = data[data['session'].isin(single_event_session_ids)]
-
-    # Count the bounced sessions per page type
-    bounce_sessions_per_page = single_event_sessions.groupby('page_type').session.nunique().reset_index(
-        name='bounced_sessions')
-
-    # Merge with total sessions per page type to calculate bounce rate
-    total_sessions_per_page = data.groupby('page_type').session.nunique().reset_index(name='total_sessions')
-    page_bounce_rates = pd.merge(total_sessions_per_page, bounce_sessions_per_page,
-                                 on='page_type', how='left').fillna(0)
-    page_bounce_rates['bounce_rate'] = (page_bounce_rates['bounced_sessions'] /
-                                        page_bounce_rates['total_sessions']) * 100
-
+def show_bounce_rates(page_bounce_rates):
     # Display the bounce rates in Streamlit
     st.table(page_bounce_rates)
 
 
-def plot_daily_bounce_rates(data):
-    # Calculate the number of events per session
-    session_event_counts = data.groupby('session').size()
-
-    # Identify sessions with only one event
-    single_event_session_ids = session_event_counts[session_event_counts == 1].index
-
-    # Filter the main data for these sessions
-    single_event_sessions = data[data['session'].isin(single_event_session_ids)]
-
-    # Group by event_day and page_type to count sessions
-    daily_page_sessions = data.groupby(['event_day', 'page_type']).session.nunique().reset_index(name='total_sessions')
-
-    # Filter single_event_sessions by event_day and page_type
-    daily_single_event_page_sessions = single_event_sessions.groupby(
-        ['event_day', 'page_type']).session.nunique().reset_index(name='bounced_sessions')
-
-    # Merge based on event_day and page_type, then calculate bounce rate
-    daily_page_bounce_rates = pd.merge(daily_page_sessions, daily_single_event_page_sessions,
-                                       on=['event_day', 'page_type'], how='left').fillna(0)
-    daily_page_bounce_rates['bounce_rate'] = (daily_page_bounce_rates['bounced_sessions'] /
-                                              daily_page_bounce_rates['total_sessions']) * 100
+def plot_daily_bounce_rates(daily_page_bounce_rates):
+    import matplotlib.pyplot as plt
 
     # Plot bounce rate for each page type
     fig, ax = plt.subplots(figsize=(15, 8))
@@ -475,19 +289,40 @@ def plot_daily_bounce_rates(data):
     ax.legend()
     ax.grid(True, which='both', linestyle='--', linewidth=0.5)
     ax.xaxis.set_major_locator(plt.MaxNLocator(10))  # Limit the number of x-ticks to make the plot readable
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    ax.tick_params(axis='x', rotation=45)
+    fig.tight_layout()
+
+    return fig
 
-    # Display the plot in Streamlit
-    st.pyplot(fig)
 
+def show_loyal_users(loyal_users_ranked):
+    st.subheader(f'Top {len(loyal_users_ranked)} Loyal Users')
+    st.write(loyal_users_ranked)
 
-def show_loyal_users(data, top_n=20):
-    # Calculate the number of sessions per user
-    user_visits = data.groupby('user').session.nunique().sort_values(ascending=False)
 
-    # Top N users with the most visits
-    loyal_users_ranked = user_visits.head(top_n)
+def plot_cohort_retention(retention):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-    st.subheader(f'Top {top_n} Loyal Users')
-    st.write(loyal_users_ranked)
+    # Share of each cohort still visiting, relative to its size in the first period
+    rates = retention.div(retention[0], axis=0) * 100
+    period = retention.columns.name.split('s_since')[0]
+    labels = [f'{cohort:%Y-%m-%d} ({size:,.0f})' for cohort, size in zip(retention.index, retention[0])]
+
+    fig, ax = plt.subplots(figsize=(15, max(4, 0.4 * len(rates))))
+    sns.heatmap(rates, cmap="YlGnBu", annot=len(rates.columns) <= 20, fmt=".0f", vmin=0, vmax=100,
+                yticklabels=labels, ax=ax, cbar_kws={'label': 'Users returning (%)'})
+    ax.set_title(f'Retention by {period} of first visit')
+    ax.set_xlabel(f'{period.capitalize()}s since first visit')
+    ax.set_ylabel('First-visit cohort (users)')
+    fig.tight_layout()
+
+    return fig
+
+
+def show_run_profile(steps, totals):
+    # Optional sidebar panel with the measured steps of the current run, slowest first
+    st.sidebar.subheader('Run profile')
+    st.sidebar.dataframe(totals.style.format('{:.3f}'))
+    st.sidebar.dataframe(steps.sort_values('wall_s', ascending=False).style.format(
+        {'wall_s': '{:.3f}', 'cpu_s': '{:.3f}', 'mem_delta_mb': '{:+.1f}'}), hide_index=True)
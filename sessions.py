@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from loader import value_codes
+
+
+def build_session_summary(data):
+    # Order events by time within each session; the stable sort keeps file order for identical timestamps
+    event_date = data['event_date']
+    if not pd.api.types.is_datetime64_any_dtype(event_date):
+        event_date = pd.to_datetime(event_date)
+    session_codes, session_ids = value_codes(data['session'], sort=True)
+    order = np.lexsort((event_date.to_numpy(), session_codes))
+    # Events without a session (code -1) belong to none; NaT sorts last, so undated events end their session
+    order = order[session_codes[order] >= 0]
+    codes = session_codes[order]
+
+    # Locate the first and last event of every session in the ordered events
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=np.intp)
+    ends = np.r_[starts[1:], len(codes)] - 1
+    first_rows = order[starts]
+    last_rows = order[ends]
+
+    # One row per session: user, entry/exit page, event count and time span
+    sessions = pd.DataFrame({
+        'user': data['user'].array[first_rows],
+        'first_page': data['page_type'].array[first_rows],
+        'last_page': data['page_type'].array[last_rows],
+        'event_count': ends - starts + 1,
+        'start': event_date.to_numpy()[first_rows],
+        'end': event_date.to_numpy()[last_rows],
+    }, index=pd.Index(session_ids[codes[starts]], name='session'))
+    sessions['day'] = sessions['start'].dt.normalize()
+
+    return sessions
+
+
+def session_event_durations(data):
+    # Duration in seconds of every event's session (NaN without one), as end - start in build_session_summary:
+    # first and last event times per integer session code, so no session id is hashed or looked up per event
+    session_codes, session_ids = value_codes(data['session'])
+    timestamps = np.asarray(data['event_date'], dtype='datetime64[ns]').view(np.int64)
+    known = session_codes >= 0
+    first = np.full(len(session_ids), np.iinfo(np.int64).max)
+    last = np.full(len(session_ids), np.iinfo(np.int64).min)
+    np.minimum.at(first, session_codes[known], timestamps[known])
+    np.maximum.at(last, session_codes[known], timestamps[known])
+    # Sessions with a missing event time have no duration, like NaT - start
+    durations = np.where(first == np.iinfo(np.int64).min, np.nan, (last - first) / 1e9)
+    return np.append(durations, np.nan)[session_codes]
+
+
+def merge_session_summaries(earlier, later):
+    # Combine the summaries of two consecutive time ranges; sessions present in both are joined into one row
+    continued = earlier.index.intersection(later.index)
+    merged = later.copy()
+    if len(continued):
+        carried = earlier.loc[continued]
+        merged.loc[continued, 'user'] = carried['user']
+        merged.loc[continued, 'first_page'] = carried['first_page']
+        merged.loc[continued, 'start'] = carried['start']
+        merged.loc[continued, 'day'] = carried['day']
+        merged.loc[continued, 'event_count'] += carried['event_count']
+    return pd.concat([earlier.drop(continued), merged])
@@ -0,0 +1,130 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Default number of index bits: 2**14 registers, about 0.8% standard error
+DEFAULT_PRECISION = 14
+
+# Error bounds are reported at this many standard errors (~95%)
+ERROR_BOUND_Z = 1.96
+
+
+def hash_values(values):
+    # Stable 64-bit hashes; the fixed hash key makes sketches built in different processes mergeable.
+    # Categoricals hash by value, so they agree with the same values stored as strings
+    return pd.util.hash_pandas_object(pd.Series(values, copy=False), index=False).to_numpy()
+
+
+def _bit_length(words):
+    # Vectorized int.bit_length for uint64, split in halves so float conversion stays exact
+    high = (words >> np.uint64(32)).astype(np.float64)
+    low = (words & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def register_updates(hashes, precision):
+    # Split each hash into a register index (top bits) and the rank of the first set bit in the rest
+    remaining_bits = 64 - precision
+    index = (hashes >> np.uint64(remaining_bits)).astype(np.intp)
+    rest = hashes & np.uint64((1 << remaining_bits) - 1)
+    rank = (remaining_bits - _bit_length(rest) + 1).astype(np.uint8)
+    return index, rank
+
+
+def _alpha(registers):
+    if registers == 16:
+        return 0.673
+    if registers == 32:
+        return 0.697
+    if registers == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / registers)
+
+
+class HyperLogLog:
+    # Mergeable distinct-count sketch with 2**precision one-byte registers
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 18:
+            raise ValueError(f'precision must be between 4 and 18, got {precision}')
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def add(self, values):
+        self.add_hashes(hash_values(values))
+        return self
+
+    def add_hashes(self, hashes):
+        index, rank = register_updates(hashes, self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        # Union of the two sets: the sketch of the combined data, without rescanning it
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches with different precision')
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    __or__ = merge
+
+    def estimate(self):
+        registers = len(self.registers)
+        raw = _alpha(registers) * registers ** 2 / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * registers and zeros:
+            # Small-range correction: linear counting
+            return registers * math.log(registers / zeros)
+        return float(raw)
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def error_bound(self):
+        # Absolute half-width of the ~95% interval around estimate()
+        return ERROR_BOUND_Z * self.relative_error() * self.estimate()
+
+    def to_bytes(self):
+        return bytes([self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, payload):
+        return cls(payload[0], np.frombuffer(payload[1:], dtype=np.uint8).copy())
+
+
+def grouped_sketches(keys, values, precision=DEFAULT_PRECISION):
+    # One sketch of distinct values per group, built in a single vectorized pass. Takes 2**precision bytes per
+    # group, so it suits few groups (page types, days) rather than one per user.
+    # keys is a Series or a list of Series (for several group columns), aligned with values
+    if isinstance(keys, (list, tuple)):
+        codes, groups = pd.MultiIndex.from_arrays(keys).factorize()
+    else:
+        codes, groups = pd.factorize(keys)
+    present = (codes >= 0) & pd.Series(values, copy=False).notna().to_numpy()
+    index, rank = register_updates(hash_values(values)[present], precision)
+
+    registers = np.zeros((len(groups), 1 << precision), dtype=np.uint8)
+    np.maximum.at(registers.reshape(-1), codes[present] * (1 << precision) + index, rank)
+    return {group: HyperLogLog(precision, registers[i]) for i, group in enumerate(groups)}
+
+
+def merge_sketches(sketches):
+    # Combine sketches of several partitions (e.g. one per day) into the sketch of all of them
+    sketches = iter(sketches)
+    merged = next(sketches)
+    for sketch in sketches:
+        merged = merged | sketch
+    return merged
+
+
+def approx_nunique_by(keys, values, precision=DEFAULT_PRECISION, name='distinct'):
+    # Approximate groupby(keys)[values].nunique(), with the error bound of each estimate
+    sketches = grouped_sketches(keys, values, precision)
+    if isinstance(keys, (list, tuple)):
+        index = pd.MultiIndex.from_tuples(list(sketches), names=[key.name for key in keys])
+    else:
+        index = pd.Index(list(sketches), name=keys.name)
+    return pd.DataFrame({
+        name: [round(sketch.estimate()) for sketch in sketches.values()],
+        f'{name}_error': [sketch.error_bound() for sketch in sketches.values()],
+    }, index=index).sort_index()
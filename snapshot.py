@@ -0,0 +1,205 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+
+from compute_cache import file_fingerprint
+from filters import EventIndex, PositionIndex, load_event_index
+from loader import categorical_from_codes, category_dtype
+from sessions import build_session_summary
+
+# Optional directory for the snapshots of every source file, e.g. /dev/shm to hold them in shared memory rather
+# than in files; by default they are written next to the source
+SNAPSHOT_DIR = os.environ.get('AUTODOC_SNAPSHOT_DIR')
+
+# A snapshot holds one version of a source file as the app uses it: the event frame sorted by time, the position
+# lists of its filters and the session summary. Every column is an uncompressed Arrow IPC file holding one array
+# (categorical columns as their codes, with their categories in a file shared by the columns that have them), listed
+# in a manifest. Sessions and server processes memory-map the files and build their frames on the mapped buffers
+# without copying them, so the host holds the data once, however many viewers there are.
+# A snapshot is written to a temporary directory and renamed into place, so readers find a complete one or none.
+# A changed source gets a new snapshot and the older one is removed; processes that still map it keep its pages
+# until they move on to the new fingerprint
+
+
+def snapshot_root(source_path):
+    # Directory of the snapshots of one source file
+    source_path = os.path.abspath(source_path)
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    if SNAPSHOT_DIR is None:
+        return os.path.join(os.path.dirname(source_path), f'{name}.snapshot')
+    # Files of the same name in different directories share SNAPSHOT_DIR
+    return os.path.join(SNAPSHOT_DIR, f'{name}.{hashlib.sha1(source_path.encode()).hexdigest()[:12]}.snapshot')
+
+
+def _write_array(path, values):
+    # A single batch, so the array maps as contiguous buffers
+    array = values.combine_chunks() if isinstance(values, pa.ChunkedArray) else pa.array(values)
+    batch = pa.record_batch([array], names=['values'])
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+
+
+def _map_array(path):
+    # The array's buffers point into the mapping, which stays open as long as they are referenced
+    return pa.ipc.open_file(pa.memory_map(path)).read_all().column('values').chunk(0)
+
+
+def _pandas_values(array):
+    # Strings as an Arrow-backed array, everything else as a read-only NumPy view of the mapped buffer
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        return pd.arrays.ArrowStringArray(pa.chunked_array([array]))
+    return array.to_numpy(zero_copy_only=True)
+
+
+def _write_categories(directory, categories, written):
+    # Name of the file holding these categories, written unless another column has the same ones
+    for name, existing in written.items():
+        if existing is categories or existing.equals(categories):
+            return name
+    name = f'categories.{len(written)}'
+    _write_array(os.path.join(directory, f'{name}.arrow'), pa.array(categories.astype(str)))
+    written[name] = categories
+    return name
+
+
+def _write_frame(directory, name, frame, categories):
+    # Write every column and the index (unless it is the default one), and return how to read them back
+    columns = []
+    for position, (column, values) in enumerate(frame.items()):
+        spec = {'name': column, 'values': f'{name}.{position}'}
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            spec['categories'] = _write_categories(directory, values.cat.categories, categories)
+            spec['arrow_categories'] = isinstance(values.cat.categories.dtype, pd.StringDtype)
+            values = values.cat.codes
+        _write_array(os.path.join(directory, f"{spec['values']}.arrow"), values.to_numpy())
+        columns.append(spec)
+    index = None
+    if not frame.index.equals(pd.RangeIndex(len(frame))):
+        index = {'name': frame.index.name, 'values': f'{name}.index'}
+        _write_array(os.path.join(directory, f"{index['values']}.arrow"), pa.array(frame.index.array))
+    return {'columns': columns, 'index': index, 'length': len(frame)}
+
+
+def _map_frame(directory, spec, dtypes):
+    # The frame of a manifest entry on the mapped arrays; categorical columns with the same categories share a dtype
+    columns = {}
+    for column in spec['columns']:
+        values = _pandas_values(_map_array(os.path.join(directory, f"{column['values']}.arrow")))
+        if 'categories' in column:
+            name = column['categories']
+            if name not in dtypes:
+                categories = _map_array(os.path.join(directory, f'{name}.arrow'))
+                # Categories loaded as Python strings (the few page and event types) are read back as such
+                dtypes[name] = category_dtype(categories) if column['arrow_categories'] else pd.CategoricalDtype(
+                    categories.to_pylist())
+            values = categorical_from_codes(values, dtypes[name])
+        columns[column['name']] = values
+    if spec['index'] is None:
+        index = pd.RangeIndex(spec['length'])
+    else:
+        index_values = _pandas_values(_map_array(os.path.join(directory, f"{spec['index']['values']}.arrow")))
+        index = pd.Index(index_values, name=spec['index']['name'], copy=False)
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+class SharedDataset:
+    # The event index and session summary of one version of a source file, read from its snapshot
+
+    def __init__(self, index, sessions, path=None):
+        self.index = index
+        self.sessions = sessions
+        # Snapshot directory, None when the data is held by this process only
+        self.path = path
+
+    @property
+    def nbytes(self):
+        # Size for the compute cache: mapped pages are shared with every process on the host and can be dropped and
+        # read again by the OS, so only a dataset held by this process counts
+        if self.path is not None:
+            return 0
+        return self.index.nbytes + int(self.sessions.memory_usage(index=True, deep=True).sum())
+
+
+def write_snapshot(directory, index, sessions):
+    os.makedirs(directory)
+    categories = {}
+    manifest = {
+        'events': _write_frame(directory, 'events', index.data, categories),
+        'sessions': _write_frame(directory, 'sessions', sessions, categories),
+        'indexes': {},
+    }
+    for column, position_index in index.indexes.items():
+        for part in ('positions', 'offsets'):
+            _write_array(os.path.join(directory, f'index.{column}.{part}.arrow'), getattr(position_index, part))
+        manifest['indexes'][column] = [str(value) for value in position_index.values]
+    with open(os.path.join(directory, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file)
+
+
+def open_snapshot(directory):
+    with open(os.path.join(directory, 'manifest.json')) as file:
+        manifest = json.load(file)
+    dtypes = {}
+    data = _map_frame(directory, manifest['events'], dtypes)
+    sessions = _map_frame(directory, manifest['sessions'], dtypes)
+    indexes = {
+        column: PositionIndex.from_arrays(values, *[
+            _pandas_values(_map_array(os.path.join(directory, f'index.{column}.{part}.arrow')))
+            for part in ('positions', 'offsets')])
+        for column, values in manifest['indexes'].items()
+    }
+    return SharedDataset(EventIndex(data, indexes), sessions, directory)
+
+
+def _publish_snapshot(source_path, root, fingerprint):
+    index = load_event_index(source_path)
+    tmp_path = os.path.join(root, f'.{fingerprint}.{os.getpid()}.tmp')
+    try:
+        write_snapshot(tmp_path, index, build_session_summary(index.data))
+        os.rename(tmp_path, os.path.join(root, fingerprint))
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    # Earlier versions of the source; temporary directories of other writers start with a dot
+    for name in os.listdir(root):
+        if name != fingerprint and not name.startswith('.'):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def load_shared_dataset(source_path):
+    # Attach to the snapshot of the source's current version, writing it first when the host has none yet
+    fingerprint = file_fingerprint(source_path)
+    root = snapshot_root(source_path)
+    path = os.path.join(root, fingerprint)
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(root, exist_ok=True)
+            with open(os.path.join(root, '.lock'), 'w') as lock:
+                # One process writes it while the others wait, then they all map the same files
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not os.path.isdir(path):
+                    _publish_snapshot(source_path, root, fingerprint)
+        except OSError:
+            # Read-only filesystem: keep the dataset in this process's memory only
+            index = load_event_index(source_path)
+            return SharedDataset(index, build_session_summary(index.data))
+    try:
+        return open_snapshot(path)
+    except FileNotFoundError:
+        # Removed by a process that published a newer version of the source since the check above
+        return load_shared_dataset(source_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Write the shared snapshot of an event file, e.g. before the server processes start')
+    parser.add_argument('source', help='event file (CSV or Parquet)')
+    args = parser.parse_args()
+
+    dataset = load_shared_dataset(args.source)
+    print(f'{len(dataset.index.data)} events, {len(dataset.sessions)} sessions in {dataset.path}')
@@ -0,0 +1,260 @@
+import argparse
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import metrics
+from funnel import BROWSE_PAGE_TYPES, build_funnel_table
+from loader import iter_event_batches, load_events
+
+# Rows inserted per executemany call while bulk loading
+INSERT_BATCH_ROWS = 500_000
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+# Timestamps are int64 nanoseconds like the pandas frame; event_day is the midnight of event_ts.
+# Rows keep the file order in their rowid, which breaks timestamp ties the way the stable sorts do in pandas
+EVENTS_TABLE = """
+    CREATE TABLE events (
+        user TEXT,
+        session TEXT,
+        page_type TEXT,
+        event_type TEXT,
+        product TEXT,
+        event_ts INTEGER,
+        event_day INTEGER
+    )"""
+
+# Created after the bulk load; (session, event_ts) also serves the per-session ordering of first and last pages
+EVENTS_INDEXES = [
+    'CREATE INDEX events_session ON events (session, event_ts)',
+    'CREATE INDEX events_user ON events (user, session)',
+    'CREATE INDEX events_day ON events (event_day, page_type)',
+    'CREATE INDEX events_page_type ON events (page_type, session)',
+]
+
+
+def _insert_rows(batch):
+    # Arrow batch -> rows for executemany, without going through a pandas frame. Missing dates stay NULL; they are
+    # filled for the day arithmetic only, so the others keep every nanosecond
+    event_ts = pc.cast(batch.column('event_date'), pa.int64())
+    missing = event_ts.is_null().to_numpy(zero_copy_only=False)
+    filled = event_ts.fill_null(0).to_numpy(zero_copy_only=False)
+    event_day = pa.array(filled - filled % NS_PER_DAY, mask=missing)
+    columns = [batch.column(name).cast(pa.string()).to_pylist()
+               for name in ('user', 'session', 'page_type', 'event_type', 'product')]
+    return zip(*columns, event_ts.to_pylist(), event_day.to_pylist())
+
+
+def load_sqlite(source_path, db_path):
+    # Bulk load an event file into a new SQLite database and index it; the database replaces db_path atomically
+    tmp_path = f'{db_path}.{os.getpid()}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        # Nothing to recover from if the load fails half-way: the temporary file is simply discarded
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute(EVENTS_TABLE)
+        for batch in iter_event_batches(source_path, batch_rows=INSERT_BATCH_ROWS):
+            connection.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)', _insert_rows(batch))
+        for statement in EVENTS_INDEXES:
+            connection.execute(statement)
+        connection.execute('ANALYZE')
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, db_path)
+    return db_path
+
+
+class SQLiteEventStore:
+    # Events in a SQLite database, with the session metrics computed by the database.
+    # Every method returns the same frame as the pandas function of the same name in metrics.py
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _query(self, sql, params=()):
+        # A read-only connection per query, so the store can be shared by the threads of concurrent sessions
+        connection = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+        try:
+            return pd.read_sql_query(sql, connection, params=params)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _page_types(values):
+        # Page types as a categorical with sorted categories, as table_to_events loads them
+        return pd.Categorical(values, categories=sorted(values.dropna().unique()))
+
+    def calculate_funnel_user_counts(self):
+        browse = ', '.join('?' * len(BROWSE_PAGE_TYPES))
+        counts = self._query(f"""
+            SELECT COUNT(DISTINCT user),
+                   COUNT(DISTINCT CASE WHEN page_type IN ({browse}) THEN user END),
+                   COUNT(DISTINCT CASE WHEN page_type = 'product_page' THEN user END),
+                   COUNT(DISTINCT CASE WHEN event_type = 'add_to_cart' THEN user END),
+                   COUNT(DISTINCT CASE WHEN event_type = 'order' THEN user END)
+            FROM events""", BROWSE_PAGE_TYPES)
+        return build_funnel_table([int(count) for count in counts.iloc[0]])
+
+    def compute_exit_rates(self):
+        # The exit page of a session is the page of its last event, ties going to the later row and undated events
+        # counting as the latest, as in pandas. Rows are ordered by page views, like value_counts in pandas
+        rates = self._query("""
+            WITH last_events AS (
+                SELECT page_type,
+                       ROW_NUMBER() OVER (PARTITION BY session
+                                          ORDER BY event_ts IS NULL DESC, event_ts DESC, rowid DESC) AS from_end
+                FROM events
+                WHERE session IS NOT NULL
+            ),
+            exits AS (SELECT page_type, COUNT(*) AS exits FROM last_events WHERE from_end = 1 GROUP BY page_type),
+            views AS (SELECT page_type, COUNT(*) AS views FROM events WHERE page_type IS NOT NULL GROUP BY page_type)
+            SELECT views.page_type, exits.exits * 100.0 / views.views AS exit_rate
+            FROM views LEFT JOIN exits USING (page_type)
+            ORDER BY views.views DESC, views.page_type""")
+        return pd.DataFrame({'Page Type': self._page_types(rates['page_type']),
+                             'Exit Rate (%)': rates['exit_rate'].astype(float)})
+
+    def compute_average_duration_by_page(self):
+        # Mean over events of their session's duration, weighted by the events of each page type in the session.
+        # A session with an undated event has no duration, as in pandas
+        durations = self._query("""
+            WITH spans AS (
+                SELECT session, (MAX(event_ts) - MIN(event_ts)) / 1e9 AS duration FROM events
+                WHERE session IS NOT NULL GROUP BY session HAVING COUNT(event_ts) = COUNT(*)
+            ),
+            page_events AS (
+                SELECT session, page_type, COUNT(*) AS events FROM events
+                WHERE page_type IS NOT NULL GROUP BY session, page_type
+            )
+            SELECT page_type, SUM(duration * events) / SUM(events) AS duration
+            FROM page_events JOIN spans USING (session)
+            GROUP BY page_type
+            ORDER BY page_type""")
+        return pd.DataFrame({'Page Type': self._page_types(durations['page_type']),
+                             'Average Duration (seconds)': durations['duration']})
+
+    def compute_bounce_rates(self):
+        rates = self._query("""
+            WITH bounced AS (
+                SELECT MIN(page_type) AS page_type FROM events
+                WHERE session IS NOT NULL GROUP BY session HAVING COUNT(*) = 1
+            ),
+            bounced_per_page AS (
+                SELECT page_type, COUNT(*) AS bounced_sessions FROM bounced GROUP BY page_type
+            ),
+            totals AS (
+                SELECT page_type, COUNT(DISTINCT session) AS total_sessions FROM events
+                WHERE page_type IS NOT NULL GROUP BY page_type
+            )
+            SELECT page_type, total_sessions, COALESCE(bounced_sessions, 0) AS bounced_sessions
+            FROM totals LEFT JOIN bounced_per_page USING (page_type)
+            ORDER BY page_type""")
+        rates['page_type'] = self._page_types(rates['page_type'])
+        rates['bounce_rate'] = rates['bounced_sessions'] / rates['total_sessions'] * 100
+        return rates
+
+    def compute_daily_bounce_rates(self):
+        rates = self._query("""
+            WITH bounced AS (
+                SELECT MIN(event_day) AS event_day, MIN(page_type) AS page_type FROM events
+                WHERE session IS NOT NULL GROUP BY session HAVING COUNT(*) = 1
+            ),
+            bounced_per_page AS (
+                SELECT event_day, page_type, COUNT(*) AS bounced_sessions FROM bounced GROUP BY event_day, page_type
+            ),
+            totals AS (
+                SELECT event_day, page_type, COUNT(DISTINCT session) AS total_sessions FROM events
+                WHERE page_type IS NOT NULL AND event_day IS NOT NULL GROUP BY event_day, page_type
+            )
+            SELECT event_day, page_type, total_sessions, COALESCE(bounced_sessions, 0) AS bounced_sessions
+            FROM totals LEFT JOIN bounced_per_page USING (event_day, page_type)
+            ORDER BY event_day, page_type""")
+        rates['event_day'] = pd.to_datetime(rates['event_day'], unit='ns')
+        rates['page_type'] = self._page_types(rates['page_type'])
+        rates['bounce_rate'] = rates['bounced_sessions'] / rates['total_sessions'] * 100
+        return rates
+
+    def compute_loyal_users(self, top_n=20):
+        visits = self._query("""
+            SELECT user, COUNT(DISTINCT session) AS session FROM events
+            WHERE user IS NOT NULL GROUP BY user
+            ORDER BY session DESC, user
+            LIMIT ?""", (top_n,))
+        return visits.set_index('user')['session']
+
+
+# Metrics computed by the store, by the name of their pandas function in metrics.py
+SQL_METRICS = [
+    'calculate_funnel_user_counts',
+    'compute_exit_rates',
+    'compute_average_duration_by_page',
+    'compute_bounce_rates',
+    'compute_daily_bounce_rates',
+    'compute_loyal_users',
+]
+
+
+def _comparable(value):
+    # Categorical dtypes are not part of a metric's meaning; the row order is
+    frame = value.reset_index(drop=True)
+    return frame.apply(lambda column: column.astype(str) if isinstance(column.dtype, pd.CategoricalDtype)
+                       else column)
+
+
+def _check_loyal_users(actual, expected, data):
+    # Users tied at the last count shown may be cut differently, so the counts must match in rank order and each
+    # user listed must have the count it is listed with
+    assert actual.tolist() == expected.tolist(), f'session counts differ: {actual.tolist()} != {expected.tolist()}'
+    sessions_per_user = data.groupby('user', observed=True).session.nunique()
+    sessions_per_user.index = sessions_per_user.index.astype(object)
+    pd.testing.assert_series_equal(actual, sessions_per_user.reindex(actual.index), check_dtype=False,
+                                   check_names=False)
+
+
+def check_parity(source_path, store, rtol=1e-9, names=SQL_METRICS):
+    # Compare pushed-down metrics (every one by default) with their pandas versions on the same events; returns the
+    # mismatching names
+    data = load_events(source_path)
+    sessions = metrics.build_session_summary(data)
+    mismatches = []
+    for name in names:
+        func = getattr(metrics, name)
+        expected = func(data) if name in ('calculate_funnel_user_counts', 'compute_average_duration_by_page',
+                                          'compute_loyal_users') else func(data, sessions)
+        try:
+            if name == 'compute_loyal_users':
+                _check_loyal_users(getattr(store, name)(), expected, data)
+            else:
+                pd.testing.assert_frame_equal(_comparable(getattr(store, name)()), _comparable(expected),
+                                              check_dtype=False, rtol=rtol)
+        except AssertionError as error:
+            mismatches.append(name)
+            print(f'{name}: {error}', file=sys.stderr)
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load events into a SQLite store and check that the SQL metrics '
+                                                 'match the pandas ones')
+    parser.add_argument('source', help='event file (CSV or Parquet)')
+    parser.add_argument('database', help='SQLite database file')
+    parser.add_argument('--reload', action='store_true', help='load the events even if the database exists')
+    parser.add_argument('--parity', action='store_true', help='compare every SQL metric with the pandas one')
+    args = parser.parse_args()
+
+    if args.reload or not os.path.exists(args.database):
+        load_sqlite(args.source, args.database)
+        print(f'Events loaded into {args.database}')
+    if args.parity:
+        failed = check_parity(args.source, SQLiteEventStore(args.database))
+        print('Parity failed: ' + ', '.join(failed) if failed else f'All {len(SQL_METRICS)} metrics match')
+        sys.exit(1 if failed else 0)
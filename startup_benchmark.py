@@ -0,0 +1,149 @@
+import argparse
+import ast
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+# Budgets in seconds for a cold start of the app; a run over any of them fails
+IMPORT_BUDGET_S = 2.0
+FIRST_BYTE_BUDGET_S = 4.0
+FIRST_RUN_BUDGET_S = 5.0
+
+# Modules only the charts need; importing any of them before the first run is a regression of its own
+DEFERRED_MODULES = ('matplotlib', 'seaborn')
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+# Every measurement runs in a fresh interpreter, so nothing is imported or cached yet, like on a new dyno.
+# Import time covers the import statements of the app script; time to first byte is from launching
+# `streamlit run` until the page's first byte is served; the first run is one full script run in Streamlit's test
+# harness (imports, data load and everything shown before a section is picked), the work of the first request
+
+IMPORT_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'deferred_loaded': [name for name in {deferred!r} if name in sys.modules]}}))
+'''
+
+FIRST_RUN_PROBE = '''
+import json, os, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({app_path!r}, default_timeout={timeout!r})
+app.run()
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'exceptions': [str(error.value) for error in app.exception]}}), flush=True)
+# Skip waiting for the app's background warm-up at exit
+os._exit(0)
+'''
+
+
+def app_imports(app_path):
+    # The top-level import statements of the app script, as source
+    with open(app_path) as source:
+        tree = ast.parse(source.read())
+    return '\n'.join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def run_probe(code, app_path, timeout):
+    # Run a probe in a fresh interpreter from the app's directory and return the JSON it prints last
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(app_path), capture_output=True,
+                            text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f'Startup probe failed:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def time_to_first_byte(app_path, timeout):
+    # Seconds from launching the server until it serves the first byte of the page, None after timeout
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'streamlit', 'run', app_path, '--server.headless', 'true',
+                               '--server.port', str(port), '--browser.gatherUsageStats', 'false'],
+                              cwd=os.path.dirname(app_path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=timeout) as response:
+                    response.read(1)
+                    return time.perf_counter() - start
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError(f'Streamlit exited with status {server.returncode} before serving the page')
+                time.sleep(0.05)
+        return None
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def measure_startup(app_path=APP_PATH, repeat=3, timeout=120):
+    # Best of repeat cold starts for every measurement
+    imports = [run_probe(IMPORT_PROBE.format(imports=app_imports(app_path), deferred=DEFERRED_MODULES), app_path,
+                         timeout) for _ in range(repeat)]
+    first_bytes = [time_to_first_byte(app_path, timeout) for _ in range(repeat)]
+    first_runs = [run_probe(FIRST_RUN_PROBE.format(app_path=app_path, timeout=timeout), app_path, timeout)
+                  for _ in range(repeat)]
+    served = [seconds for seconds in first_bytes if seconds is not None]
+    return {
+        'import_s': min(probe['seconds'] for probe in imports),
+        'deferred_loaded': sorted({name for probe in imports for name in probe['deferred_loaded']}),
+        'first_byte_s': min(served) if served else None,
+        'first_run_s': min(probe['seconds'] for probe in first_runs),
+        'first_run_exceptions': first_runs[-1]['exceptions'],
+    }
+
+
+def over_budget(results, budgets):
+    # Descriptions of every budget the results exceed
+    failures = [f'{name} {results[name] if results[name] is None else round(results[name], 3)}s > {budget}s'
+                for name, budget in budgets.items() if results[name] is None or results[name] > budget]
+    if results['deferred_loaded']:
+        failures.append(f'imported at startup: {", ".join(results["deferred_loaded"])}')
+    if results['first_run_exceptions']:
+        failures.append(f'first run raised: {"; ".join(results["first_run_exceptions"])}')
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time a cold start of the app: imports, time to first byte and '
+                                                 'the first script run, against time budgets')
+    parser.add_argument('--app', default=APP_PATH, help='Streamlit script to start')
+    parser.add_argument('--repeat', type=int, default=3, help='cold starts per measurement, the best one counts')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_S)
+    parser.add_argument('--first-byte-budget', type=float, default=FIRST_BYTE_BUDGET_S)
+    parser.add_argument('--first-run-budget', type=float, default=FIRST_RUN_BUDGET_S)
+    parser.add_argument('--output', help='write the results as JSON to this file (default: stdout)')
+    args = parser.parse_args()
+
+    app_path = os.path.abspath(args.app)
+    results = measure_startup(app_path, args.repeat)
+    # Imported once the cold starts are measured, as benchmark loads matplotlib and every module of the app
+    from benchmark import environment
+    budgets = {'import_s': args.import_budget, 'first_byte_s': args.first_byte_budget,
+               'first_run_s': args.first_run_budget}
+    report = {'environment': environment(), 'app': app_path, 'repeat': args.repeat, 'budgets': budgets,
+              'results': results, 'failures': over_budget(results, budgets)}
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if report['failures']:
+        for failure in report['failures']:
+            print(f'OVER BUDGET {failure}', file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,117 @@
+import argparse
+
+import numpy as np
+
+from funnel import FUNNEL_STAGES, build_funnel_table, funnel_stage_masks
+from loader import DEFAULT_BATCH_ROWS, iter_event_batches
+
+
+class UserDictionary:
+    # Assigns every distinct user a dense integer id, in order of first appearance
+
+    def __init__(self):
+        self._ids = {}
+
+    def encode(self, users):
+        # Map a batch of user values to ids; only the batch's distinct values go through Python
+        codes, uniques = users.factorize()
+        lookup = np.fromiter((self._ids.setdefault(user, len(self._ids)) for user in uniques),
+                             dtype=np.int64, count=len(uniques))
+        ids = lookup[codes]
+        # Missing users (code -1) map to -1
+        ids[codes < 0] = -1
+        return ids
+
+    def __contains__(self, value):
+        return value in self._ids
+
+    def values(self):
+        # Distinct values in id order
+        return list(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class UserBitmap:
+    # Exact set of user ids stored as one bit per id
+
+    def __init__(self):
+        self._words = np.zeros(1, dtype=np.uint64)
+
+    def add(self, ids):
+        ids = ids[ids >= 0].astype(np.uint64)
+        if not len(ids):
+            return
+        needed = int(ids.max() >> np.uint64(6)) + 1
+        if needed > len(self._words):
+            # Grow geometrically so repeated batches don't copy the bitmap every time
+            words = np.zeros(max(needed, 2 * len(self._words)), dtype=np.uint64)
+            words[:len(self._words)] = self._words
+            self._words = words
+        np.bitwise_or.at(self._words, (ids >> np.uint64(6)).astype(np.intp),
+                         np.left_shift(np.uint64(1), ids & np.uint64(63)))
+
+    def union(self, other):
+        merged = UserBitmap()
+        size = max(len(self._words), len(other._words))
+        merged._words = np.zeros(size, dtype=np.uint64)
+        merged._words[:len(self._words)] |= self._words
+        merged._words[:len(other._words)] |= other._words
+        return merged
+
+    def __len__(self):
+        # Population count over the packed bits
+        return int(np.unpackbits(self._words.view(np.uint8)).sum())
+
+
+class StreamingFunnel:
+    # Accumulates exact per-stage distinct users over batches of events
+
+    def __init__(self):
+        self.users = UserDictionary()
+        self.stages = [UserBitmap() for _ in FUNNEL_STAGES]
+        self.rows = 0
+
+    def update(self, batch):
+        # batch is a pandas frame with user, page_type and event_type columns
+        ids = self.users.encode(batch['user'])
+        for stage, mask in zip(self.stages, funnel_stage_masks(batch)):
+            stage.add(ids[mask])
+        self.rows += len(batch)
+
+    def user_counts(self):
+        return [len(stage) for stage in self.stages]
+
+    def funnel_table(self, with_conversion_rates=True):
+        return build_funnel_table(self.user_counts(), with_conversion_rates=with_conversion_rates)
+
+
+def stream_funnel_user_counts(path, batch_rows=DEFAULT_BATCH_ROWS):
+    # Same table as calculate_funnel_user_counts, reading the log in batches, for files too large to load.
+    # Memory is bounded by one batch plus the dictionary of distinct user ids and one bit per user and stage,
+    # whatever the number of rows
+    funnel = StreamingFunnel()
+    for batch in iter_event_batches(path, columns=['user', 'page_type', 'event_type'], batch_rows=batch_rows):
+        funnel.update(batch.to_pandas())
+    return funnel.funnel_table()
+
+
+def stream_visits(path, batch_rows=DEFAULT_BATCH_ROWS):
+    # Streaming counterpart of display_visits
+    funnel = StreamingFunnel()
+    for batch in iter_event_batches(path, columns=['user', 'page_type', 'event_type'], batch_rows=batch_rows):
+        funnel.update(batch.to_pandas())
+    return funnel.funnel_table(with_conversion_rates=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute the user funnel of an event file in batches, without '
+                                                 'loading it into memory')
+    parser.add_argument('source', help='event file (CSV or Parquet)')
+    parser.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS, help='events read per batch')
+    parser.add_argument('--visits', action='store_true', help='user counts only, without conversion rates')
+    args = parser.parse_args()
+
+    stream = stream_visits if args.visits else stream_funnel_user_counts
+    print(stream(args.source, batch_rows=args.batch_rows).to_string(index=False))
@@ -0,0 +1,147 @@
+import argparse
+import math
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from loader import EVENT_SCHEMA
+
+PAGE_TYPES = ['listing_page', 'order_page', 'product_page', 'search_listing_page']
+EVENT_TYPES = ['add_to_cart', 'order', 'page_view']
+
+# Landing page distribution and page-to-page transition probabilities (rows: current page, in PAGE_TYPES order).
+# Listing pages lead to products, products sometimes to the order page, which mostly loops on itself
+LANDING_PAGES = np.array([0.45, 0.00, 0.40, 0.15])
+PAGE_TRANSITIONS = np.array([
+    [0.35, 0.00, 0.55, 0.10],
+    [0.20, 0.30, 0.40, 0.10],
+    [0.30, 0.15, 0.40, 0.15],
+    [0.10, 0.00, 0.55, 0.35],
+])
+
+# Share of one-event sessions, and the chance that a longer session stops after each further event
+BOUNCE_RATE = 0.55
+STOP_PROBABILITY = 0.2
+
+# Funnel actions: add to cart on a product page, order on the order page
+ADD_TO_CART_RATE = 0.12
+ORDER_RATE = 0.6
+
+# Average sessions per user; activity is skewed so a few users come back very often
+SESSIONS_PER_USER = 2.5
+N_PRODUCTS = 50_000
+
+# Events span DAYS days from START, with more sessions in the evening than at night
+START = np.datetime64('2023-10-01', 'ns')
+DAYS = 30
+HOURLY_TRAFFIC = np.array([2, 1, 1, 1, 1, 2, 3, 5, 6, 6, 6, 6, 7, 6, 6, 6, 6, 7, 8, 9, 9, 8, 6, 4], dtype=float)
+
+# Mean and cap of the gap between consecutive events of a session, in seconds
+MEAN_GAP_SECONDS = 45
+MAX_GAP_SECONDS = 1800
+
+# Sessions generated per chunk; bounds memory whatever the total size
+CHUNK_SESSIONS = 1_000_000
+
+MEAN_SESSION_LENGTH = BOUNCE_RATE + (1 - BOUNCE_RATE) * (1 + 1 / STOP_PROBABILITY)
+
+
+def _ids(prefix, numbers):
+    return pc.binary_join_element_wise(pa.scalar(prefix), pc.cast(pa.array(numbers), pa.string()), '')
+
+
+def generate_chunk(rng, first_session, n_sessions, n_users):
+    # Events of sessions first_session .. first_session + n_sessions - 1 as an Arrow table, ordered by time
+    lengths = np.where(rng.random(n_sessions) < BOUNCE_RATE, 1, 1 + rng.geometric(STOP_PROBABILITY, n_sessions))
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    n_events = int(lengths.sum())
+
+    # Page sequence of every session as a Markov chain, one vectorized step per position
+    pages = np.empty(n_events, dtype=np.int32)
+    landing = np.cumsum(LANDING_PAGES)
+    pages[starts] = (rng.random(n_sessions)[:, None] > landing).sum(axis=1)
+    transitions = np.cumsum(PAGE_TRANSITIONS, axis=1)
+    for position in range(1, lengths.max()):
+        current = starts[lengths > position] + position
+        previous = pages[current - 1]
+        pages[current] = (rng.random(len(current))[:, None] > transitions[previous]).sum(axis=1)
+
+    # Funnel actions on product and order pages, with a popularity-skewed product
+    actions = rng.random(n_events)
+    events = np.full(n_events, EVENT_TYPES.index('page_view'), dtype=np.int32)
+    events[(pages == PAGE_TYPES.index('product_page')) & (actions < ADD_TO_CART_RATE)] = EVENT_TYPES.index(
+        'add_to_cart')
+    events[(pages == PAGE_TYPES.index('order_page')) & (actions < ORDER_RATE)] = EVENT_TYPES.index('order')
+    has_product = (pages == PAGE_TYPES.index('product_page')) | (events != EVENT_TYPES.index('page_view'))
+    products = (N_PRODUCTS * rng.random(n_events) ** 3).astype(np.int64)
+
+    # Session start: a uniform day, an hour from the daily traffic profile, a uniform second in that hour
+    hours = (rng.random(n_sessions)[:, None] > np.cumsum(HOURLY_TRAFFIC / HOURLY_TRAFFIC.sum())).sum(axis=1)
+    start_seconds = rng.integers(0, DAYS, n_sessions) * 86400 + hours * 3600 + rng.integers(0, 3600, n_sessions)
+    gaps = np.minimum(rng.exponential(MEAN_GAP_SECONDS, n_events), MAX_GAP_SECONDS).astype(np.int64)
+    gaps[starts] = 0
+    session_of_event = np.repeat(np.arange(n_sessions), lengths)
+    elapsed = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[starts], lengths)
+    seconds = start_seconds[session_of_event] + elapsed
+
+    # Skewed user activity: low user numbers get most of the sessions
+    users = (n_users * rng.random(n_sessions) ** 2).astype(np.int64)
+
+    order = np.argsort(seconds, kind='stable')
+    table = pa.table({
+        'user': _ids('u', users[session_of_event][order]),
+        'session': _ids('s', (first_session + session_of_event)[order]),
+        'page_type': pa.DictionaryArray.from_arrays(pages[order], PAGE_TYPES),
+        'event_type': pa.DictionaryArray.from_arrays(events[order], EVENT_TYPES),
+        'product': pc.if_else(pa.array(has_product[order]), _ids('p', products[order]), pa.scalar(None, pa.string())),
+        'event_date': pa.array(START + seconds[order] * np.timedelta64(1, 's')),
+    })
+    return table.cast(EVENT_SCHEMA)
+
+
+def generate_events(path, rows, seed=0, chunk_sessions=CHUNK_SESSIONS):
+    # Write exactly rows synthetic events to a Parquet file; the same rows and seed always give the same file
+    rng = np.random.default_rng(seed)
+    n_sessions = math.ceil(rows / MEAN_SESSION_LENGTH)
+    n_users = max(1, round(n_sessions / SESSIONS_PER_USER))
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    written = 0
+    first_session = 0
+    with pq.ParquetWriter(tmp_path, EVENT_SCHEMA) as writer:
+        while written < rows:
+            # Size the last chunk to the remaining rows, so the cut below only drops a few of its latest events
+            n_chunk = min(chunk_sessions, math.ceil((rows - written) / MEAN_SESSION_LENGTH))
+            chunk = generate_chunk(rng, first_session, n_chunk, n_users).slice(0, rows - written)
+            writer.write_table(chunk)
+            written += len(chunk)
+            first_session += n_chunk
+    os.replace(tmp_path, path)
+    return path
+
+
+def synthetic_path(directory, rows, seed=0):
+    return os.path.join(directory, f'synthetic-{rows}-seed{seed}.parquet')
+
+
+def ensure_synthetic(directory, rows, seed=0):
+    # Generate the dataset once and reuse it across benchmark runs
+    path = synthetic_path(directory, rows, seed)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        generate_events(path, rows, seed)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a seeded synthetic event log as Parquet')
+    parser.add_argument('rows', type=int, help='number of events')
+    parser.add_argument('output', help='Parquet file to write')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate_events(args.output, args.rows, seed=args.seed)
+    print(f'{args.rows} events written to {args.output}')
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from cohorts import cohort_retention
+from loader import load_events
+from synthetic import generate_events
+
+
+@pytest.fixture(scope='module')
+def events(tmp_path_factory):
+    source = str(tmp_path_factory.mktemp('cohorts') / 'events.parquet')
+    generate_events(source, 5_000, seed=10)
+    return load_events(source)
+
+
+def reference_retention(data, period):
+    # Reference: cohorts and activity periods from to_period, distinct users from a groupby
+    data = data.dropna(subset=['user', 'event_date'])
+    freq = {'day': 'D', 'week': 'W-SUN'}[period]
+    active = data['event_date'].dt.to_period(freq)
+    cohort = active.groupby(data['user'], observed=True).transform('min')
+    offset = (active - cohort).map(lambda difference: difference.n)
+    counts = data['user'].groupby([cohort.dt.start_time.rename('cohort'), offset], observed=True).nunique()
+    retention = counts.unstack(fill_value=0).astype(float)
+
+    # Periods after the end of the data are not observed yet
+    last = active.max()
+    for cohort_start in retention.index:
+        unobserved = (last - pd.Timestamp(cohort_start).to_period(freq)).n + 1
+        retention.loc[cohort_start, retention.columns >= unobserved] = np.nan
+    return retention
+
+
+@pytest.mark.parametrize('period', ['day', 'week'])
+def test_retention_equals_the_to_period_reference(events, period):
+    retention = cohort_retention(events['user'], events['event_date'], period)
+    expected = reference_retention(events, period)
+    np.testing.assert_array_equal(retention.index.to_numpy(), expected.index.to_numpy())
+    np.testing.assert_array_equal(retention.to_numpy(), expected.reindex(columns=retention.columns).to_numpy())
+
+
+@pytest.mark.parametrize('period', ['day', 'week'])
+def test_missing_users_and_times_are_left_out(events, period):
+    missing = np.random.default_rng(0).random(len(events)) < 0.05
+    data = events.copy()
+    data['event_date'] = pd.Series(pa.array(events['event_date'], mask=missing)).astype('datetime64[ns]')
+    data['user'] = data['user'].mask(np.roll(missing, 1))
+
+    retention = cohort_retention(data['user'], data['event_date'], period)
+    expected = reference_retention(data, period)
+    assert retention.index.min() >= events['event_date'].min().normalize() - pd.Timedelta(days=6)
+    np.testing.assert_array_equal(retention.to_numpy(), expected.reindex(columns=retention.columns).to_numpy())
@@ -0,0 +1,67 @@
+import os
+
+import pandas as pd
+import pytest
+
+import metrics
+from cube import EventCube, cube_path_for, load_event_cube
+from filters import EventIndex
+from loader import load_events
+from synthetic import generate_events
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    return generate_events(str(tmp_path_factory.mktemp('cube') / 'events.parquet'), 5_000, seed=7)
+
+
+@pytest.fixture(scope='module')
+def index(source):
+    return EventIndex.build(load_events(source))
+
+
+def assert_rollups_match(cube, data):
+    pd.testing.assert_series_equal(cube.daily_interactions(), metrics.compute_daily_interactions(data),
+                                   check_freq=False)
+    pd.testing.assert_frame_equal(cube.interactions_heatmap(), metrics.compute_interactions_heatmap(data),
+                                  check_names=False, check_dtype=False)
+    expected = metrics.compute_page_type_counts(data)
+    counts = cube.page_type_counts()
+    assert counts.to_dict() == expected[expected > 0].to_dict()
+    assert counts.is_monotonic_decreasing
+
+
+def test_rollups_equal_the_event_metrics(index):
+    assert_rollups_match(EventCube.build(index.data), index.data)
+
+
+@pytest.mark.parametrize('filters', [
+    {'start': '2023-10-05'},
+    {'start': '2023-10-05', 'end': '2023-10-12'},
+    {'page_type': ('product_page', 'listing_page')},
+    {'event_type': ('order',)},
+    {'end': '2023-10-20', 'page_type': ('listing_page',), 'event_type': ('page_view', 'add_to_cart')},
+])
+def test_filter_equals_the_cube_of_the_filtered_events(index, filters):
+    filtered = EventCube.build(index.data).filter(**filters)
+    data = index.filter(**filters)
+    assert filtered.counts['count'].sum() == len(data)
+    assert_rollups_match(filtered, data)
+
+
+def test_persisted_cube_is_reused_without_loading_the_events(tmp_path, source):
+    copy = str(tmp_path / 'events.parquet')
+    with open(source, 'rb') as original, open(copy, 'wb') as target:
+        target.write(original.read())
+    loads = []
+
+    def load(path):
+        loads.append(path)
+        return load_events(path)
+
+    built = load_event_cube(copy, load)
+    reloaded = load_event_cube(copy, load)
+    assert loads == [copy]
+    assert os.path.exists(cube_path_for(copy))
+    pd.testing.assert_frame_equal(reloaded.counts, built.counts, check_categorical=False)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
@@ -0,0 +1,32 @@
+import pandas as pd
+
+from dwell import page_view_dwell, page_view_durations
+
+
+def test_dwell_lasts_until_the_next_event_of_the_session():
+    data = pd.DataFrame({
+        'user': ['u1', 'u1', 'u1', 'u2', 'u2'],
+        'session': pd.Categorical(['s1', 's1', 's1', 's2', 's2']),
+        'page_type': ['listing_page', 'product_page', 'order_page', 'listing_page', 'product_page'],
+        'event_date': pd.to_datetime(['2023-10-01 10:05', '2023-10-01 10:00', '2023-10-01 10:30',
+                                      '2023-10-01 11:00', '2023-10-01 11:02']),
+    })
+    assert page_view_dwell(data).tolist() == [pd.Timedelta(minutes=25), pd.Timedelta(minutes=5), pd.Timedelta(0),
+                                              pd.Timedelta(minutes=2), pd.Timedelta(0)]
+
+
+def test_events_without_a_session_or_a_time_have_no_dwell():
+    data = pd.DataFrame({
+        'user': ['u1', 'u1', 'u1', 'u1', 'u1'],
+        'session': pd.Categorical(['s1', 's1', 's1', None, None]),
+        'page_type': ['listing_page', 'product_page', 'order_page', 'listing_page', 'product_page'],
+        'event_date': pd.to_datetime(['2023-10-01 10:00', None, '2023-10-01 10:30', '2023-10-01 10:10',
+                                      '2023-10-01 10:20']),
+    })
+    dwell = page_view_dwell(data)
+    assert dwell.tolist()[0] == pd.Timedelta(minutes=30)
+    assert dwell.tolist()[2] == pd.Timedelta(0)
+    assert dwell.iloc[[1, 3, 4]].isna().all()
+
+    durations = page_view_durations(data)
+    assert durations.max() == pd.Timedelta(minutes=30)
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from filters import USER_SEGMENTS, EventIndex, filter_fingerprint, user_segments
+from loader import load_events
+from metrics import compute_exit_rates
+from synthetic import generate_events
+
+
+@pytest.fixture(scope='module')
+def events(tmp_path_factory):
+    source = str(tmp_path_factory.mktemp('filters') / 'events.parquet')
+    generate_events(source, 5_000, seed=9)
+    # Shuffled, so the index has to sort the events by time
+    data = load_events(source)
+    return data.sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+@pytest.fixture(scope='module')
+def index(events):
+    return EventIndex.build(events)
+
+
+def segments_by_mask(data):
+    # Reference: each user's segment from a groupby over their distinct sessions
+    sessions_per_user = data.groupby('user', observed=True)['session'].nunique()
+    segments = pd.Series(index=sessions_per_user.index, dtype=object)
+    for segment, (low, high) in USER_SEGMENTS.items():
+        segments[(sessions_per_user >= low) & (sessions_per_user <= high)] = segment
+    return data['user'].map(segments).astype(object)
+
+
+def test_user_segments_equal_the_groupby(events):
+    assert (np.asarray(user_segments(events), dtype=object) == segments_by_mask(events).to_numpy()).all()
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'start': '2023-10-05'},
+    {'start': '2023-10-05 12:00', 'end': '2023-10-12'},
+    {'page_type': ('product_page', 'order_page')},
+    {'event_type': ('order',), 'segment': ('loyal', 'returning')},
+    {'start': '2023-10-03', 'end': '2023-10-25', 'page_type': ('listing_page',), 'event_type': ('page_view',),
+     'segment': ('one-time',)},
+    {'page_type': ('no_such_page',)},
+])
+def test_filter_equals_boolean_masks(events, index, filters):
+    mask = pd.Series(True, index=events.index)
+    if 'start' in filters:
+        mask &= events['event_date'] >= pd.Timestamp(filters['start'])
+    if 'end' in filters:
+        mask &= events['event_date'] < pd.Timestamp(filters['end'])
+    for column in ('page_type', 'event_type'):
+        if column in filters:
+            mask &= events[column].isin(filters[column])
+    if 'segment' in filters:
+        mask &= segments_by_mask(events).isin(filters['segment'])
+    expected = events[mask].sort_values('event_date', kind='stable').reset_index(drop=True)
+
+    filtered = index.filter(**filters).reset_index(drop=True)
+    pd.testing.assert_frame_equal(filtered, expected)
+
+
+def test_unknown_column_is_rejected(index):
+    with pytest.raises(ValueError):
+        index.filter(product=('p1',))
+
+
+def test_fingerprint_identifies_the_filter():
+    assert filter_fingerprint('f') == 'f'
+    assert filter_fingerprint('f', page_type=()) == 'f'
+    assert filter_fingerprint('f', page_type=('a', 'b')) == filter_fingerprint('f', page_type=('b', 'a'))
+    assert filter_fingerprint('f', page_type=('a',)) != filter_fingerprint('f', event_type=('a',))
+
+
+def test_exit_rates_of_a_page_filter_skip_the_filtered_out_pages(index):
+    rates = compute_exit_rates(index.filter(page_type=('product_page', 'order_page')))
+    assert sorted(rates['Page Type']) == ['order_page', 'product_page']
+    assert rates['Exit Rate (%)'].notna().all()
@@ -0,0 +1,19 @@
+import pytest
+
+from loader import load_events
+from metrics import compute_ordered_funnel
+from synthetic import generate_events
+
+
+@pytest.mark.parametrize('level', ['user', 'session'])
+def test_ordered_funnel_of_a_full_sample_is_exact(tmp_path, level):
+    source = str(tmp_path / 'events.parquet')
+    generate_events(source, 5_000, seed=2)
+    data = load_events(source)
+
+    exact = compute_ordered_funnel(data, level)
+    estimated = compute_ordered_funnel(data, level, sample_rate=1.0)
+
+    assert estimated[exact.columns].equals(exact)
+    assert (estimated['Error Bound (±)'] == 0).all()
+    assert (estimated['Conversion Rate Error (±)'] == 0).all()
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from live import KeySet, LiveIngest
+
+
+def event(user, session, page_type, event_date):
+    return json.dumps({'user': user, 'session': session, 'page_type': page_type, 'event_type': 'view',
+                       'product': None, 'event_date': event_date}) + '\n'
+
+
+def test_malformed_line_keeps_the_valid_events_of_its_read(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    path.write_text(event('u1', 's1', 'home', '2023-10-01 10:00:00')
+                    + '{"user": "u2", "session": \n'
+                    + event('u1', 's1', 'product', '2023-10-01 10:01:00')
+                    + event('u3', 's3', 'home', 'not a date'))
+    ingest = LiveIngest(str(path))
+
+    assert ingest.poll() == 2
+    assert ingest.aggregates.rows == 2
+    assert ingest.rejected_lines == 2
+    assert ingest.error is not None
+    assert ingest.aggregates.session_summary().loc['s1', 'event_count'] == 2
+
+    # Lines appended after the bad ones are read as usual
+    with open(path, 'a') as target:
+        target.write(event('u2', 's2', 'cart', '2023-10-01 10:02:00'))
+    assert ingest.poll() == 1
+    assert ingest.aggregates.rows == 3
+    assert ingest.rejected_lines == 2
+
+
+def test_key_set_returns_first_occurrences_of_new_keys():
+    keys = KeySet()
+    assert sorted(keys.add(np.array([5, 3, 5, 7]))) == [0, 1, 3]
+    assert list(keys.add(np.array([7, 8, 3, 8]))) == [1]
+    assert list(keys.add(np.array([], dtype=np.int64))) == []
+
+
+def test_batch_with_too_many_page_types_changes_nothing(monkeypatch):
+    import live
+    monkeypatch.setattr(live, 'MAX_PAGE_TYPES', 2)
+    aggregates = live.LiveAggregates()
+    aggregates.update(live.parse_events((event('u1', 's1', 'home', '2023-10-01 10:00:00')
+                                         + event('u1', 's1', 'cart', '2023-10-01 10:01:00')).encode()))
+    before = (aggregates.rows, aggregates.version, len(aggregates.page_types), aggregates.funnel.rows)
+
+    with pytest.raises(ValueError):
+        aggregates.update(live.parse_events(event('u2', 's2', 'product', '2023-10-01 10:02:00').encode()))
+    assert (aggregates.rows, aggregates.version, len(aggregates.page_types), aggregates.funnel.rows) == before
+
+    # Later batches of known page types still go in
+    aggregates.update(live.parse_events(event('u2', 's2', 'home', '2023-10-01 10:03:00').encode()))
+    assert aggregates.rows == 3
+
+
+def test_events_without_a_date_are_counted_apart():
+    import live
+    aggregates = live.LiveAggregates()
+    aggregates.update(live.parse_events((event('u1', 's1', 'home', '2023-10-01 10:00:00')
+                                         + event('u1', 's1', 'cart', None)).encode()))
+    assert aggregates.rows == 2
+    assert aggregates.undated_rows == 1
+    assert aggregates.daily_interactions().index.tolist() == [pd.Timestamp('2023-10-01')]
+    assert aggregates.session_summary().loc['s1', 'event_count'] == 1
@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from parallel import compute_session_metrics
+from synthetic import generate_events
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    return generate_events(str(tmp_path_factory.mktemp('parallel') / 'events.parquet'), 5_000, seed=8)
+
+
+def assert_same_metrics(result, expected):
+    assert result.keys() == expected.keys()
+    for name, value in expected.items():
+        if isinstance(value, pd.DataFrame):
+            pd.testing.assert_frame_equal(result[name], value, check_categorical=False, obj=name)
+        elif isinstance(value, pd.Series):
+            pd.testing.assert_series_equal(result[name], value, check_categorical=False, obj=name)
+        else:
+            assert result[name] == value, name
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_partitioned_file_equals_one_worker(source, workers):
+    assert_same_metrics(compute_session_metrics(source, workers=workers), compute_session_metrics(source, workers=1))
+
+
+def test_partitioned_frame_equals_one_worker(source):
+    from loader import load_events
+    data = load_events(source)
+    expected = compute_session_metrics(data, workers=1)
+    assert_same_metrics(compute_session_metrics(data, workers=2), expected)
+    assert expected['loyal_users'].index.dtype == object
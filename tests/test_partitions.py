@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import metrics
+from loader import load_events
+from partitions import DailyPartitionStore
+from synthetic import generate_events
+
+
+@pytest.fixture(scope='module')
+def events(tmp_path_factory):
+    source = str(tmp_path_factory.mktemp('partitions') / 'events.parquet')
+    generate_events(source, 5_000, seed=6)
+    data = load_events(source)
+
+    # Continue two sessions after midnight: a one-event visit that stops being a bounce and a visit whose exit
+    # page moves to the next day
+    crossing = []
+    for session, page_type in zip(data['session'].unique()[:2], ['order_page', 'listing_page']):
+        last = data[data['session'] == session].iloc[[-1]].copy()
+        last['event_date'] = last['event_date'].dt.normalize() + pd.Timedelta(days=1, minutes=5)
+        last['page_type'] = page_type
+        crossing.append(last)
+    data = pd.concat([data, *crossing], ignore_index=True)
+    data['page_type'] = data['page_type'].astype('category')
+    return data.sort_values('event_date', kind='stable', ignore_index=True)
+
+
+def loaded_store(root, data, batches):
+    # Append the days in several batches, as new files arrive
+    store = DailyPartitionStore(str(root))
+    days = data['event_date'].dt.normalize()
+    for batch_days in np.array_split(days.unique(), batches):
+        store.append_events(data[days.isin(batch_days)])
+    return store
+
+
+def assert_same(stored, recomputed):
+    # The store keeps page types as strings; the in-memory results keep the categorical
+    pd.testing.assert_frame_equal(stored, recomputed, check_dtype=False, check_categorical=False,
+                                  check_index_type=False, check_column_type=False)
+
+
+@pytest.mark.parametrize('batches', [1, 3])
+def test_store_equals_a_full_recompute(tmp_path, events, batches):
+    sessions = events.groupby('session', observed=True)['event_date'].agg(['min', 'max'])
+    assert (sessions['min'].dt.normalize() < sessions['max'].dt.normalize()).sum() == 2
+
+    store = loaded_store(tmp_path, events, batches)
+    pd.testing.assert_series_equal(store.daily_interactions(), metrics.compute_daily_interactions(events),
+                                   check_names=False)
+    assert_same(store.exit_rate_over_time(), metrics.compute_exit_rate_over_time(events))
+    assert_same(store.daily_bounce_rates().astype({'page_type': str}),
+                metrics.compute_daily_bounce_rates(events).astype({'page_type': str}))
+    assert_same(store.avg_time_by_average_user().astype({'page_type': str}),
+                metrics.compute_avg_time_by_average_user(events).astype({'page_type': str}))
+
+
+def test_store_reopens_from_disk(tmp_path, events):
+    loaded_store(tmp_path, events, 2)
+    reopened = DailyPartitionStore(str(tmp_path))
+    assert reopened.days == sorted(events['event_date'].dt.normalize().unique())
+    assert_same(reopened.exit_rate_over_time(), metrics.compute_exit_rate_over_time(events))
+
+
+def test_days_must_be_appended_in_order(tmp_path, events):
+    store = loaded_store(tmp_path, events, 1)
+    last_day = events[events['event_date'].dt.normalize() == store.days[-1]]
+    with pytest.raises(ValueError):
+        store.append_day(last_day)
+    with pytest.raises(ValueError):
+        store.append_day(events)
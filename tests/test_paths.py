@@ -0,0 +1,45 @@
+import pytest
+
+from loader import load_events
+from paths import PATH_SEPARATOR, encode_session_paths
+from synthetic import generate_events
+
+
+@pytest.fixture(scope='module')
+def events(tmp_path_factory):
+    source = str(tmp_path_factory.mktemp('paths') / 'events.parquet')
+    generate_events(source, 5_000, seed=5)
+    return load_events(source)
+
+
+def joined_paths(data):
+    # Baseline: join the page types of every session as strings, in event time order
+    ordered = data.sort_values(['session', 'event_date'], kind='stable')
+    sequences = ordered.groupby('session', observed=True)['page_type'].agg(
+        lambda pages: PATH_SEPARATOR.join(pages.astype(str)))
+    return sequences.value_counts()
+
+
+def test_path_counts_equal_the_string_join(events):
+    expected = joined_paths(events)
+    counts = encode_session_paths(events).path_counts()
+    assert counts.sum() == expected.sum()
+    assert counts.sort_index().to_dict() == expected.sort_index().to_dict()
+
+
+@pytest.mark.parametrize('k', [1, 10, 50])
+def test_top_paths_equal_the_string_join(events, k):
+    expected = joined_paths(events)
+    top = encode_session_paths(events).top_paths(k)
+    # Ties may be ordered differently; the counts and the count of every listed path must agree
+    assert top['count'].tolist() == expected.head(k).tolist()
+    assert (top['count'].to_numpy() == expected[top['page_sequence']].to_numpy()).all()
+    assert (top['length'] == top['page_sequence'].str.count(PATH_SEPARATOR) + 1).all()
+
+
+def test_filtered_paths_keep_only_matching_sessions(events):
+    orders = events['event_type'] == 'order'
+    purchase_sessions = events.loc[orders, 'session'].unique()
+    expected = joined_paths(events[events['session'].isin(purchase_sessions)])
+    counts = encode_session_paths(events, session_filter=orders.to_numpy()).path_counts()
+    assert counts.sort_index().to_dict() == expected.sort_index().to_dict()
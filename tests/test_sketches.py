@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sketches import HyperLogLog, approx_nunique_by, grouped_sketches, merge_sketches
+
+
+def ids(start, stop):
+    return pd.Series([f'user-{number}' for number in range(start, stop)])
+
+
+@pytest.mark.parametrize('distinct', [50, 5_000, 200_000])
+def test_estimate_is_within_its_error_bound(distinct):
+    # Repeats change nothing: only distinct values count
+    sketch = HyperLogLog().add(pd.concat([ids(0, distinct), ids(0, distinct // 2)]))
+    assert abs(sketch.estimate() - distinct) <= sketch.error_bound()
+
+
+def test_merge_equals_the_sketch_of_the_union():
+    first = HyperLogLog(12).add(ids(0, 30_000))
+    second = HyperLogLog(12).add(ids(20_000, 50_000))
+    union = HyperLogLog(12).add(ids(0, 50_000))
+
+    merged = first | second
+    assert np.array_equal(merged.registers, union.registers)
+    assert merged.estimate() == union.estimate()
+    assert np.array_equal(merge_sketches([first, second]).registers, union.registers)
+
+
+def test_merge_needs_the_same_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(10) | HyperLogLog(12)
+
+
+def test_bytes_round_trip():
+    sketch = HyperLogLog(10).add(ids(0, 1_000))
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+    assert restored.precision == 10
+    assert np.array_equal(restored.registers, sketch.registers)
+
+
+def test_grouped_sketches_match_one_sketch_per_group():
+    keys = pd.Series(['a', 'b', 'a', None, 'b', 'a'] * 500)
+    values = pd.Series([f'user-{number % 700}' for number in range(len(keys))])
+    sketches = grouped_sketches(keys, values, precision=10)
+    for group in ('a', 'b'):
+        expected = HyperLogLog(10).add(values[keys == group])
+        assert np.array_equal(sketches[group].registers, expected.registers)
+
+    counts = approx_nunique_by(keys, values, precision=10, name='users')
+    exact = values.groupby(keys).nunique()
+    assert ((counts['users'] - exact).abs() <= counts['users_error']).all()
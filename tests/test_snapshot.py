@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filters import load_event_index
+from sessions import build_session_summary
+from snapshot import load_shared_dataset, open_snapshot, snapshot_root, write_snapshot
+from synthetic import generate_events
+
+
+@pytest.fixture
+def source(tmp_path):
+    return generate_events(str(tmp_path / 'events.parquet'), 5_000, seed=11)
+
+
+def assert_same_dataset(dataset, index, sessions):
+    pd.testing.assert_frame_equal(dataset.index.data, index.data)
+    pd.testing.assert_frame_equal(dataset.sessions, sessions)
+    assert dataset.index.indexes.keys() == index.indexes.keys()
+    for column, position_index in index.indexes.items():
+        mapped = dataset.index.indexes[column]
+        assert mapped.values == [str(value) for value in position_index.values]
+        assert np.array_equal(mapped.positions, position_index.positions)
+        assert np.array_equal(mapped.offsets, position_index.offsets)
+
+
+def test_snapshot_round_trip(tmp_path, source):
+    index = load_event_index(source)
+    sessions = build_session_summary(index.data)
+    write_snapshot(str(tmp_path / 'snapshot'), index, sessions)
+
+    dataset = open_snapshot(str(tmp_path / 'snapshot'))
+    assert_same_dataset(dataset, index, sessions)
+    filters = {'start': '2023-10-04', 'page_type': ('product_page',), 'segment': ('loyal',)}
+    pd.testing.assert_frame_equal(dataset.index.filter(**filters), index.filter(**filters))
+
+
+def test_csv_source_round_trip(tmp_path, source):
+    # A CSV keeps its strings in Arrow arrays, which map back as such
+    csv_path = str(tmp_path / 'events.csv')
+    pd.read_parquet(source).to_csv(csv_path, index=False)
+    index = load_event_index(csv_path)
+    dataset = load_shared_dataset(csv_path)
+    assert dataset.path is not None
+    assert_same_dataset(dataset, index, build_session_summary(index.data))
+
+
+def test_changed_source_replaces_the_snapshot(source):
+    first = load_shared_dataset(source)
+    assert load_shared_dataset(source).path == first.path
+
+    generate_events(source, 4_000, seed=12)
+    second = load_shared_dataset(source)
+    assert second.path != first.path
+    assert len(second.index.data) == 4_000
+    # The older version is removed; the lock file stays
+    versions = [name for name in os.listdir(snapshot_root(source)) if not name.startswith('.')]
+    assert versions == [os.path.basename(second.path)]
@@ -0,0 +1,53 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from sqlstore import SQL_METRICS, SQLiteEventStore, check_parity, load_sqlite
+from synthetic import generate_events
+
+
+@pytest.fixture(scope='module')
+def event_log(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('sqlstore')
+    source = str(directory / 'events.parquet')
+    generate_events(source, 5_000, seed=1)
+    store = SQLiteEventStore(load_sqlite(source, str(directory / 'events.db')))
+    return source, store
+
+
+@pytest.fixture(scope='module')
+def event_log_with_nulls(tmp_path_factory):
+    # The same kind of log with missing dates and sessions scattered through it
+    directory = tmp_path_factory.mktemp('sqlstore_nulls')
+    complete = str(directory / 'complete.parquet')
+    generate_events(complete, 5_000, seed=4)
+    table = pq.read_table(complete)
+    rng = np.random.default_rng(0)
+    for column in ('event_date', 'session'):
+        position = table.schema.get_field_index(column)
+        missing = rng.random(len(table)) < 0.03
+        values = table.column(column).combine_chunks()
+        table = table.set_column(position, column, pa.array(values.to_pylist(), type=values.type, mask=missing))
+    source = str(directory / 'events.parquet')
+    pq.write_table(table, source)
+    store = SQLiteEventStore(load_sqlite(source, str(directory / 'events.db')))
+    return source, store
+
+
+@pytest.mark.parametrize('name', SQL_METRICS)
+def test_sql_metric_matches_pandas(event_log, name):
+    assert check_parity(*event_log, names=[name]) == []
+
+
+@pytest.mark.parametrize('name', SQL_METRICS)
+def test_sql_metric_matches_pandas_with_missing_dates_and_sessions(event_log_with_nulls, name):
+    assert check_parity(*event_log_with_nulls, names=[name]) == []
+
+
+def test_missing_dates_stay_null_and_keep_the_others_exact(event_log_with_nulls):
+    source, store = event_log_with_nulls
+    expected = pq.read_table(source, columns=['event_date']).column('event_date').cast(pa.int64()).to_pylist()
+    stored = store._query('SELECT event_ts, event_day FROM events ORDER BY rowid')
+    assert [None if np.isnan(value) else int(value) for value in stored['event_ts']] == expected
+    assert stored['event_day'].isna().sum() == expected.count(None)
@@ -0,0 +1,25 @@
+import pandas as pd
+
+from loader import load_events
+from metrics import calculate_funnel_user_counts, display_visits
+from streaming import UserBitmap, stream_funnel_user_counts, stream_visits
+from synthetic import generate_events
+
+
+def test_streamed_funnel_matches_in_memory_funnel(tmp_path):
+    source = str(tmp_path / 'events.parquet')
+    generate_events(source, 5_000, seed=3)
+    data = load_events(source)
+
+    # Batches much smaller than the log, so users span several of them
+    pd.testing.assert_frame_equal(stream_funnel_user_counts(source, batch_rows=700),
+                                  calculate_funnel_user_counts(data))
+    pd.testing.assert_frame_equal(stream_visits(source, batch_rows=700), display_visits(data))
+
+
+def test_user_bitmap_counts_distinct_ids_and_unions():
+    first, second = UserBitmap(), UserBitmap()
+    first.add(pd.Series([0, 5, 5, 64, -1]).to_numpy())
+    second.add(pd.Series([5, 200]).to_numpy())
+    assert len(first) == 3
+    assert len(first.union(second)) == 4
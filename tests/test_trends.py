@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from trends import t_quantile
+
+# Two-sided 95% and 99% critical values of Student's t from published tables
+T_TABLE = [(0.975, 1, 12.7062), (0.975, 2, 4.3027), (0.975, 3, 3.1824), (0.975, 4, 2.7764), (0.975, 5, 2.5706),
+           (0.975, 6, 2.4469), (0.975, 10, 2.2281), (0.975, 30, 2.0423), (0.995, 3, 5.8409), (0.995, 5, 4.0321),
+           (0.995, 6, 3.7074), (0.995, 20, 2.8453)]
+
+
+@pytest.mark.parametrize('probability, dof, expected', T_TABLE)
+def test_t_quantile_matches_tables(probability, dof, expected):
+    assert float(t_quantile(probability, dof)) == pytest.approx(expected, abs=0.0015)
+
+
+def test_t_quantile_is_nan_without_degrees_of_freedom():
+    assert np.isnan(t_quantile(0.975, np.array([0, 3]))).tolist() == [True, False]
@@ -0,0 +1,54 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads computing dashboard results ahead of the runs that show them; 0 turns the warm-up off
+WARMUP_WORKERS = int(os.environ.get('AUTODOC_WARMUP_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Finished jobs remembered so reruns do not submit them again; their results live in the compute cache
+MAX_JOBS = 256
+
+THREAD_PREFIX = 'warmup'
+
+
+def in_background():
+    # Whether the caller runs on a warm-up thread rather than in a script run
+    return threading.current_thread().name.startswith(THREAD_PREFIX)
+
+
+class WarmUp:
+    # Background jobs keyed by the view they compute for and a name. Submitting a key again returns the first job,
+    # running or finished, so reruns and other sessions never start a duplicate; a failed or cancelled job is
+    # submitted again.
+    # Jobs compute through the compute cache and return nothing: a run that needs a result waits for the job
+    # computing it, or computes it itself if the job has not started, and the job then finds it cached.
+    # Threads rather than processes, so results land in the process-wide cache and the events are not copied;
+    # NumPy, pandas and Arrow release the GIL for most of the work
+
+    def __init__(self, workers=WARMUP_WORKERS):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix=THREAD_PREFIX) if workers else None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, func, *args, **kwargs):
+        # Future of the job computing func(*args, **kwargs), None when the warm-up is off
+        if self._executor is None:
+            return None
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job.cancelled() or (job.done() and job.exception() is not None):
+                job = self._jobs[key] = self._executor.submit(_run, func, *args, **kwargs)
+            self._jobs.move_to_end(key)
+            while len(self._jobs) > MAX_JOBS and next(iter(self._jobs.values())).done():
+                self._jobs.popitem(last=False)
+        return job
+
+
+def _run(func, *args, **kwargs):
+    func(*args, **kwargs)
+
+
+# Process-wide, like the compute cache: every session submits to the same threads
+warm_up = WarmUp()